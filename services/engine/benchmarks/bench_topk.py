@@ -0,0 +1,80 @@
+"""Recall vs latency of approximate and exact LinUCB top-k
+
+Run from services/engine:
+
+    python -m benchmarks.bench_topk --arms 10000 100000 500000
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+from services.bandit import LinUCB
+from services.feature_store import FeatureStore
+
+def make_bandit(n_arms: int, store: FeatureStore, rng: np.random.Generator) -> LinUCB:
+    """Build a bandit with synthetic trained arms, bypassing Redis"""
+    bandit = LinUCB(None, subscribe=False, feature_store=store)
+    bandit._loaded = True
+    bandit._reset_arms(n_arms)
+    d = bandit.d
+
+    # Arms seen a Poisson number of times along their own feature direction
+    X = store.get([f"track:{i}" for i in range(n_arms)]).astype(float)
+    counts = rng.poisson(5, n_arms)[:, None, None]
+    A = np.eye(d) + counts * np.einsum("ni,nj->nij", X, X)
+    bandit.A[:n_arms] = A
+    bandit.A_inv[:n_arms] = np.linalg.inv(A)
+    bandit.b[:n_arms] = counts[:, :, 0] * rng.random((n_arms, 1)) * X
+    bandit.arms = [f"track:{i}" for i in range(n_arms)]
+    bandit.arm_index = {uri: i for i, uri in enumerate(bandit.arms)}
+    bandit._index_dirty = set(range(n_arms))
+    return bandit
+
+def timed(fn, repeats: int):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeats * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--arms", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[128, 256, 1024])
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'arms':>8} {'mode':>14} {'ms/query':>10} {'recall@k':>9}")
+    for n_arms in args.arms:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = FeatureStore(f"{tmp}/features.f32")
+            features = rng.random((n_arms, store.d)).astype(np.float32)
+            features[:, -1] = 1.0
+            store.upsert_many(dict(zip((f"track:{i}" for i in range(n_arms)), features)))
+            bandit = make_bandit(n_arms, store, rng)
+            contexts = [{"vector": np.append(rng.random(store.d - 1), 1.0)} for _ in range(args.queries)]
+
+            bandit.mode = "exact"
+            exact = []
+            total = 0.0
+            for context in contexts:
+                top, ms = timed(lambda: bandit.get_top_k(args.k, context), 1)
+                exact.append(set(top))
+                total += ms
+            print(f"{n_arms:>8} {'exact':>14} {total / len(contexts):>10.2f} {1.0:>9.3f}")
+
+            bandit.mode = "approx"
+            for n_candidates in args.candidates:
+                bandit.n_candidates = n_candidates
+                bandit.get_top_k(args.k, contexts[0])  # build the index outside the timing
+                total, hits = 0.0, 0
+                for context, expected in zip(contexts, exact):
+                    top, ms = timed(lambda: bandit.get_top_k(args.k, context), 1)
+                    hits += len(expected & set(top))
+                    total += ms
+                recall = hits / (args.k * len(contexts))
+                print(f"{n_arms:>8} {f'approx/{n_candidates}':>14} {total / len(contexts):>10.2f} {recall:>9.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,24 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import socketio
-import databases
-import sqlalchemy
-from sqlalchemy.ext.asyncio import create_async_engine
 import redis
 from dotenv import load_dotenv
 import os
 import logging
+import asyncio
+import sys
 from typing import Dict, Any
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
 from routers import mood, checkin, feedback, player
-from models import Base
+from models import Base, Preference, CheckIn
+from services.feature_store import FeatureStore
+from services.context import ContextEncoder, DEFAULT_USER
+from services.search_index import SearchIndex
+from services import metrics
+from services.redis_pool import init_redis, close_redis, get_redis, check_redis
+from services.database import init_engine, dispose_engine, open_session
 
 # Load environment variables
 load_dotenv()
@@ -33,16 +41,41 @@ app.add_middleware(
 
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./crescendo.db")
-database = databases.Database(DATABASE_URL)
-metadata = sqlalchemy.MetaData()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5.0"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
 
 # Redis configuration
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", "50"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "2.0"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2.0"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "1.0"))
+
+# Request handlers use the shared async pool (services.redis_pool.get_redis),
+# created at startup. These synchronous clients serve code that runs on
+# worker threads: the bandit and the context encoder.
 redis_client = redis.Redis.from_url(
     REDIS_URL,
     retry_on_timeout=True,
     decode_responses=True
 )
+# Binary client for values stored as packed bytes (bandit arm parameters)
+redis_binary_client = redis.Redis.from_url(
+    REDIS_URL,
+    retry_on_timeout=True
+)
+
+# Track feature store shared by search and the bandit, genre weights shared through Redis
+FEATURE_STORE_PATH = os.getenv("FEATURE_STORE_PATH", "./track_features.f32")
+feature_store = FeatureStore(FEATURE_STORE_PATH, redis_client=redis_client)
+
+# Local index of tracks seen in search results and queue adds
+search_index = SearchIndex(int(os.getenv("SEARCH_INDEX_MAX_TRACKS", "50000")))
+
+# Per-user bandit context, refreshed on mood updates and check-ins
+context_encoder = ContextEncoder(redis_client)
 
 # Socket.IO configuration
 sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
@@ -68,17 +101,86 @@ async def global_exception_handler(request, exc):
 async def health_check() -> Dict[str, str]:
     return {"status": "ok"}
 
+@app.get("/health/redis")
+async def redis_health_check(redis_pool=Depends(get_redis)):
+    health = await check_redis(redis_pool)
+    return JSONResponse(health, status_code=200 if health["status"] == "ok" else 503)
+
+# In-process metrics (bandit queue wait and compute time, ...)
+@app.get("/metrics")
+async def get_metrics() -> Dict[str, Any]:
+    return metrics.snapshot()
+
+async def load_genre_weights():
+    """Score track genres with the default user's saved weights"""
+    try:
+        async with open_session() as db:
+            stmt = select(Preference).where(Preference.user_id == DEFAULT_USER)
+            preference = (await db.execute(stmt)).scalar_one_or_none()
+    except SQLAlchemyError as e:
+        logger.error(f"Error loading genre weights: {e}")
+        return
+    genre_weights = preference.genre_weights if preference is not None else {}
+    await asyncio.get_running_loop().run_in_executor(None, feature_store.set_genre_weights, genre_weights)
+
+async def load_stress_level():
+    """Seed the bandit context's stress from the latest check-in"""
+    try:
+        async with open_session() as db:
+            stmt = select(CheckIn.stress_level).order_by(CheckIn.timestamp.desc()).limit(1)
+            stress_level = (await db.execute(stmt)).scalar_one_or_none()
+    except SQLAlchemyError as e:
+        logger.error(f"Error loading stress level: {e}")
+        return
+    if stress_level is not None:
+        await context_encoder.seed_stress(stress_level)
+
+def loaded_router(name: str):
+    """A router module if something imported it; importing it here would start its clients"""
+    return sys.modules.get(f"routers.{name}")
+
 # Startup event
 @app.on_event("startup")
 async def startup():
-    await database.connect()
+    init_redis(
+        REDIS_URL,
+        max_connections=REDIS_POOL_SIZE,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        connect_timeout=REDIS_CONNECT_TIMEOUT,
+        pool_timeout=REDIS_POOL_TIMEOUT
+    )
+    init_engine(
+        DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE
+    )
     await checkin.init_db()
     logger.info("Database connected and initialized")
+    await load_genre_weights()
+    await load_stress_level()
+    app.state.reward_flusher = asyncio.create_task(
+        feedback.reward_buffer.run(flush=feedback.bandit_executor.flush_rewards)
+    )
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown():
-    await database.disconnect()
+    app.state.reward_flusher.cancel()
+    flushed = feedback.reward_buffer.flush()
+    logger.info(f"Flushed {flushed} buffered rewards")
+    feedback.bandit_executor.shutdown()
+    search = loaded_router("search")
+    if search is not None:
+        search.search_executor.shutdown()
+    socket_router = loaded_router("socket_router")
+    if socket_router is not None:
+        await socket_router.stop_queue_relay()
+    feedback.bandits.close()
+    context_encoder.close()
+    await close_redis()
+    await dispose_engine()
     logger.info("Database disconnected")
 
 # API router (to be implemented)
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from datetime import datetime, timedelta
 from typing import Dict, Optional
 import logging
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from models import BreathingSession
+from ..services.database import get_session
 
 logger = logging.getLogger(__name__)
 
@@ -14,12 +15,29 @@ router = APIRouter(prefix="/api/breathing", tags=["breathing"])
 PHASES = ["inhale", "hold", "exhale", "rest"]
 DURATIONS = [4, 7, 8, 4]  # seconds per phase
 
-def get_active_session(db: Session) -> Optional[BreathingSession]:
+async def get_active_session(db: AsyncSession) -> Optional[BreathingSession]:
     """Get the latest active breathing session"""
     stmt = select(BreathingSession).where(
         BreathingSession.end.is_(None)
     ).order_by(BreathingSession.start.desc())
-    return db.execute(stmt).scalar_one_or_none()
+    return (await db.execute(stmt)).scalar_one_or_none()
+
+class BreathingSessionActive(Exception):
+    """Raised when starting a session while another is still active"""
+
+async def begin_session(db: AsyncSession) -> Dict:
+    """Start a new breathing session, returns the phase plan"""
+    if await get_active_session(db):
+        raise BreathingSessionActive("An active breathing session already exists")
+
+    session = BreathingSession(start=datetime.now())
+    db.add(session)
+    await db.commit()
+
+    return {
+        "phases": PHASES,
+        "durations": DURATIONS
+    }
 
 def get_current_phase(elapsed_seconds: int) -> Dict:
     """Determine current phase based on elapsed time"""
@@ -41,35 +59,21 @@ def get_current_phase(elapsed_seconds: int) -> Dict:
     }
 
 @router.post("/start")
-async def start_breathing_session(db: Session) -> Dict:
+async def start_breathing_session(db: AsyncSession = Depends(get_session)) -> Dict:
     """Start a new breathing session"""
     try:
-        # Check for existing active session
-        active_session = get_active_session(db)
-        if active_session:
-            raise HTTPException(
-                status_code=400,
-                detail="An active breathing session already exists"
-            )
-        
-        # Create new session
-        session = BreathingSession(start=datetime.now())
-        db.add(session)
-        db.commit()
-        
-        return {
-            "phases": PHASES,
-            "durations": DURATIONS
-        }
+        return await begin_session(db)
+    except BreathingSessionActive as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error starting breathing session: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.get("/state")
-async def get_breathing_state(db: Session) -> Dict:
+async def get_breathing_state(db: AsyncSession = Depends(get_session)) -> Dict:
     """Get current state of active breathing session"""
     try:
-        session = get_active_session(db)
+        session = await get_active_session(db)
         if not session:
             raise HTTPException(
                 status_code=400,
@@ -85,10 +89,10 @@ async def get_breathing_state(db: Session) -> Dict:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.post("/stop")
-async def stop_breathing_session(db: Session) -> Dict:
+async def stop_breathing_session(db: AsyncSession = Depends(get_session)) -> Dict:
     """Stop the active breathing session"""
     try:
-        session = get_active_session(db)
+        session = await get_active_session(db)
         if not session:
             raise HTTPException(
                 status_code=400,
@@ -98,7 +102,7 @@ async def stop_breathing_session(db: Session) -> Dict:
         # Update session end time
         session.end = datetime.now()
         duration = (session.end - session.start).total_seconds()
-        db.commit()
+        await db.commit()
         
         # Calculate completed phases
         total_cycle = sum(DURATIONS)
@@ -1,15 +1,16 @@
-from fastapi import APIRouter, HTTPException, Query, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Query, BackgroundTasks, Depends
 from pydantic import BaseModel, Field
 from sqlalchemy import select, func
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict
-from ..models import CheckIn
-from ..main import database, metadata
+from ..models import Base, CheckIn
+from ..main import context_encoder
+from ..services.database import get_session, open_session, create_tables
 from ..routers.mood import MOODS
+from ..routers.breathing import begin_session, BreathingSessionActive
 import logging
-import httpx
-from sqlalchemy.orm import Session
 
 logger = logging.getLogger(__name__)
 
@@ -30,9 +31,10 @@ class CheckInResponse(BaseModel):
 async def start_breathing_session():
     """Start a breathing session in the background"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post("http://localhost:8000/api/breathing/start")
-            response.raise_for_status()
+        async with open_session() as db:
+            await begin_session(db)
+    except BreathingSessionActive:
+        logger.info("Breathing session already active, not starting another")
     except Exception as e:
         logger.error(f"Failed to start breathing session: {e}")
 
@@ -40,7 +42,7 @@ async def start_breathing_session():
 async def create_checkin(
     checkin: Dict,
     background_tasks: BackgroundTasks,
-    db: Session
+    db: AsyncSession = Depends(get_session)
 ) -> Dict:
     """Create a new check-in"""
     try:
@@ -52,7 +54,8 @@ async def create_checkin(
             note=checkin.get("note")
         )
         db.add(db_checkin)
-        db.commit()
+        await db.commit()
+        await context_encoder.on_checkin(checkin["stressLevel"])
         
         # If stress level is high, start breathing session
         if checkin["stressLevel"] >= 4:
@@ -65,19 +68,22 @@ async def create_checkin(
             "stressLevel": db_checkin.stress_level,
             "note": db_checkin.note
         }
+    except SQLAlchemyError as e:
+        logger.error(f"Database error creating check-in: {e}")
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
     except Exception as e:
         logger.error(f"Error creating check-in: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.get("/today", response_model=Optional[CheckInResponse])
-async def get_today_checkin():
+async def get_today_checkin(db: AsyncSession = Depends(get_session)):
     try:
         today = datetime.utcnow().date()
         query = select(CheckIn).where(
             func.date(CheckIn.timestamp) == today
         ).order_by(CheckIn.timestamp.desc())
         
-        result = await database.fetch_one(query)
+        result = (await db.execute(query)).scalars().first()
         if not result:
             return None
             
@@ -92,14 +98,14 @@ async def get_today_checkin():
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
 
 @router.get("/history", response_model=List[CheckInResponse])
-async def get_checkin_history(days: int = Query(ge=1, le=30, default=7)):
+async def get_checkin_history(days: int = Query(ge=1, le=30, default=7), db: AsyncSession = Depends(get_session)):
     try:
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         query = select(CheckIn).where(
             CheckIn.timestamp >= cutoff_date
         ).order_by(CheckIn.timestamp.desc())
         
-        results = await database.fetch_all(query)
+        results = (await db.execute(query)).scalars().all()
         return [
             CheckInResponse(
                 id=result.id,
@@ -116,8 +122,6 @@ async def get_checkin_history(days: int = Query(ge=1, le=30, default=7)):
 # Initialize database tables
 async def init_db():
     try:
-        engine = database._engine
-        async with engine.begin() as conn:
-            await conn.run_sync(metadata.create_all)
+        await create_tables(Base.metadata)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=503, detail="Failed to initialize database") 
\ No newline at end of file
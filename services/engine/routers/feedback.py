@@ -1,64 +1,136 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Depends
 from pydantic import BaseModel, Field
-from typing import Literal, Dict
+from typing import Literal, Dict, List
 import redis
-from ..main import redis_client
-from ..services.bandit import LinUCB
+import redis.asyncio as aioredis
+import os
+from ..main import redis_binary_client, feature_store, context_encoder
+from ..services.bandit_pool import BanditPool
+from ..services.bandit_executor import BanditExecutor, BanditOverloaded
+from ..services.context import DEFAULT_USER
+from ..services.reward_buffer import RewardBuffer
+from ..services.redis_pool import get_redis
 
 router = APIRouter(prefix="/api/feedback", tags=["feedback"])
 
-# Initialize bandit service
-bandit = LinUCB(redis_client)
+# Initialize per-user bandit models
+bandits = BanditPool(
+    redis_binary_client,
+    max_models=int(os.getenv("BANDIT_MAX_MODELS", "256")),
+    hybrid=os.getenv("BANDIT_HYBRID", "true").lower() == "true",
+    personal_weight=float(os.getenv("BANDIT_PERSONAL_WEIGHT", "0.5")),
+    feature_store=feature_store,
+    context_encoder=context_encoder,
+    mode=os.getenv("BANDIT_SCORING_MODE", "exact"),
+    n_candidates=int(os.getenv("BANDIT_CANDIDATES", "256"))
+)
+
+# Write-behind buffer for batched rewards
+reward_buffer = RewardBuffer(
+    bandits,
+    max_pending=int(os.getenv("REWARD_BUFFER_MAX_PENDING", "1000")),
+    max_delay=float(os.getenv("REWARD_BUFFER_MAX_DELAY", "5.0"))
+)
+
+# Bounded worker pool that keeps bandit math off the event loop
+bandit_executor = BanditExecutor(
+    bandits,
+    reward_buffer,
+    max_workers=int(os.getenv("BANDIT_WORKERS", "4")),
+    max_queue=int(os.getenv("BANDIT_MAX_QUEUE", "64"))
+)
 
 class FeedbackRequest(BaseModel):
     trackUri: str
     action: Literal["like", "dislike", "never"]
+    userId: str = DEFAULT_USER
 
-class RewardRequest(BaseModel):
+class RewardItem(BaseModel):
     trackUri: str
     reward: float = Field(ge=0.0, le=1.0)
 
+class RewardRequest(RewardItem):
+    userId: str = DEFAULT_USER
+
+class RewardBatchRequest(BaseModel):
+    rewards: List[RewardItem]
+    userId: str = DEFAULT_USER
+
 class FeedbackStats(BaseModel):
     likes: int
     dislikes: int
     never: int
 
-@router.post("")
-async def add_feedback(feedback: FeedbackRequest):
-    try:
-        # Push feedback to Redis list
-        key = f"feedback:{feedback.trackUri}"
-        with redis_client.pipeline() as pipe:
-            pipe.rpush(key, feedback.action)
-            pipe.incr(f"{key}:{feedback.action}")
-            pipe.execute()
+async def record_feedback(redis_client: aioredis.Redis, feedback: FeedbackRequest):
+    """Store feedback and add the track to the user's choice set
+
+    Shared by the endpoint and the Socket.IO feedback event.
+    """
+    # Push feedback to Redis list
+    key = f"feedback:{feedback.trackUri}"
+    async with redis_client.pipeline() as pipe:
+        pipe.rpush(key, feedback.action)
+        pipe.incr(f"{key}:{feedback.action}")
+        await pipe.execute()
 
-        # Add track to bandit's choice set
-        bandit.add_choice(feedback.trackUri)
+    # Add track to the user's choice set
+    await bandit_executor.add_choice(feedback.userId, feedback.trackUri)
 
+@router.post("")
+async def add_feedback(feedback: FeedbackRequest, redis_client: aioredis.Redis = Depends(get_redis)):
+    try:
+        await record_feedback(redis_client, feedback)
         return {"success": True}
+    except BanditOverloaded:
+        raise HTTPException(status_code=503, detail="Bandit busy, retry shortly", headers={"Retry-After": "1"})
     except redis.RedisError as e:
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
 
 @router.post("/reward")
 async def add_reward(reward: RewardRequest):
     try:
-        bandit.update(reward.trackUri, reward.reward)
+        await bandit_executor.update(reward.userId, reward.trackUri, reward.reward)
         return {"success": True}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except BanditOverloaded:
+        raise HTTPException(status_code=503, detail="Bandit busy, retry shortly", headers={"Retry-After": "1"})
+    except redis.RedisError as e:
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+
+@router.post("/rewards:batch")
+async def add_rewards_batch(batch: RewardBatchRequest):
+    try:
+        rejected = await bandit_executor.add_rewards([(r.trackUri, r.reward) for r in batch.rewards], batch.userId)
+        return {
+            "accepted": len(batch.rewards) - len(rejected),
+            "rejected": rejected
+        }
+    except BanditOverloaded:
+        raise HTTPException(status_code=503, detail="Bandit busy, retry shortly", headers={"Retry-After": "1"})
+    except redis.RedisError as e:
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+
+@router.get("/recommendations")
+async def get_recommendations(userId: str = Query(DEFAULT_USER), k: int = Query(10, ge=1, le=100)):
+    try:
+        return {"userId": userId, "tracks": await bandit_executor.get_top_k(userId, k)}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except BanditOverloaded:
+        raise HTTPException(status_code=503, detail="Bandit busy, retry shortly", headers={"Retry-After": "1"})
     except redis.RedisError as e:
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
 
 @router.get("/stats", response_model=FeedbackStats)
-async def get_stats(trackUri: str = Query(...)):
+async def get_stats(trackUri: str = Query(...), redis_client: aioredis.Redis = Depends(get_redis)):
     try:
         key = f"feedback:{trackUri}"
-        with redis_client.pipeline() as pipe:
+        async with redis_client.pipeline() as pipe:
             pipe.get(f"{key}:like")
             pipe.get(f"{key}:dislike")
             pipe.get(f"{key}:never")
-            likes, dislikes, never = pipe.execute()
+            likes, dislikes, never = await pipe.execute()
 
         return FeedbackStats(
             likes=int(likes or 0),
@@ -1,33 +1,31 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import json
 import logging
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from models import CheckIn
 import redis
+import redis.asyncio as aioredis
+from ..services.redis_pool import get_redis
+from ..services.database import get_session
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/history", tags=["history"])
 
-# Initialize Redis client
-redis_client = redis.Redis.from_url(
-    "redis://localhost:6379/0",
-    retry_on_timeout=True,
-    decode_responses=True
-)
 
 @router.get("/moods")
-async def get_mood_history(days: int, db: Session) -> List[Dict]:
+async def get_mood_history(days: int, db: AsyncSession = Depends(get_session)) -> List[Dict]:
     """Get mood history for the last N days"""
     try:
         since = datetime.now() - timedelta(days=days)
         
         # Query CheckIn table
         stmt = select(CheckIn).where(CheckIn.timestamp >= since)
-        results = db.execute(stmt).scalars().all()
+        results = (await db.execute(stmt)).scalars().all()
         
         return [
             {
@@ -54,34 +52,80 @@ def get_date_keys(since: datetime) -> List[str]:
     
     return date_keys
 
+# Plays read per LRANGE; memory held by a streamed response is bounded by one page
+PLAYS_PAGE_SIZE = 500
+
+def parse_cursor(cursor: str) -> Tuple[str, int]:
+    """Split a "YYYYMMDD:index" play cursor, ValueError if it isn't one"""
+    date_key, _, index = cursor.partition(":")
+    if len(date_key) != 8 or not date_key.isdigit() or not index.isdigit():
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return date_key, int(index)
+
+async def iter_plays(redis_client: aioredis.Redis, since: datetime, cursor: Optional[str] = None,
+                     page_size: int = PLAYS_PAGE_SIZE) -> AsyncIterator[Tuple[str, Dict]]:
+    """Plays since the specified date, oldest day first, each with the cursor of the play after it"""
+    start_key, start_index = parse_cursor(cursor) if cursor else ("", 0)
+    for date_key in get_date_keys(since):
+        if date_key < start_key:
+            continue
+        redis_key = f"plays:{date_key}"
+        index = start_index if date_key == start_key else 0
+        while True:
+            page = await redis_client.lrange(redis_key, index, index + page_size - 1)
+            for play_str in page:
+                index += 1
+                play = json.loads(play_str)
+                yield f"{date_key}:{index}", {"timestamp": play["timestamp"], "uri": play["uri"]}
+            if len(page) < page_size:
+                break
+
 @router.get("/plays")
-async def get_play_history(since: datetime) -> List[Dict]:
-    """Get play history since the specified date"""
+async def get_play_history(since: datetime, redis_client: aioredis.Redis = Depends(get_redis)) -> List[Dict]:
+    """Get play history since the specified date
+
+    Holds every play in memory; use /plays/stream for long histories.
+    """
     try:
-        date_keys = get_date_keys(since)
-        all_plays = []
-        
-        # Process in batches to avoid memory issues
-        batch_size = 1000
-        for date_key in date_keys:
-            redis_key = f"plays:{date_key}"
-            plays_count = redis_client.llen(redis_key)
-            
-            for i in range(0, plays_count, batch_size):
-                batch = redis_client.lrange(redis_key, i, i + batch_size - 1)
-                all_plays.extend(batch)
-        
-        return [
-            {
-                "timestamp": play["timestamp"],
-                "uri": play["uri"]
-            }
-            for play_str in all_plays
-            for play in [json.loads(play_str)]
-        ]
+        return [play async for _, play in iter_plays(redis_client, since)]
     except redis.RedisError as e:
         logger.error(f"Redis error getting play history: {e}")
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
     except Exception as e:
         logger.error(f"Error getting play history: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/plays/stream")
+async def stream_play_history(
+    since: datetime,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    redis_client: aioredis.Redis = Depends(get_redis)
+):
+    """Stream play history as NDJSON, one play per line, read a page at a time
+
+    With limit, at most that many plays are sent, followed by a
+    {"nextCursor"} line if there are more; pass it as cursor to continue.
+    A failure part way is reported as a final {"error"} line.
+    """
+    if cursor:
+        try:
+            parse_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def generate():
+        sent, previous = 0, cursor
+        try:
+            async for next_cursor, play in iter_plays(redis_client, since, cursor):
+                if limit is not None and sent == limit:
+                    yield json.dumps({"nextCursor": previous}) + "\n"
+                    return
+                yield json.dumps(play) + "\n"
+                sent += 1
+                previous = next_cursor
+        except Exception as e:
+            logger.error(f"Error streaming play history: {e}")
+            yield json.dumps({"error": "Service temporarily unavailable"}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
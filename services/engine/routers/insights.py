@@ -1,20 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from datetime import datetime, timedelta
 import json
 import logging
 from typing import List, Dict
 import redis
+import redis.asyncio as aioredis
+from ..services.redis_pool import get_redis
+from ..services.behavior_aggregates import BehaviorAggregates, averages, increments
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/insights", tags=["insights"])
 
-# Initialize Redis client
-redis_client = redis.Redis.from_url(
-    "redis://localhost:6379/0",
-    retry_on_timeout=True,
-    decode_responses=True
-)
 
 def get_date_keys(since: datetime) -> List[str]:
     """Generate list of date keys from since date to today"""
@@ -30,65 +27,37 @@ def get_date_keys(since: datetime) -> List[str]:
 
 def process_metrics_batch(metrics_list: List[str]) -> Dict:
     """Process a batch of metrics and compute aggregates"""
-    if not metrics_list:
-        return {
-            "avgTypingSpeed": 0,
-            "avgBackspaceRate": 0,
-            "avgScrollRate": 0,
-            "avgIdleTime": 0,
-            "avgFocusTime": 0
-        }
-    
-    total = len(metrics_list)
-    sums = {
-        "typingSpeed": 0,
-        "backspaceRate": 0,
-        "scrollRate": 0,
-        "idleMs": 0,
-        "focusMs": 0
-    }
-    
+    totals: Dict[str, float] = {}
     for metric_str in metrics_list:
         try:
             metric = json.loads(metric_str)
-            sums["typingSpeed"] += metric.get("typingSpeed", 0)
-            sums["backspaceRate"] += metric.get("backspaceRate", 0)
-            sums["scrollRate"] += metric.get("scrollRate", 0)
-            sums["idleMs"] += metric.get("idleMs", 0)
-            sums["focusMs"] += metric.get("focusMs", 0)
         except json.JSONDecodeError:
             logger.warning(f"Failed to decode metric: {metric_str}")
             continue
-    
-    return {
-        "avgTypingSpeed": sums["typingSpeed"] / total,
-        "avgBackspaceRate": sums["backspaceRate"] / total,
-        "avgScrollRate": sums["scrollRate"] / total,
-        "avgIdleTime": sums["idleMs"] / total,
-        "avgFocusTime": sums["focusMs"] / total
-    }
+        for field, delta in increments(metric, None).items():
+            totals[field] = totals.get(field, 0.0) + delta
+    # Undecodable entries still count towards the average, as they always have
+    totals["count"] = len(metrics_list)
+    return averages([totals])
+
+def get_behavior_aggregates(redis_client: aioredis.Redis = Depends(get_redis)) -> BehaviorAggregates:
+    return BehaviorAggregates(redis_client)
 
 @router.get("/behavioral")
-async def get_behavioral_insights(since: datetime) -> Dict:
-    """Get behavioral insights since the specified date"""
+async def get_behavioral_insights(
+    since: datetime,
+    hourly: bool = False,
+    aggregates: BehaviorAggregates = Depends(get_behavior_aggregates)
+) -> Dict:
+    """Get behavioral insights since the specified date, from per-day running sums
+
+    With hourly, only metrics from since's hour on count on the first day.
+    """
     try:
-        date_keys = get_date_keys(since)
-        all_metrics = []
-        
-        # Process in batches to avoid memory issues
-        batch_size = 1000
-        for date_key in date_keys:
-            redis_key = f"metrics:{date_key}"
-            metrics_count = redis_client.llen(redis_key)
-            
-            for i in range(0, metrics_count, batch_size):
-                batch = redis_client.lrange(redis_key, i, i + batch_size - 1)
-                all_metrics.extend(batch)
-        
-        return process_metrics_batch(all_metrics)
+        return await aggregates.window(since, hourly=hourly)
     except redis.RedisError as e:
         logger.error(f"Redis error getting behavioral insights: {e}")
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
     except Exception as e:
         logger.error(f"Error getting behavioral insights: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error")
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 import redis
+import redis.asyncio as aioredis
 from typing import Optional, List
-from ..main import redis_client, sio
+from ..main import sio, context_encoder
+from ..services.redis_pool import get_redis
 
 router = APIRouter(prefix="/api/moods", tags=["moods"])
 
@@ -78,7 +80,7 @@ async def get_moods():
     return MOODS
 
 @router.post("/manual")
-async def set_manual_mood(mood_id: str):
+async def set_manual_mood(mood_id: str, redis_client: aioredis.Redis = Depends(get_redis)):
     try:
         # Validate mood ID
         mood = next((m for m in MOODS if m.id == mood_id), None)
@@ -86,7 +88,8 @@ async def set_manual_mood(mood_id: str):
             raise HTTPException(status_code=400, detail="Invalid mood ID")
 
         # Store in Redis
-        redis_client.set("current_mood_manual", mood_id)
+        await redis_client.set("current_mood_manual", mood_id)
+        await context_encoder.on_mood(mood_id, "manual")
         
         # Emit Socket.IO event
         await sio.emit("moodUpdate", {
@@ -99,17 +102,17 @@ async def set_manual_mood(mood_id: str):
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
 
 @router.get("/current")
-async def get_current_mood():
+async def get_current_mood(redis_client: aioredis.Redis = Depends(get_redis)):
     try:
         # Check for manual override first
-        manual_mood = redis_client.get("current_mood_manual")
+        manual_mood = await redis_client.get("current_mood_manual")
         if manual_mood:
             mood = next((m for m in MOODS if m.id == manual_mood), None)
             if mood:
                 return mood.dict()
         
         # Fall back to AI mood
-        ai_mood = redis_client.get("current_mood_ai")
+        ai_mood = await redis_client.get("current_mood_ai")
         if ai_mood:
             mood = next((m for m in MOODS if m.id == ai_mood), None)
             if mood:
@@ -2,19 +2,22 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, Field, validator
 from typing import Dict, Optional
 import logging
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import redis
+import redis.asyncio as aioredis
+import asyncio
 import json
 
 from models import Preference
+from ..main import feature_store, context_encoder
+from ..services.redis_pool import get_redis
+from ..services.database import get_session
+from ..services.context import DEFAULT_USER
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/preferences", tags=["preferences"])
 
-# Initialize Redis client
-redis_client = redis.Redis(host='localhost', port=6379, db=0)
-
 class GenreWeights(BaseModel):
     __root__: Dict[str, int] = Field(..., description="Genre weights between 0 and 100")
 
@@ -32,17 +35,21 @@ class PreferenceUpdate(BaseModel):
 
 def get_default_preferences() -> Preference:
     return Preference(
-        user_id="default",
+        user_id=DEFAULT_USER,
         energy_ceiling=100,
         genre_weights={},
         explore_new_music=True
     )
 
+async def set_genre_weights(genre_weights: Dict[str, int]):
+    """Share genre weights and rescore stored tracks off the event loop"""
+    await asyncio.get_running_loop().run_in_executor(None, feature_store.set_genre_weights, genre_weights)
+
 @router.get("")
-async def get_preferences(user_id: str, db: Session) -> Preference:
+async def get_preferences(user_id: str, db: AsyncSession = Depends(get_session)) -> Preference:
     try:
         stmt = select(Preference).where(Preference.user_id == user_id)
-        result = db.execute(stmt).scalar_one_or_none()
+        result = (await db.execute(stmt)).scalar_one_or_none()
         
         if result is None:
             return get_default_preferences()
@@ -55,12 +62,13 @@ async def get_preferences(user_id: str, db: Session) -> Preference:
 async def update_preferences(
     user_id: str,
     preferences: PreferenceUpdate,
-    db: Session
+    db: AsyncSession = Depends(get_session),
+    redis_client: aioredis.Redis = Depends(get_redis)
 ) -> Preference:
     try:
         # Get existing preferences or create new
         stmt = select(Preference).where(Preference.user_id == user_id)
-        result = db.execute(stmt).scalar_one_or_none()
+        result = (await db.execute(stmt)).scalar_one_or_none()
         
         if result is None:
             pref = Preference(
@@ -75,11 +83,15 @@ async def update_preferences(
             result.genre_weights = preferences.genre_weights.__root__
             result.explore_new_music = preferences.explore_new_music
         
-        db.commit()
+        await db.commit()
         
         # Clear Redis caches
-        redis_client.delete(f"preferences:{user_id}")
-        redis_client.delete(f"recommendations:{user_id}")
+        await redis_client.delete(f"preferences:{user_id}", f"recommendations:{user_id}")
+
+        # Track features are shared by every user, so only the default user's weights score genres
+        if user_id == DEFAULT_USER:
+            await set_genre_weights(preferences.genre_weights.__root__)
+        await context_encoder.on_preferences(preferences.energy_ceiling, user_id)
         
         return result if result else pref
     except Exception as e:
@@ -87,19 +99,21 @@ async def update_preferences(
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
 
 @router.post("/reset")
-async def reset_preferences(user_id: str, db: Session) -> Preference:
+async def reset_preferences(user_id: str, db: AsyncSession = Depends(get_session), redis_client: aioredis.Redis = Depends(get_redis)) -> Preference:
     try:
         # Delete existing preferences
         stmt = select(Preference).where(Preference.user_id == user_id)
-        result = db.execute(stmt).scalar_one_or_none()
+        result = (await db.execute(stmt)).scalar_one_or_none()
         
         if result:
-            db.delete(result)
-            db.commit()
+            await db.delete(result)
+            await db.commit()
             
             # Clear Redis caches
-            redis_client.delete(f"preferences:{user_id}")
-            redis_client.delete(f"recommendations:{user_id}")
+            await redis_client.delete(f"preferences:{user_id}", f"recommendations:{user_id}")
+            await context_encoder.on_preferences(100, user_id)
+            if user_id == DEFAULT_USER:
+                await set_genre_weights({})
         
         return get_default_preferences()
     except Exception as e:
@@ -1,21 +1,18 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Query
+from pydantic import BaseModel, Field
 from typing import List, Optional
-import json
 import redis
+import redis.asyncio as aioredis
 import logging
+from ..services.redis_pool import get_redis
+from ..services.queue_store import QueueStore
+from ..services.search_index import from_queue_item
+from ..main import search_index
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/queue", tags=["queue"])
 
-# Initialize Redis client
-redis_client = redis.Redis.from_url(
-    "redis://localhost:6379/0",
-    retry_on_timeout=True,
-    decode_responses=True
-)
-
 class QueueItem(BaseModel):
     uri: str
     title: str
@@ -25,66 +22,108 @@ class QueueItem(BaseModel):
 class QueueReorderRequest(BaseModel):
     uris: List[str]
 
+class QueueMoveRequest(BaseModel):
+    uri: str
+    index: int = Field(ge=0)
+
+def get_queue_store(redis_client: aioredis.Redis = Depends(get_redis)) -> QueueStore:
+    return QueueStore(redis_client)
+
+async def enqueue(store: QueueStore, item: QueueItem) -> int:
+    """Append an item and make it findable by local search, returns the queue length"""
+    new_length = await store.add(item.dict())
+    search_index.add(from_queue_item(item.dict()))
+    return new_length
+
 @router.get("")
-async def get_queue() -> List[QueueItem]:
-    """Get the current queue"""
+async def get_queue(
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    store: QueueStore = Depends(get_queue_store)
+) -> List[QueueItem]:
+    """Get the current queue from offset on, all of it unless a page limit is given"""
     try:
-        items = redis_client.lrange("queue", 0, -1)
-        return [QueueItem(**json.loads(item)) for item in items]
+        items = await store.page(offset, limit)
+        return [QueueItem(**item) for item in items]
     except redis.RedisError as e:
         logger.error(f"Redis error getting queue: {e}")
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
 
+@router.get("/snapshot")
+async def get_queue_snapshot(store: QueueStore = Depends(get_queue_store)) -> dict:
+    """Get the whole queue with its version, for clients applying change records"""
+    try:
+        return await store.snapshot()
+    except redis.RedisError as e:
+        logger.error(f"Redis error getting queue snapshot: {e}")
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+
+@router.get("/changes")
+async def get_queue_changes(
+    since: int = Query(..., ge=0),
+    store: QueueStore = Depends(get_queue_store)
+) -> dict:
+    """Get change records after a version, 410 if the client needs a snapshot instead"""
+    try:
+        changes = await store.changes_since(since)
+    except redis.RedisError as e:
+        logger.error(f"Redis error getting queue changes: {e}")
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+    if changes is None:
+        raise HTTPException(status_code=410, detail="Version no longer available, fetch a snapshot")
+    return {"changes": changes}
+
 @router.post("/add")
-async def add_to_queue(item: QueueItem) -> dict:
-    """Add an item to the queue"""
+async def add_to_queue(item: QueueItem, store: QueueStore = Depends(get_queue_store)) -> dict:
+    """Add an item to the end of the queue"""
     try:
-        serialized = item.json()
-        new_length = redis_client.rpush("queue", serialized)
-        return {"length": new_length}
+        return {"length": await enqueue(store, item)}
     except redis.RedisError as e:
         logger.error(f"Redis error adding to queue: {e}")
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
 
 @router.post("/remove")
-async def remove_from_queue(uri: str) -> dict:
+async def remove_from_queue(uri: str, store: QueueStore = Depends(get_queue_store)) -> dict:
     """Remove an item from the queue by URI"""
     try:
-        # Get all items to find matching ones
-        items = redis_client.lrange("queue", 0, -1)
-        removed_count = 0
-        
-        # Use pipeline for atomic operations
-        pipe = redis_client.pipeline()
-        for item in items:
-            data = json.loads(item)
-            if data["uri"] == uri:
-                pipe.lrem("queue", 0, item)
-                removed_count += 1
-        pipe.execute()
-        
+        removed_count = await store.remove(uri)
         return {"removedCount": removed_count}
     except redis.RedisError as e:
         logger.error(f"Redis error removing from queue: {e}")
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
 
+@router.post("/move")
+async def move_in_queue(request: QueueMoveRequest, store: QueueStore = Depends(get_queue_store)) -> dict:
+    """Move a single item to a new index"""
+    try:
+        if not await store.move(request.uri, request.index):
+            raise HTTPException(status_code=404, detail="Track not in queue")
+        return {"success": True}
+    except redis.RedisError as e:
+        logger.error(f"Redis error moving queue item: {e}")
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+
+@router.post("/next")
+async def pop_next(store: QueueStore = Depends(get_queue_store)) -> QueueItem:
+    """Take the item at the front of the queue"""
+    try:
+        item = await store.pop_next()
+    except redis.RedisError as e:
+        logger.error(f"Redis error popping from queue: {e}")
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+    if item is None:
+        raise HTTPException(status_code=404, detail="Queue is empty")
+    return QueueItem(**item)
+
 @router.post("/reorder")
-async def reorder_queue(request: QueueReorderRequest) -> dict:
-    """Reorder the queue based on the provided URI list"""
+async def reorder_queue(request: QueueReorderRequest, store: QueueStore = Depends(get_queue_store)) -> dict:
+    """Reorder the queue based on the provided URI list
+
+    Queued items missing from the list stay queued after the listed ones.
+    """
     try:
-        # Get all items and create a mapping of URI to full item data
-        items = redis_client.lrange("queue", 0, -1)
-        item_map = {json.loads(item)["uri"]: item for item in items}
-        
-        # Create new queue with items in requested order
-        pipe = redis_client.pipeline()
-        pipe.delete("queue")
-        for uri in request.uris:
-            if uri in item_map:
-                pipe.rpush("queue", item_map[uri])
-        pipe.execute()
-        
+        await store.reorder(request.uris)
         return {"success": True}
     except redis.RedisError as e:
         logger.error(f"Redis error reordering queue: {e}")
-        raise HTTPException(status_code=503, detail="Service temporarily unavailable") 
\ No newline at end of file
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
@@ -1,9 +1,13 @@
 from fastapi import APIRouter, HTTPException
 from ytmusicapi import YTMusic
 import os
-from functools import lru_cache
 from typing import List
 import logging
+from ..main import feature_store, redis_binary_client, search_index
+from ..services.search_cache import SearchCache
+from ..services.search_executor import SearchExecutor, SearchOverloaded, SearchTimeout
+from ..services.search_index import merge_results
+from ..services.typeahead import Typeahead
 
 logger = logging.getLogger(__name__)
 
@@ -19,12 +23,22 @@ except Exception as e:
     logger.error(f"Failed to initialize YTMusic client: {e}")
     raise
 
-@lru_cache(maxsize=50)
+# Results shared by every worker through Redis, with a local copy in front
+search_cache = SearchCache(
+    redis_binary_client,
+    ttl=int(os.getenv("SEARCH_CACHE_TTL", "3600")),
+    max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+    stale_ttl=int(os.getenv("SEARCH_CACHE_STALE_TTL", "86400"))
+)
+
 def search_songs(query: str, limit: int = 20) -> List[dict]:
     """Search for songs and cache results"""
+    cached = search_cache.get(query, limit)
+    if cached is not None:
+        return cached
     try:
         results = ytmusic.search(query, filter='songs', limit=limit)
-        return [
+        songs = [
             {
                 "id": item["videoId"],
                 "title": item["title"],
@@ -34,11 +48,57 @@ def search_songs(query: str, limit: int = 20) -> List[dict]:
             }
             for item in results
         ]
+        # Register features for newly seen tracks so the bandit can score them
+        feature_store.populate_from_search(songs)
+        search_index.add_many(songs)
+        search_cache.set(query, limit, songs)
+        return songs
     except Exception as e:
         logger.error(f"YTMusic search error: {e}")
         raise HTTPException(status_code=502, detail="Search service temporarily unavailable")
 
+# Upstream searches run on their own threads so they never block the event loop
+search_executor = SearchExecutor(
+    search_songs,
+    search_cache,
+    max_workers=int(os.getenv("SEARCH_WORKERS", "4")),
+    max_queue=int(os.getenv("SEARCH_MAX_QUEUE", "32")),
+    timeout=float(os.getenv("SEARCH_TIMEOUT", "3.0"))
+)
+
+# Socket.IO typeahead, sharing the index, cache and upstream pool with the endpoint
+typeahead = Typeahead(
+    search_index,
+    search_cache,
+    search_executor,
+    debounce=float(os.getenv("TYPEAHEAD_DEBOUNCE", "0.15"))
+)
+
+async def find_songs(query: str, limit: int = 20) -> List[dict]:
+    """Search for songs without blocking the event loop
+
+    Answered from the local index of tracks we've already seen when it has
+    enough hits, otherwise merged with (possibly cached) YTMusic results.
+    Local hits alone are served if the remote search is shed or times out;
+    with none, SearchOverloaded or SearchTimeout propagates.
+    """
+    local = search_index.search(query, limit)
+    if len(local) >= limit:
+        return local
+    try:
+        remote = await search_executor.search(query, limit)
+    except (SearchOverloaded, SearchTimeout):
+        if local:
+            return local
+        raise
+    return merge_results(local, remote, limit)
+
 @router.get("")
 async def search(query: str, limit: int = 20) -> List[dict]:
     """Search for songs"""
-    return search_songs(query, limit) 
\ No newline at end of file
+    try:
+        return await find_songs(query, limit)
+    except SearchOverloaded:
+        raise HTTPException(status_code=503, detail="Search busy, retry shortly", headers={"Retry-After": "1"})
+    except SearchTimeout:
+        raise HTTPException(status_code=504, detail="Search timed out") 
\ No newline at end of file
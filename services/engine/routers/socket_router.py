@@ -4,13 +4,21 @@ from socketio import AsyncServer
 import asyncio
 import json
 import logging
-import redis
 from datetime import datetime
-from typing import Dict, Any
-import httpx
+from typing import Dict, Any, List, Optional
 import google.generativeai as genai
 from dotenv import load_dotenv
 import os
+from ..main import context_encoder
+from ..services.redis_pool import get_redis
+from ..services.queue_store import QueueStore, CHANGES_CHANNEL
+from ..services.mood_inference import MoodInference
+from ..services.mood_classifier import MoodClassifier, LocalFirstClassifier
+from ..services.behavior_aggregates import BehaviorAggregates
+from ..services.mood_batcher import MoodBatcher, batch_prompt, parse_moods
+from .search import typeahead, find_songs
+from .feedback import FeedbackRequest, record_feedback
+from .queue import QueueItem, QueueReorderRequest, QueueMoveRequest, enqueue
 
 # Load environment variables
 load_dotenv()
@@ -21,66 +29,86 @@ router = APIRouter()
 # Initialize Socket.IO server
 sio = AsyncServer(async_mode='asgi')
 
-# Initialize Redis client
-redis_client = redis.Redis(host='localhost', port=6379, db=0)
-
-# Initialize HTTP client for inference service
-http_client = httpx.AsyncClient()
+# Task relaying queue change records to every connected client, started on first connect
+queue_relay: Optional[asyncio.Task] = None
 
 # Configure Gemini API
 genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
 model = genai.GenerativeModel('gemini-pro')
 
-async def analyze_mood_with_gemini(metrics: Dict[str, Any]) -> str:
-    """Analyze mood using Gemini API based on behavioral metrics"""
+async def analyze_moods_with_gemini(snapshots: List[Dict[str, Any]]) -> List[str]:
+    """Analyze a batch of behavioral metric snapshots with a single Gemini request"""
+    response = await model.generate_content_async(batch_prompt(snapshots))
+    return parse_moods(response.text, len(snapshots))
+
+# Collects concurrent metrics events from all clients into shared Gemini requests
+mood_batcher = MoodBatcher(
+    analyze_moods_with_gemini,
+    max_batch=int(os.getenv("MOOD_BATCH_SIZE", "32")),
+    max_wait=float(os.getenv("MOOD_BATCH_WAIT", "0.03"))
+)
+
+async def relay_queue_changes():
+    """Broadcast each queue change record published by QueueStore as a queueDiff event
+
+    Records are published from inside the mutation scripts, so every engine
+    process relays changes made by any of them.
+    """
+    while True:
+        pubsub = get_redis().pubsub()
+        try:
+            await pubsub.subscribe(CHANGES_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    await sio.emit("queueDiff", json.loads(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Clients that missed records will see a version gap and resync
+            logger.error(f"Error relaying queue changes: {e}")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+async def stop_queue_relay():
+    """Cancel the relay task and wait for it to close its pub/sub connection"""
+    global queue_relay
+    if queue_relay is None:
+        return
+    queue_relay.cancel()
     try:
-        # Prepare prompt for Gemini
-        prompt = f"""
-        Analyze the following behavioral metrics and determine the most likely mood:
-        {json.dumps(metrics, indent=2)}
-        
-        Consider factors like:
-        - Activity level
-        - Heart rate
-        - Interaction patterns
-        - Time of day
-        - Previous mood states
-        
-        Return a single mood identifier from this list:
-        - happy
-        - calm
-        - energetic
-        - focused
-        - relaxed
-        - stressed
-        - sad
-        - anxious
-        
-        Only return the mood identifier, nothing else.
-        """
-        
-        # Get response from Gemini
-        response = await model.generate_content_async(prompt)
-        mood_id = response.text.strip().lower()
-        
-        # Validate mood_id
-        valid_moods = {'happy', 'calm', 'energetic', 'focused', 'relaxed', 'stressed', 'sad', 'anxious'}
-        if mood_id not in valid_moods:
-            logger.warning(f"Invalid mood detected from Gemini: {mood_id}")
-            return 'neutral'
-            
-        return mood_id
-    except Exception as e:
-        logger.error(f"Error in Gemini mood analysis: {e}")
-        return 'neutral'
+        await queue_relay
+    except asyncio.CancelledError:
+        pass
+    queue_relay = None
+
+# Confident local predictions answer straight away; the rest go to Gemini
+mood_classifier = LocalFirstClassifier(
+    MoodClassifier.load(os.getenv("MOOD_MODEL_PATH", "./mood_model.npz")),
+    mood_batcher,
+    min_confidence=float(os.getenv("MOOD_LOCAL_CONFIDENCE", "0.7"))
+)
+
+# Skips inference while a client's metrics hold steady and caches moods by quantized metrics
+mood_inference = MoodInference(
+    mood_classifier,
+    ttl=float(os.getenv("MOOD_CACHE_TTL", "600")),
+    min_interval=float(os.getenv("MOOD_MIN_INTERVAL", "5.0")),
+    drift_threshold=float(os.getenv("MOOD_DRIFT_THRESHOLD", "0.1"))
+)
 
 @sio.event
 async def connect(sid, environ):
+    global queue_relay
     logger.info(f"Client connected: {sid}")
+    if queue_relay is None or queue_relay.done():
+        queue_relay = asyncio.create_task(relay_queue_changes())
 
 @sio.event
 async def disconnect(sid):
     logger.info(f"Client disconnected: {sid}")
+    typeahead.cancel(sid)
+    mood_inference.forget(sid)
 
 @sio.event
 async def metrics(sid, data: Dict[str, Any]):
@@ -88,18 +116,24 @@ async def metrics(sid, data: Dict[str, Any]):
         # Validate metrics
         if not isinstance(data, dict):
             raise ValueError("Invalid metrics format")
-        
-        # Get mood from Gemini API
-        mood_id = await analyze_mood_with_gemini(data)
+
+        # Keep the raw metrics and the running sums insights are answered from
+        redis_client = get_redis()
+        await BehaviorAggregates(redis_client).record(data)
+
+        # Get mood from Gemini API, unless the metrics barely changed or a cached answer fits
+        mood_id = await mood_inference.infer(sid, data)
+        if mood_id == mood_inference.fallback:
+            # Inference failed with no earlier mood to go on; keep the current one
+            return
         
         # Get current AI mood from Redis
-        current_mood = redis_client.get("current_mood_ai")
-        if current_mood:
-            current_mood = current_mood.decode()
+        current_mood = await redis_client.get("current_mood_ai")
         
         # If mood changed, update Redis and emit event
         if current_mood != mood_id:
-            redis_client.set("current_mood_ai", mood_id)
+            await redis_client.set("current_mood_ai", mood_id)
+            await context_encoder.on_mood(mood_id, "ai")
             await sio.emit(
                 "moodUpdate",
                 {
@@ -122,7 +156,8 @@ async def manual_mood(sid, data: Dict[str, Any]):
             raise ValueError("Missing moodId")
         
         # Update Redis
-        redis_client.set("current_mood_manual", mood_id)
+        await get_redis().set("current_mood_manual", mood_id)
+        await context_encoder.on_mood(mood_id, "manual")
         
         # Emit mood update
         await sio.emit(
@@ -141,26 +176,18 @@ async def manual_mood(sid, data: Dict[str, Any]):
 @sio.event
 async def feedback(sid, data: Dict[str, Any]):
     try:
-        # Call feedback router
-        response = await http_client.post(
-            "http://localhost:8000/api/feedback",
-            json=data
-        )
-        response.raise_for_status()
-        await sio.emit("feedbackAck", response.json(), room=sid)
+        await record_feedback(get_redis(), FeedbackRequest(**data))
+        await sio.emit("feedbackAck", {"success": True}, room=sid)
     except Exception as e:
         logger.error(f"Error processing feedback: {e}")
         await sio.emit("error", {"message": str(e)}, room=sid)
 
+# Queue changes reach every client, the sender included, as queueDiff events
+
 @sio.event
 async def queue_add(sid, data: Dict[str, Any]):
     try:
-        response = await http_client.post(
-            "http://localhost:8000/api/queue/add",
-            json=data
-        )
-        response.raise_for_status()
-        await sio.emit("queueUpdate", response.json(), room=sid)
+        await enqueue(QueueStore(get_redis()), QueueItem(**data))
     except Exception as e:
         logger.error(f"Error adding to queue: {e}")
         await sio.emit("error", {"message": str(e)}, room=sid)
@@ -168,12 +195,7 @@ async def queue_add(sid, data: Dict[str, Any]):
 @sio.event
 async def queue_remove(sid, data: Dict[str, Any]):
     try:
-        response = await http_client.post(
-            "http://localhost:8000/api/queue/remove",
-            json=data
-        )
-        response.raise_for_status()
-        await sio.emit("queueUpdate", response.json(), room=sid)
+        await QueueStore(get_redis()).remove(data["uri"])
     except Exception as e:
         logger.error(f"Error removing from queue: {e}")
         await sio.emit("error", {"message": str(e)}, room=sid)
@@ -181,34 +203,79 @@ async def queue_remove(sid, data: Dict[str, Any]):
 @sio.event
 async def queue_reorder(sid, data: Dict[str, Any]):
     try:
-        response = await http_client.post(
-            "http://localhost:8000/api/queue/reorder",
-            json=data
-        )
-        response.raise_for_status()
-        await sio.emit("queueUpdate", response.json(), room=sid)
+        await QueueStore(get_redis()).reorder(QueueReorderRequest(**data).uris)
     except Exception as e:
         logger.error(f"Error reordering queue: {e}")
         await sio.emit("error", {"message": str(e)}, room=sid)
 
+@sio.event
+async def queue_move(sid, data: Dict[str, Any]):
+    try:
+        request = QueueMoveRequest(**data)
+        if not await QueueStore(get_redis()).move(request.uri, request.index):
+            raise ValueError("Track not in queue")
+    except Exception as e:
+        logger.error(f"Error moving queue item: {e}")
+        await sio.emit("error", {"message": str(e)}, room=sid)
+
+@sio.event
+async def queue_sync(sid, data: Dict[str, Any]):
+    """Catch a client up from its last applied version
+
+    Sends the missed queueDiff records, or a queueSnapshot if the change
+    log no longer reaches back that far or no version was given.
+    """
+    try:
+        store = QueueStore(get_redis())
+        version = data.get("version") if isinstance(data, dict) else None
+        changes = await store.changes_since(int(version)) if version is not None else None
+        if changes is None:
+            await sio.emit("queueSnapshot", await store.snapshot(), room=sid)
+            return
+        for change in changes:
+            await sio.emit("queueDiff", change, room=sid)
+    except Exception as e:
+        logger.error(f"Error syncing queue: {e}")
+        await sio.emit("error", {"message": str(e)}, room=sid)
+
 @sio.event
 async def search(sid, data: Dict[str, Any]):
     try:
-        response = await http_client.post(
-            "http://localhost:8000/api/search",
-            json=data
-        )
-        response.raise_for_status()
-        await sio.emit("searchResults", response.json(), room=sid)
+        results = await find_songs(data["query"], int(data.get("limit", 20)))
+        await sio.emit("searchResults", results, room=sid)
     except Exception as e:
         logger.error(f"Error processing search: {e}")
         await sio.emit("error", {"message": str(e)}, room=sid)
 
+@sio.event
+async def typeahead_search(sid, data: Dict[str, Any]):
+    """Answer a keystroke's query in-process, superseding the sid's previous one
+
+    Emits typeaheadResults with the local answer straight away, then again
+    with upstream results if the local answer was partial. Clients should
+    drop results whose query is no longer the current input.
+    """
+    try:
+        query = data.get("query", "") if isinstance(data, dict) else ""
+        limit = int(data.get("limit", 10)) if isinstance(data, dict) else 10
+        if not query.strip():
+            typeahead.cancel(sid)
+            await sio.emit("typeaheadResults", {"query": query, "results": [], "partial": False}, room=sid)
+            return
+
+        async def emit(payload: Dict[str, Any]):
+            await sio.emit("typeaheadResults", payload, room=sid)
+
+        typeahead.query(sid, query, max(1, min(limit, 50)), emit)
+    except Exception as e:
+        logger.error(f"Error processing typeahead search: {e}")
+        await sio.emit("error", {"message": str(e)}, room=sid)
+
 @router.get("/api/sse/mood")
 async def mood_stream(request: Request):
     async def event_generator():
+        pubsub = get_redis().pubsub()
         try:
-            pubsub = redis_client.pubsub()
             await pubsub.subscribe("mood_updates")
             
             while True:
@@ -221,6 +288,8 @@ async def mood_stream(request: Request):
             yield f"data: {json.dumps({'error': str(e)})}\n\n"
         finally:
             await pubsub.unsubscribe("mood_updates")
+            # Hand the connection back to the shared pool
+            await pubsub.aclose()
     
     return StreamingResponse(
         event_generator(),
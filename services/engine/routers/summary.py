@@ -1,28 +1,25 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from datetime import datetime, timedelta
 from typing import List, Dict, Literal
 import json
 import logging
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, desc
 from models import CheckIn
 import redis
+import redis.asyncio as aioredis
+from ..services.redis_pool import get_redis
+from ..services.database import get_session
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/summary", tags=["summary"])
 
-# Initialize Redis client
-redis_client = redis.Redis.from_url(
-    "redis://localhost:6379/0",
-    retry_on_timeout=True,
-    decode_responses=True
-)
 
 @router.get("/mood-distribution")
 async def get_mood_distribution(
     period: Literal['day', 'week'],
-    db: Session
+    db: AsyncSession = Depends(get_session)
 ) -> List[Dict]:
     """Get mood distribution for the specified period"""
     try:
@@ -42,7 +39,7 @@ async def get_mood_distribution(
             .where(CheckIn.timestamp >= since)
             .group_by(CheckIn.mood_id)
         )
-        results = db.execute(stmt).all()
+        results = (await db.execute(stmt)).all()
         
         # Calculate total and percentages
         total = sum(row.count for row in results)
@@ -61,7 +58,7 @@ async def get_mood_distribution(
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
 
 @router.get("/top-moods")
-async def get_top_moods(limit: int, db: Session) -> List[Dict]:
+async def get_top_moods(limit: int, db: AsyncSession = Depends(get_session)) -> List[Dict]:
     """Get top N moods by frequency"""
     try:
         stmt = (
@@ -73,7 +70,7 @@ async def get_top_moods(limit: int, db: Session) -> List[Dict]:
             .order_by(desc('count'))
             .limit(limit)
         )
-        results = db.execute(stmt).all()
+        results = (await db.execute(stmt)).all()
         
         return [
             {
@@ -87,18 +84,18 @@ async def get_top_moods(limit: int, db: Session) -> List[Dict]:
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
 
 @router.get("/quick-stats")
-async def get_quick_stats(db: Session) -> Dict:
+async def get_quick_stats(db: AsyncSession = Depends(get_session), redis_client: aioredis.Redis = Depends(get_redis)) -> Dict:
     """Get quick statistics about check-ins and plays"""
     try:
         # Get total check-ins
-        check_in_count = db.query(func.count(CheckIn.id)).scalar()
+        check_in_count = await db.scalar(select(func.count(CheckIn.id)))
         
         # Get total plays from Redis
         today = datetime.now().strftime("%Y%m%d")
-        plays_count = redis_client.llen(f"plays:{today}")
+        plays_count = await redis_client.llen(f"plays:{today}")
         
         # Calculate average feedback (rewards/total plays)
-        total_rewards = db.query(func.sum(CheckIn.reward)).scalar() or 0
+        total_rewards = await db.scalar(select(func.sum(CheckIn.reward))) or 0
         avg_feedback = round(total_rewards / plays_count if plays_count > 0 else 0, 2)
         
         return {
@@ -0,0 +1,102 @@
+"""Train the local mood classifier from stored behavioral metrics and check-ins
+
+Each metrics:{date} entry is labelled with the mood of the nearest
+check-in within --window hours if it carries a timestamp, otherwise with
+the day's last check-in. Run from services/engine:
+
+    python -m scripts.train_mood_classifier --days 90 --out mood_model.npz
+"""
+import argparse
+import asyncio
+import json
+import os
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import redis.asyncio as aioredis
+from sqlalchemy import select
+from models import CheckIn
+from services.database import init_engine, open_session, dispose_engine
+from services.mood_classifier import MoodClassifier, featurize
+
+async def load_checkins(since: datetime) -> List[Tuple[datetime, str]]:
+    async with open_session() as db:
+        rows = (await db.execute(
+            select(CheckIn.timestamp, CheckIn.mood_id).where(CheckIn.timestamp >= since).order_by(CheckIn.timestamp)
+        )).all()
+    return [(timestamp, mood_id) for timestamp, mood_id in rows]
+
+def label_for(metric: Dict, day: str, checkins: List[Tuple[datetime, str]], window: timedelta) -> Optional[str]:
+    """Mood of the nearest check-in to a timestamped metric, or of its day's last check-in"""
+    try:
+        at = datetime.fromisoformat(str(metric["timestamp"]).replace("Z", "+00:00")).replace(tzinfo=None)
+    except (KeyError, ValueError):
+        same_day = [mood for timestamp, mood in checkins if timestamp.strftime("%Y%m%d") == day]
+        return same_day[-1] if same_day else None
+
+    times = [timestamp for timestamp, _ in checkins]
+    i = bisect_left(times, at)
+    nearest = min((j for j in (i - 1, i) if 0 <= j < len(checkins)), key=lambda j: abs(times[j] - at), default=None)
+    if nearest is None or abs(times[nearest] - at) > window:
+        return None
+    return checkins[nearest][1]
+
+async def load_examples(redis_client: aioredis.Redis, checkins: List[Tuple[datetime, str]], since: datetime,
+                        window: timedelta, batch_size: int = 1000) -> Tuple[List[Dict], List[str]]:
+    snapshots, moods = [], []
+    day = since
+    while day <= datetime.now():
+        key = f"metrics:{day.strftime('%Y%m%d')}"
+        for start in range(0, await redis_client.llen(key), batch_size):
+            for raw in await redis_client.lrange(key, start, start + batch_size - 1):
+                try:
+                    metric = json.loads(raw)
+                except json.JSONDecodeError:
+                    continue
+                mood = label_for(metric, day.strftime("%Y%m%d"), checkins, window)
+                if mood is not None and featurize(metric) is not None:
+                    snapshots.append(metric)
+                    moods.append(mood)
+        day += timedelta(days=1)
+    return snapshots, moods
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--window", type=float, default=2.0, help="hours between a metric and its check-in")
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction held out for accuracy")
+    parser.add_argument("--out", default=os.getenv("MOOD_MODEL_PATH", "./mood_model.npz"))
+    args = parser.parse_args()
+
+    since = datetime.now() - timedelta(days=args.days)
+    init_engine(os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./crescendo.db"))
+    redis_client = aioredis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+    try:
+        checkins = await load_checkins(since)
+        snapshots, moods = await load_examples(redis_client, checkins, since, timedelta(hours=args.window))
+    finally:
+        await redis_client.aclose()
+        await dispose_engine()
+
+    print(f"{len(checkins)} check-ins, {len(snapshots)} labelled metrics: {dict(Counter(moods))}")
+    if not snapshots:
+        raise SystemExit("Nothing to train on")
+
+    order = np.random.default_rng(0).permutation(len(snapshots))
+    n_test = int(len(order) * args.holdout)
+    test, train = order[:n_test], order[n_test:]
+    model = MoodClassifier.fit([snapshots[i] for i in train], [moods[i] for i in train])
+    if n_test:
+        predictions = [model.predict(snapshots[i]) for i in test]
+        accuracy = np.mean([p[0] == moods[i] for p, i in zip(predictions, test)])
+        confident = [(p[0] == moods[i]) for p, i in zip(predictions, test) if p[1] >= 0.7]
+        print(f"holdout accuracy {accuracy:.3f}, {len(confident)}/{n_test} confident at "
+              f"{np.mean(confident) if confident else 0.0:.3f}")
+
+    model.save(args.out)
+    print(f"Saved {args.out}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,105 +1,390 @@
 import numpy as np
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import redis
-import json
 import logging
+import threading
+from .bandit_store import ArmStore, sherman_morrison
+from .feature_store import FeatureStore, FEATURES, DEFAULT_FEATURES
+from .context import ContextEncoder, DEFAULT_USER
+from .mips_index import PartitionedMIPSIndex
 
 logger = logging.getLogger(__name__)
 
+# Initial number of arm slots allocated in the stacked parameter arrays
+INITIAL_CAPACITY = 64
+
+# Scoring modes: score every arm, or only candidates from the MIPS index
+SCORING_MODES = ("exact", "approx")
+
+# Arms sampled per query to calibrate the approximate confidence bound
+CANDIDATE_SAMPLE_SIZE = 256
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k largest scores, best first"""
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+def ucb_scores(A_inv: np.ndarray, b: np.ndarray, X: np.ndarray, alpha: float) -> np.ndarray:
+    """Compute LinUCB scores for a stack of arms in a few vectorized operations
+
+    A_inv is (n, d, d), b and X are (n, d). Returns an (n,) array of UCB values.
+    """
+    theta = np.matmul(A_inv, b[:, :, None])[:, :, 0]
+    mean = np.einsum("ni,ni->n", X, theta)
+    A_inv_x = np.matmul(A_inv, X[:, :, None])[:, :, 0]
+    var = np.einsum("ni,ni->n", X, A_inv_x)
+    return mean + alpha * np.sqrt(np.maximum(var, 0.0))
+
 class LinUCB:
-    def __init__(self, redis_client: redis.Redis, alpha: float = 1.0):
+    def __init__(self, redis_client: redis.Redis, alpha: float = 1.0, subscribe: bool = True,
+                 feature_store: Optional[FeatureStore] = None,
+                 context_encoder: Optional[ContextEncoder] = None,
+                 mode: str = "exact", n_candidates: int = 256,
+                 namespace: Optional[str] = None):
+        if mode not in SCORING_MODES:
+            raise ValueError(f"Unknown scoring mode: {mode}")
         self.redis = redis_client
         self.alpha = alpha
-        self.d = 5  # Feature dimension (mood, stress, time of day, etc.)
-        self._load_state()
+        self.d = len(FEATURES)  # Feature dimension (mood, energy, time of day, genre, bias)
+        self.store = ArmStore(redis_client, self.d, namespace)
+        self.features = feature_store
+        self.contexts = context_encoder
+        self.mode = mode
+        self.n_candidates = n_candidates
+        self._rng = np.random.default_rng()
+        self.subscribe = subscribe
+
+        # State is hydrated from Redis on first use rather than at import time
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._stale = set()
+        self._stale_lock = threading.Lock()
+        self._listener = None
+
+        # Serializes reads and writes of the arm arrays across worker threads
+        self.lock = threading.RLock()
+        self._reset_arms()
+
+    def _reset_arms(self, capacity: int = INITIAL_CAPACITY):
+        """Allocate empty stacked arm parameters"""
+        self.arms: List[str] = []
+        self.arm_index: Dict[str, int] = {}
+        self.A = np.zeros((capacity, self.d, self.d))
+        self.A_inv = np.zeros((capacity, self.d, self.d))
+        self.b = np.zeros((capacity, self.d))
+        self.versions: Dict[str, int] = {}
+
+        # Feature store row of each arm, re-resolved when the store gains rows
+        self.feature_rows = np.full(capacity, -1, dtype=np.int64)
+        self._feature_generation = -1
+
+        # Candidate index for approximate scoring, maintained lazily from dirty arms
+        self._triu = np.triu_indices(self.d)
+        self.index = PartitionedMIPSIndex(self.d + len(self._triu[0]))
+        self._index_dirty = set()
+        self._index_generation = None
+
+    @property
+    def n_arms(self) -> int:
+        return len(self.arms)
+
+    def _append_arm(self, track_uri: str, A: np.ndarray, b: np.ndarray, A_inv: Optional[np.ndarray] = None):
+        """Append an arm, growing the stacked arrays geometrically when full"""
+        n = self.n_arms
+        if n == self.A.shape[0]:
+            capacity = max(INITIAL_CAPACITY, 2 * n)
+            A_new = np.zeros((capacity, self.d, self.d))
+            A_inv_new = np.zeros((capacity, self.d, self.d))
+            b_new = np.zeros((capacity, self.d))
+            rows_new = np.full(capacity, -1, dtype=np.int64)
+            A_new[:n] = self.A[:n]
+            A_inv_new[:n] = self.A_inv[:n]
+            b_new[:n] = self.b[:n]
+            rows_new[:n] = self.feature_rows[:n]
+            self.A, self.A_inv, self.b, self.feature_rows = A_new, A_inv_new, b_new, rows_new
+
+        self.A[n] = A
+        self.A_inv[n] = np.linalg.inv(A) if A_inv is None else A_inv
+        self.b[n] = b
+        if self.features is not None:
+            self.feature_rows[n] = self.features.index.get(track_uri, -1)
+        self.arm_index[track_uri] = n
+        self.arms.append(track_uri)
+        self._index_dirty.add(n)
 
     def _load_state(self):
         """Load bandit state from Redis"""
         try:
-            # Load A matrices
-            a_data = self.redis.get("bandit:A")
-            if a_data:
-                self.A = {k: np.array(v) for k, v in json.loads(a_data).items()}
-            else:
-                self.A = {}
-
-            # Load b vectors
-            b_data = self.redis.get("bandit:b")
-            if b_data:
-                self.b = {k: np.array(v) for k, v in json.loads(b_data).items()}
-            else:
-                self.b = {}
+            uris, A, A_inv, b, versions = self.store.load_all()
+            n = len(uris)
+            self._reset_arms(max(INITIAL_CAPACITY, n))
+            self.A[:n], self.A_inv[:n], self.b[:n] = A, A_inv, b
+            self.arms = uris
+            self.arm_index = {track_uri: i for i, track_uri in enumerate(uris)}
+            self.versions = {track_uri: versions.get(track_uri, 0) for track_uri in uris}
 
-        except (redis.RedisError, json.JSONDecodeError) as e:
+        except redis.RedisError as e:
             logger.error(f"Error loading bandit state: {e}")
-            self.A = {}
-            self.b = {}
+            self._reset_arms()
+
+    def _ensure_loaded(self):
+        """Hydrate state on first use, then apply any invalidations from other workers"""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    # Subscribe before loading so no write between the two is missed
+                    if self.subscribe:
+                        self._start_listener()
+                    self._load_state()
+                    self._loaded = True
+        self._refresh_stale()
+
+    def _start_listener(self):
+        """Listen for arm writes made by other workers"""
+        try:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.store.channel: self._on_invalidate})
+            self._listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+        except redis.RedisError as e:
+            logger.error(f"Error subscribing to bandit invalidations: {e}")
+
+    def _on_invalidate(self, message: Dict):
+        """Mark an arm stale when another worker wrote a newer version of it"""
+        parsed = self.store.parse_invalidation(message["data"])
+        if parsed is None:
+            return
+        track_uri, version = parsed
+        if version > self.versions.get(track_uri, 0):
+            with self._stale_lock:
+                self._stale.add(track_uri)
+
+    def _refresh_stale(self):
+        """Re-read only the arms invalidated since the last request"""
+        if not self._stale:
+            return
+        with self._stale_lock:
+            stale, self._stale = list(self._stale), set()
 
-    def _save_state(self):
-        """Save bandit state to Redis"""
         try:
-            # Save A matrices
-            a_data = {k: v.tolist() for k, v in self.A.items()}
-            self.redis.set("bandit:A", json.dumps(a_data))
+            arms = self.store.load_arms(stale)
+        except redis.RedisError as e:
+            logger.error(f"Error refreshing bandit state: {e}")
+            with self._stale_lock:
+                self._stale.update(stale)
+            return
+
+        for track_uri, (A, A_inv, b, version) in arms.items():
+            if version <= self.versions.get(track_uri, 0):
+                continue
+            i = self.arm_index.get(track_uri)
+            if i is None:
+                self._append_arm(track_uri, A, b, A_inv)
+            else:
+                self.A[i], self.A_inv[i], self.b[i] = A, A_inv, b
+                self._index_dirty.add(i)
+            self.versions[track_uri] = version
+
+    def close(self):
+        """Stop listening for invalidations"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
 
-            # Save b vectors
-            b_data = {k: v.tolist() for k, v in self.b.items()}
-            self.redis.set("bandit:b", json.dumps(b_data))
+    def _add_to_arms(self, deltas: Dict[str, Tuple[np.ndarray, np.ndarray]], local_fallback: bool = True):
+        """Add rewards (feature rows, sum of r x) to arms in Redis and adopt the merged parameters
 
-        except (redis.RedisError, json.JSONDecodeError) as e:
+        The merged arms include whatever other workers added meanwhile. If
+        Redis is unavailable the update is applied to the local copy only,
+        or with local_fallback off the RedisError propagates so the caller
+        can retry it.
+        """
+        try:
+            arms = self.store.add_to_arms(deltas)
+        except redis.RedisError as e:
+            if not local_fallback:
+                raise
             logger.error(f"Error saving bandit state: {e}")
+            for track_uri, (X, db) in deltas.items():
+                i = self.arm_index[track_uri]
+                self.A[i] += X.T @ X
+                self.b[i] += db
+                A_inv = sherman_morrison(self.A_inv[i], X)
+                self.A_inv[i] = np.linalg.inv(self.A[i]) if A_inv is None else A_inv
+                self._index_dirty.add(i)
+            return
+
+        for track_uri, (A, A_inv, b, version) in arms.items():
+            i = self.arm_index[track_uri]
+            self.A[i], self.A_inv[i], self.b[i] = A, A_inv, b
+            self.versions[track_uri] = version
+            self._index_dirty.add(i)
 
     def _get_features(self, track_uri: str) -> np.ndarray:
         """Get feature vector for a track"""
-        # TODO: Implement feature extraction based on track metadata
-        # For now, return random features
-        return np.random.rand(self.d)
+        if self.features is None:
+            return DEFAULT_FEATURES.astype(float)
+        return self.features.row(track_uri).astype(float)
+
+    def _get_feature_matrix(self, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """Get the feature matrix for every arm, or for the given arm indices, in one gather"""
+        n = self.n_arms
+        if self.features is not None and self._feature_generation != self.features.generation:
+            self._feature_generation = self.features.generation
+            self.feature_rows[:n] = self.features.resolve(self.arms)
+
+        rows = self.feature_rows[:n] if indices is None else self.feature_rows[indices]
+        if self.features is None:
+            return np.tile(DEFAULT_FEATURES.astype(float), (len(rows), 1))
+        return self.features.gather(rows).astype(float)
+
+    def _context_vector(self, context: Optional[Dict] = None) -> np.ndarray:
+        """Resolve a context dict to a (d,) vector
+
+        The dict may carry a precomputed "vector" or a "userId" whose cached
+        encoding is used; without either, the default user's context applies.
+        """
+        context = context or {}
+        if context.get("vector") is not None:
+            return np.asarray(context["vector"], dtype=float)
+        if self.contexts is None:
+            return np.ones(self.d)
+        return self.contexts.vector(context.get("userId", DEFAULT_USER))
 
     def add_choice(self, track_uri: str):
         """Add a track to the bandit's choice set"""
-        if track_uri not in self.A:
-            self.A[track_uri] = np.eye(self.d)
-            self.b[track_uri] = np.zeros(self.d)
-            self._save_state()
+        with self.lock:
+            self._ensure_loaded()
+            if track_uri not in self.arm_index:
+                self._append_arm(track_uri, np.eye(self.d), np.zeros(self.d), np.eye(self.d))
+                # Adopts the arm as stored if another worker already added it
+                self._add_to_arms({track_uri: (np.zeros((0, self.d)), np.zeros(self.d))})
 
-    def update(self, track_uri: str, reward: float):
+    def reward_features(self, track_uri: str, context: Optional[Dict] = None) -> np.ndarray:
+        """Get the context-weighted feature vector a reward for this track updates with"""
+        with self.lock:
+            self._ensure_loaded()
+            if track_uri not in self.arm_index:
+                raise ValueError(f"Track {track_uri} not in choice set")
+            return self._get_features(track_uri) * self._context_vector(context)
+
+    def update(self, track_uri: str, reward: float, context: Optional[Dict] = None):
         """Update bandit parameters with observed reward"""
-        if track_uri not in self.A:
-            raise ValueError(f"Track {track_uri} not in choice set")
+        with self.lock:
+            x = self.reward_features(track_uri, context)
 
-        try:
-            x = self._get_features(track_uri)
-            self.A[track_uri] += np.outer(x, x)
-            self.b[track_uri] += reward * x
-            self._save_state()
-        except Exception as e:
-            logger.error(f"Error updating bandit: {e}")
-            raise
+            try:
+                self._add_to_arms({track_uri: (x[None, :], reward * x)})
+            except Exception as e:
+                logger.error(f"Error updating bandit: {e}")
+                raise
+
+    def apply_batch(self, updates: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+        """Apply coalesced reward updates (feature rows, sum of r x) per arm
+
+        The updates are added to the stored arms in a single transaction, so
+        batches flushed by other workers meanwhile are kept. Raises
+        RedisError, with nothing applied, if they can't be stored.
+        """
+        with self.lock:
+            self._ensure_loaded()
+            known = {track_uri: update for track_uri, update in updates.items() if track_uri in self.arm_index}
+            if not known:
+                return
+
+            try:
+                self._add_to_arms(known, local_fallback=False)
+            except Exception as e:
+                logger.error(f"Error applying bandit batch: {e}")
+                raise
+
+    def score(self, context: Optional[Dict] = None, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """Score every arm in the choice set in arm order, or only the given arm indices"""
+        with self.lock:
+            if indices is None:
+                indices = slice(0, self.n_arms)
+            # Track features weighted by the context vector, for all arms at once
+            X = self._get_feature_matrix(indices) * self._context_vector(context)
+            return ucb_scores(self.A_inv[indices], self.b[indices], X, self.alpha)
+
+    def _sync_index(self):
+        """Bring the candidate index up to date with arms changed since the last query
+
+        With x = features * context, an arm's mean is context . (features * theta)
+        and its variance is the upper triangle of features_i A_inv_ij features_j
+        dotted with the upper triangle of context context^T. Both terms are
+        inner products with the context, so each arm is indexed by the
+        concatenation of the two vectors.
+        """
+        n = self.n_arms
+        generation = self.features.generation if self.features is not None else 0
+        rebuild = self._index_generation != generation or len(self.index) == 0
+        if rebuild:
+            ids = np.arange(n)
+        elif self._index_dirty:
+            ids = np.fromiter(self._index_dirty, dtype=np.int64)
+        else:
+            return
+        self._index_dirty = set()
+
+        A_inv = self.A_inv[ids]
+        X = self._get_feature_matrix(ids)
+        theta = np.matmul(A_inv, self.b[ids][:, :, None])[:, :, 0]
+        rows, cols = self._triu
+        variance = X[:, rows] * A_inv[:, rows, cols] * X[:, cols] * np.where(rows == cols, 1.0, 2.0)
+        vectors = np.hstack([X * theta, variance])
+        if rebuild:
+            self.index.build(vectors)
+            self._index_generation = generation
+        else:
+            self.index.upsert(ids, vectors)
+
+    def candidates(self, context: Optional[Dict] = None) -> np.ndarray:
+        """Arm indices worth exact UCB scoring in approximate mode
+
+        The confidence width sqrt(var) is bounded above by the tangent line
+        (var / t + t) / 2, which is linear in var, so MIPS over the index
+        ranks arms by an upper bound on their UCB. t is the 99th percentile
+        width of a small random sample of arms, which keeps the bound tight
+        for the arms that compete for the top spots.
+        """
+        with self.lock:
+            self._sync_index()
+            n = self.n_arms
+            c = self._context_vector(context)
+
+            sample = self._rng.choice(n, min(n, CANDIDATE_SAMPLE_SIZE), replace=False)
+            X = self._get_feature_matrix(sample) * c
+            widths = np.sqrt(np.einsum("ni,ni->n", X, np.matmul(self.A_inv[sample], X[:, :, None])[:, :, 0]))
+            t = max(np.quantile(widths, 0.99), 1e-6)
+
+            rows, cols = self._triu
+            query = np.concatenate([c, self.alpha * c[rows] * c[cols] / (2 * t)])
+            return self.index.search(query, self.n_candidates)
+
+    def candidate_indices(self, k: int, context: Optional[Dict] = None) -> np.ndarray:
+        """Arm indices to score exactly: MIPS candidates in approximate mode, else all arms"""
+        if self.mode == "approx" and self.n_arms > max(k, self.n_candidates):
+            return self.candidates(context)
+        return np.arange(self.n_arms)
+
+    def get_top_k(self, k: int, context: Optional[Dict] = None) -> List[str]:
+        """Get the k tracks with the highest UCB, best first"""
+        with self.lock:
+            self._ensure_loaded()
+            if not self.arms:
+                raise ValueError("No tracks in choice set")
+            if k < 1:
+                raise ValueError("k must be at least 1")
+
+            try:
+                indices = self.candidate_indices(k, context)
+                scores = self.score(context, indices)
+                return [self.arms[i] for i in indices[top_k_indices(scores, k)]]
+            except Exception as e:
+                logger.error(f"Error getting recommendation: {e}")
+                raise
 
     def get_recommendation(self, context: Optional[Dict] = None) -> str:
         """Get track recommendation using LinUCB algorithm"""
-        if not self.A:
-            raise ValueError("No tracks in choice set")
-
-        try:
-            max_ucb = float('-inf')
-            best_track = None
-
-            for track_uri in self.A:
-                A_inv = np.linalg.inv(self.A[track_uri])
-                theta = A_inv @ self.b[track_uri]
-                x = self._get_features(track_uri)
-                
-                # Calculate UCB
-                mean = x @ theta
-                std = np.sqrt(x @ A_inv @ x)
-                ucb = mean + self.alpha * std
-
-                if ucb > max_ucb:
-                    max_ucb = ucb
-                    best_track = track_uri
-
-            return best_track
-        except Exception as e:
-            logger.error(f"Error getting recommendation: {e}")
-            raise 
\ No newline at end of file
+        return self.get_top_k(1, context)[0]
@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import time
+from . import metrics
+from .bandit_pool import BanditPool
+from .reward_buffer import RewardBuffer
+
+logger = logging.getLogger(__name__)
+
+class BanditOverloaded(Exception):
+    """Raised when the bandit queue is full and a call is shed instead of queued"""
+
+class BanditExecutor:
+    """Runs blocking bandit work (Redis I/O, NumPy scoring and inversions) off the event loop
+
+    Calls go to a fixed thread pool. At most max_workers calls run at once
+    and at most max_queue more wait for a worker; beyond that, calls fail
+    fast with BanditOverloaded so callers can shed load instead of piling
+    up latency. Each call records how long it waited for a worker and how
+    long it computed.
+    """
+
+    def __init__(self, bandits: BanditPool, reward_buffer: Optional[RewardBuffer] = None,
+                 max_workers: int = 4, max_queue: int = 64):
+        self.bandits = bandits
+        self.reward_buffer = reward_buffer
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bandit")
+
+        # Only touched from the event loop thread
+        self._in_flight = 0
+
+        self.queue_wait = metrics.histogram("bandit.queue_wait_seconds")
+        self.compute_time = metrics.histogram("bandit.compute_seconds")
+        self.rejected = metrics.counter("bandit.rejected")
+        metrics.gauge("bandit.in_flight", lambda: self._in_flight)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _timed(self, enqueued: float, fn: Callable, args: Tuple, kwargs: Dict) -> Any:
+        started = time.perf_counter()
+        self.queue_wait.observe(started - enqueued)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.compute_time.observe(time.perf_counter() - started)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool, raises BanditOverloaded if the queue is full"""
+        if self._in_flight >= self.max_workers + self.max_queue:
+            self.rejected.inc()
+            raise BanditOverloaded(f"Bandit queue full ({self._in_flight} calls in flight)")
+
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._timed, time.perf_counter(), fn, args, kwargs)
+        finally:
+            self._in_flight -= 1
+
+    async def add_choice(self, user_id: str, track_uri: str):
+        await self.run(self.bandits.add_choice, user_id, track_uri)
+
+    async def update(self, user_id: str, track_uri: str, reward: float, context: Optional[Dict] = None):
+        await self.run(self.bandits.update, user_id, track_uri, reward, context)
+
+    async def get_top_k(self, user_id: str, k: int, context: Optional[Dict] = None) -> List[str]:
+        return await self.run(self.bandits.get_top_k, user_id, k, context)
+
+    async def add_rewards(self, rewards: List[Tuple[str, float]], user_id: str) -> List[str]:
+        """Buffer rewards (and flush if due), returns the URIs rejected as unknown tracks"""
+        return await self.run(self.reward_buffer.add_many, rewards, user_id)
+
+    async def flush_rewards(self) -> int:
+        return await self.run(self.reward_buffer.flush)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,163 @@
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import redis
+import logging
+import threading
+from .bandit import LinUCB, top_k_indices
+from .context import DEFAULT_USER
+
+logger = logging.getLogger(__name__)
+
+class BanditPool:
+    """Per-user LinUCB models with an LRU of hot models in memory
+
+    Each user's arms live under their own Redis keys (see
+    namespaced_keys), so users never contend on the same hash. Models are
+    hydrated lazily on first use and evicted least-recently-used once
+    more than max_models are held.
+
+    In hybrid mode a shared model learns from every user's rewards and
+    scores the whole catalog. Arms a user has personal history for are
+    blended as (1 - personal_weight) * shared + personal_weight * personal.
+    """
+
+    def __init__(self, redis_client: redis.Redis, max_models: int = 256, hybrid: bool = True,
+                 personal_weight: float = 0.5, subscribe: bool = True, **bandit_kwargs):
+        self.redis = redis_client
+        self.max_models = max_models
+        self.hybrid = hybrid
+        self.personal_weight = personal_weight
+        self.subscribe = subscribe
+        self.bandit_kwargs = bandit_kwargs
+
+        self.shared = LinUCB(redis_client, subscribe=False, **bandit_kwargs) if hybrid else None
+        self.models: "OrderedDict[str, LinUCB]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def _ensure_listener(self):
+        """One pattern subscription covers the shared model and every user model"""
+        if not self.subscribe or self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is not None:
+                return
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(**{"bandit:*invalidate": self._on_invalidate})
+                self._listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+            except redis.RedisError as e:
+                logger.error(f"Error subscribing to bandit invalidations: {e}")
+
+    def _on_invalidate(self, message: Dict):
+        channel = message["channel"]
+        channel = channel.decode() if isinstance(channel, bytes) else channel
+        if self.shared is not None and channel == self.shared.store.channel:
+            self.shared._on_invalidate(message)
+            return
+        if "{" in channel:
+            user_id = channel[channel.index("{") + 1:channel.rindex("}")]
+            model = self.models.get(user_id)
+            if model is not None:
+                model._on_invalidate(message)
+
+    def get(self, user_id: str = DEFAULT_USER) -> LinUCB:
+        """Get a user's model, loading it on a miss and evicting the coldest model if full"""
+        self._ensure_listener()
+        with self._lock:
+            model = self.models.get(user_id)
+            if model is not None:
+                self.models.move_to_end(user_id)
+                return model
+
+            model = LinUCB(self.redis, subscribe=False, namespace=user_id, **self.bandit_kwargs)
+            self.models[user_id] = model
+            while len(self.models) > self.max_models:
+                evicted_id, evicted = self.models.popitem(last=False)
+                evicted.close()
+                logger.info(f"Evicted bandit model for user {evicted_id}")
+            return model
+
+    def _context(self, user_id: str, context: Optional[Dict]) -> Dict:
+        return {"userId": user_id, **(context or {})}
+
+    def add_choice(self, user_id: str, track_uri: str):
+        """Add a track to the user's choice set, and the shared one in hybrid mode"""
+        if self.shared is not None:
+            self.shared.add_choice(track_uri)
+        self.get(user_id).add_choice(track_uri)
+
+    def _personal(self, user_id: str, track_uri: str) -> LinUCB:
+        """The user's model, adopting the track from the shared catalog if needed"""
+        model = self.get(user_id)
+        if self.shared is not None:
+            with self.shared.lock:
+                self.shared._ensure_loaded()
+                shared_arm = track_uri in self.shared.arm_index
+            if shared_arm:
+                model.add_choice(track_uri)
+        return model
+
+    def update(self, user_id: str, track_uri: str, reward: float, context: Optional[Dict] = None):
+        """Update the user's model (and the shared model) with an observed reward"""
+        context = self._context(user_id, context)
+        self._personal(user_id, track_uri).update(track_uri, reward, context)
+        if self.shared is not None:
+            self.shared.update(track_uri, reward, context)
+
+    def reward_features(self, user_id: str, track_uri: str, context: Optional[Dict] = None) -> np.ndarray:
+        """Feature vector a reward updates with; raises ValueError for unknown tracks"""
+        return self._personal(user_id, track_uri).reward_features(track_uri, self._context(user_id, context))
+
+    def apply_batch(self, user_id: str, updates: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+        """Apply coalesced reward updates (feature rows, sum of r x) to one user's model"""
+        self.get(user_id).apply_batch(updates)
+
+    def apply_shared_batch(self, updates: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+        """Apply coalesced reward updates from any users to the shared model, if hybrid"""
+        if self.shared is not None:
+            self.shared.apply_batch(updates)
+
+    def get_top_k(self, user_id: str, k: int, context: Optional[Dict] = None) -> List[str]:
+        """Get the user's k best tracks, best first"""
+        context = self._context(user_id, context)
+        model = self.get(user_id)
+        if self.shared is None:
+            return model.get_top_k(k, context)
+
+        shared = self.shared
+        # Shared before personal, the same order everywhere both are held
+        with shared.lock, model.lock:
+            shared._ensure_loaded()
+            model._ensure_loaded()
+            if not shared.arms:
+                raise ValueError("No tracks in choice set")
+            if k < 1:
+                raise ValueError("k must be at least 1")
+
+            # Arms the user has personal history for, located in the shared model
+            personal_uris = [uri for uri in model.arms if uri in shared.arm_index]
+            personal = np.array([shared.arm_index[uri] for uri in personal_uris], dtype=np.int64)
+
+            indices = shared.candidate_indices(k, context)
+            if len(indices) < shared.n_arms:
+                indices = np.union1d(indices, personal)
+            scores = shared.score(context, indices)
+
+            if len(personal) and self.personal_weight > 0:
+                positions = np.searchsorted(indices, personal) if len(indices) < shared.n_arms else personal
+                personal_scores = model.score(context, np.array([model.arm_index[uri] for uri in personal_uris]))
+                w = self.personal_weight
+                scores[positions] = (1 - w) * scores[positions] + w * personal_scores
+
+            return [shared.arms[i] for i in indices[top_k_indices(scores, k)]]
+
+    def get_recommendation(self, user_id: str, context: Optional[Dict] = None) -> str:
+        return self.get_top_k(user_id, 1, context)[0]
+
+    def close(self):
+        """Stop the invalidation listener"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
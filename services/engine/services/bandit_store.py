@@ -0,0 +1,214 @@
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+import redis
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Hash holding one field per arm: packed float64 A, A_inv and b
+ARMS_KEY = "bandit:arms"
+
+# Hash of per-arm version counters, bumped in the same transaction as each write
+VERSIONS_KEY = "bandit:versions"
+
+# Pub/sub channel announcing "<version> <track_uri>" after every arm write
+INVALIDATE_CHANNEL = "bandit:invalidate"
+
+# Attempts at a compare-and-set arm update before giving up under contention
+CAS_RETRIES = 20
+
+# Writes to an arm between full re-inversions of its A, bounding rank-one update drift
+REINVERT_EVERY = 1000
+
+# Whole-blob JSON keys written by earlier versions of the bandit
+LEGACY_KEYS = ("bandit:A", "bandit:b", "bandit:A_inv")
+
+def namespaced_keys(namespace: Optional[str] = None) -> Tuple[str, str, str]:
+    """Arms key, versions key and invalidation channel for a bandit namespace
+
+    The namespace (a user ID) is wrapped in a hash tag so all of one
+    user's keys land in the same Redis Cluster slot while different users
+    spread across the cluster.
+    """
+    if namespace is None:
+        return ARMS_KEY, VERSIONS_KEY, INVALIDATE_CHANNEL
+    tag = f"{{{namespace}}}"
+    return f"bandit:{tag}:arms", f"bandit:{tag}:versions", f"bandit:{tag}:invalidate"
+
+def sherman_morrison(A_inv: np.ndarray, X: np.ndarray) -> Optional[np.ndarray]:
+    """Apply A += x x^T for each row x of X to the inverse A_inv in O(d^2) per row
+
+    Returns None if an update is numerically unsound, in which case the
+    caller should invert A directly.
+    """
+    A_inv = A_inv.copy()
+    for x in X:
+        A_inv_x = A_inv @ x
+        denominator = 1.0 + x @ A_inv_x
+        if not np.isfinite(denominator) or denominator <= 0:
+            return None
+        A_inv -= np.outer(A_inv_x, A_inv_x) / denominator
+    return A_inv
+
+class ArmStore:
+    """Per-arm Redis storage for LinUCB parameters
+
+    Each arm is a single hash field, so an update rewrites only that arm's
+    2*d*d + d float64 values instead of the whole model. The client must be
+    created without decode_responses since fields hold raw bytes.
+    """
+
+    def __init__(self, redis_client: redis.Redis, d: int, namespace: Optional[str] = None):
+        self.redis = redis_client
+        self.d = d
+        self.namespace = namespace
+        self.key, self.versions_key, self.channel = namespaced_keys(namespace)
+        self.width = 2 * d * d + d
+
+    def pack(self, A: np.ndarray, A_inv: np.ndarray, b: np.ndarray) -> bytes:
+        """Pack one arm's parameters into little-endian float64 bytes"""
+        return np.concatenate([A.ravel(), A_inv.ravel(), b]).astype("<f8").tobytes()
+
+    def unpack_many(self, payloads: List[bytes]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Unpack a list of packed arms into stacked (n, d, d), (n, d, d) and (n, d) arrays"""
+        d, dd = self.d, self.d * self.d
+        flat = np.frombuffer(b"".join(payloads), dtype="<f8").reshape(len(payloads), self.width)
+        A = flat[:, :dd].reshape(-1, d, d)
+        A_inv = flat[:, dd:2 * dd].reshape(-1, d, d)
+        b = flat[:, 2 * dd:]
+        return A, A_inv, b
+
+    def load_all(self) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, Dict[str, int]]:
+        """Load every arm and its version, migrating legacy blob state first if present"""
+        if self.namespace is None:
+            self.migrate_legacy()
+
+        uris, payloads = [], []
+        for field, payload in self.redis.hscan_iter(self.key, count=1000):
+            uris.append(_decode(field))
+            payloads.append(payload)
+        versions = {_decode(k): int(v) for k, v in self.redis.hgetall(self.versions_key).items()}
+
+        A, A_inv, b = self.unpack_many(payloads)
+        return uris, A, A_inv, b, versions
+
+    def load_arms(self, track_uris: List[str]) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray, int]]:
+        """Load a subset of arms in one round trip, skipping arms that no longer exist"""
+        with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hmget(self.key, track_uris)
+            pipe.hmget(self.versions_key, track_uris)
+            payloads, versions = pipe.execute()
+
+        found = [(uri, p, int(v or 0)) for uri, p, v in zip(track_uris, payloads, versions) if p is not None]
+        if not found:
+            return {}
+        A, A_inv, b = self.unpack_many([p for _, p, _ in found])
+        return {
+            uri: (A[i], A_inv[i], b[i], version)
+            for i, (uri, _, version) in enumerate(found)
+        }
+
+    def add_to_arms(self, deltas: Dict[str, Tuple[np.ndarray, np.ndarray]]
+                    ) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray, int]]:
+        """Atomically add rewards to stored arms and notify other workers
+
+        deltas maps each arm to the (m, d) feature rows of its rewards and
+        their summed r x. The stored arms are read, updated and written back
+        under WATCH, and the whole step is retried if another worker wrote in
+        between, so concurrent rewards are never overwritten. A_inv follows
+        by one Sherman-Morrison update per row and is recomputed from A every
+        REINVERT_EVERY writes to the arm. Arms not stored yet start from the
+        identity prior. Returns each arm's merged A, A_inv, b and new version.
+        """
+        uris = list(deltas)
+        for _ in range(CAS_RETRIES):
+            with self.redis.pipeline(transaction=True) as pipe:
+                try:
+                    # Versions change in the same transaction as arms, so watching arms covers both
+                    pipe.watch(self.key)
+                    payloads = pipe.hmget(self.key, uris)
+                    stored_versions = [int(v or 0) for v in pipe.hmget(self.versions_key, uris)]
+                    A = np.stack([np.eye(self.d)] * len(uris))
+                    A_inv = A.copy()
+                    b = np.zeros((len(uris), self.d))
+                    stored = [i for i, payload in enumerate(payloads) if payload is not None]
+                    if stored:
+                        A[stored], A_inv[stored], b[stored] = self.unpack_many([payloads[i] for i in stored])
+                    for i, uri in enumerate(uris):
+                        X, db = deltas[uri]
+                        A[i] += X.T @ X
+                        b[i] += db
+                        updated = None
+                        if (stored_versions[i] + 1) % REINVERT_EVERY:
+                            updated = sherman_morrison(A_inv[i], X)
+                        A_inv[i] = np.linalg.inv(A[i]) if updated is None else updated
+
+                    pipe.multi()
+                    pipe.hset(self.key, mapping={uri: self.pack(A[i], A_inv[i], b[i]) for i, uri in enumerate(uris)})
+                    for uri in uris:
+                        pipe.hincrby(self.versions_key, uri, 1)
+                    versions = pipe.execute()[1:]
+                except redis.WatchError:
+                    continue
+
+            with self.redis.pipeline(transaction=False) as pipe:
+                for uri, version in zip(uris, versions):
+                    pipe.publish(self.channel, f"{version} {uri}")
+                pipe.execute()
+            return {uri: (A[i], A_inv[i], b[i], versions[i]) for i, uri in enumerate(uris)}
+
+        raise redis.WatchError(f"Gave up updating {len(uris)} bandit arms after {CAS_RETRIES} conflicts")
+
+    @staticmethod
+    def parse_invalidation(data) -> Optional[Tuple[str, int]]:
+        """Parse an invalidation message into (track_uri, version)"""
+        try:
+            version, track_uri = _decode(data).split(" ", 1)
+            return track_uri, int(version)
+        except ValueError:
+            logger.warning(f"Ignoring malformed bandit invalidation: {data!r}")
+            return None
+
+    def migrate_legacy(self) -> int:
+        """One-time migration from the JSON blob keys to per-arm hash fields
+
+        Returns the number of arms migrated. Legacy keys are removed in the
+        same transaction, so the migration runs at most once.
+        """
+        a_data = self.redis.get(LEGACY_KEYS[0])
+        if not a_data:
+            return 0
+
+        try:
+            A = json.loads(a_data)
+            b_data = self.redis.get(LEGACY_KEYS[1])
+            a_inv_data = self.redis.get(LEGACY_KEYS[2])
+            b = json.loads(b_data) if b_data else {}
+            A_inv = json.loads(a_inv_data) if a_inv_data else {}
+        except json.JSONDecodeError as e:
+            logger.error(f"Skipping bandit migration, legacy state is corrupt: {e}")
+            return 0
+
+        fields = {}
+        for track_uri, a in A.items():
+            a = np.array(a, dtype=float)
+            a_inv = A_inv.get(track_uri)
+            fields[track_uri] = self.pack(
+                a,
+                np.array(a_inv, dtype=float) if a_inv is not None else np.linalg.inv(a),
+                np.array(b.get(track_uri, np.zeros(self.d)), dtype=float)
+            )
+
+        with self.redis.pipeline(transaction=True) as pipe:
+            if fields:
+                pipe.hset(self.key, mapping=fields)
+                pipe.hset(self.versions_key, mapping={uri: 1 for uri in fields})
+            pipe.delete(*LEGACY_KEYS)
+            pipe.execute()
+
+        logger.info(f"Migrated {len(fields)} bandit arms to {self.key}")
+        return len(fields)
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
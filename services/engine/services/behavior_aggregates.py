@@ -0,0 +1,185 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+import redis.asyncio as aioredis
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Behavioral fields summed per bucket, and the average each one is reported as
+FIELDS = {
+    "typingSpeed": "avgTypingSpeed",
+    "backspaceRate": "avgBackspaceRate",
+    "scrollRate": "avgScrollRate",
+    "idleMs": "avgIdleTime",
+    "focusMs": "avgFocusTime"
+}
+
+# Raw metrics for a day, kept for offline training (scripts/train_mood_classifier.py)
+RAW_KEY = "metrics:{date}"
+
+# Hash of running sums for a day. Fields "count" and "sum:<field>" cover
+# the whole day, "<HH>:count" and "<HH>:sum:<field>" each hour of it.
+# "legacy" is how many raw entries predate aggregation, "folded" marks
+# that they have been added in
+AGGREGATE_KEY = "metrics:agg:{date}"
+
+# Raw entries read per LRANGE when folding in a day that predates aggregation
+FOLD_BATCH = 1000
+
+# KEYS: raw list, aggregate hash. ARGV: raw entry, then field, increment pairs
+RECORD_SCRIPT = """
+if redis.call('HEXISTS', KEYS[2], 'legacy') == 0 then
+    redis.call('HSET', KEYS[2], 'legacy', redis.call('LLEN', KEYS[1]))
+end
+redis.call('RPUSH', KEYS[1], ARGV[1])
+for i = 2, #ARGV, 2 do
+    redis.call('HINCRBYFLOAT', KEYS[2], ARGV[i], ARGV[i + 1])
+end
+"""
+
+# KEYS: raw list, aggregate hash. Returns how many raw entries the caller
+# must fold in, claiming them so no other reader does the same
+CLAIM_SCRIPT = """
+if redis.call('HEXISTS', KEYS[2], 'folded') == 1 then
+    return 0
+end
+local legacy = redis.call('HGET', KEYS[2], 'legacy')
+if not legacy then
+    legacy = redis.call('LLEN', KEYS[1])
+    if legacy == 0 then
+        return 0
+    end
+    redis.call('HSET', KEYS[2], 'legacy', legacy)
+end
+redis.call('HSET', KEYS[2], 'folded', 1)
+return tonumber(legacy)
+"""
+
+def increments(metric: Dict[str, Any], hour: Optional[int]) -> Dict[str, float]:
+    """Hash increments for one metric; missing or non-numeric fields count as 0, as they always have"""
+    deltas = {"count": 1.0}
+    for name in FIELDS:
+        value = metric.get(name, 0)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value:
+            deltas[f"sum:{name}"] = float(value)
+    if hour is not None:
+        deltas.update({f"{hour:02d}:{field}": delta for field, delta in list(deltas.items())})
+    return deltas
+
+def averages(buckets: Iterable[Dict[str, str]]) -> Dict[str, float]:
+    """Averages over the buckets' count and sum fields, 0 when there is nothing"""
+    count = 0.0
+    sums = dict.fromkeys(FIELDS, 0.0)
+    for bucket in buckets:
+        count += float(bucket.get("count", 0))
+        for name in FIELDS:
+            sums[name] += float(bucket.get(f"sum:{name}", 0))
+    return {average: sums[name] / count if count else 0 for name, average in FIELDS.items()}
+
+def _hour_of(metric: Dict[str, Any]) -> Optional[int]:
+    timestamp = metric.get("timestamp")
+    if isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)):
+        return None
+    try:
+        return datetime.fromtimestamp(timestamp / 1000).hour
+    except (OverflowError, OSError, ValueError):
+        return None
+
+class BehaviorAggregates:
+    """Per-day and per-hour running sums of behavioral metrics, maintained at ingest
+
+    Recording a metric appends it to the day's raw list and bumps the day's
+    and hour's sums and count in one script, so reading any window sums
+    one small hash per day instead of decoding every raw entry. Days
+    recorded before aggregation existed are folded in from their raw list
+    the first time a read covers them.
+    """
+
+    def __init__(self, redis_client: aioredis.Redis):
+        self.redis = redis_client
+        self._record = redis_client.register_script(RECORD_SCRIPT)
+        self._claim = redis_client.register_script(CLAIM_SCRIPT)
+
+    @staticmethod
+    def _keys(date: str) -> List[str]:
+        return [RAW_KEY.format(date=date), AGGREGATE_KEY.format(date=date)]
+
+    async def record(self, metric: Dict[str, Any], at: Optional[datetime] = None):
+        at = at or datetime.now()
+        args = [json.dumps(metric)]
+        for field, delta in increments(metric, at.hour).items():
+            args += [field, repr(delta)]
+        await self._record(keys=self._keys(at.strftime("%Y%m%d")), args=args)
+
+    async def _fold(self, date: str, legacy: int):
+        """Add a day's first legacy raw entries, recorded before aggregation, to its sums"""
+        raw_key, aggregate_key = self._keys(date)
+        for start in range(0, legacy, FOLD_BATCH):
+            totals: Dict[str, float] = {}
+            for raw in await self.redis.lrange(raw_key, start, min(start + FOLD_BATCH, legacy) - 1):
+                try:
+                    metric = json.loads(raw)
+                except json.JSONDecodeError:
+                    # Counted towards the day's average all the same, as insights always did
+                    logger.warning(f"Failed to decode metric: {raw}")
+                    metric = {}
+                for field, delta in increments(metric, _hour_of(metric)).items():
+                    totals[field] = totals.get(field, 0.0) + delta
+            if totals:
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    for field, delta in totals.items():
+                        pipe.hincrbyfloat(aggregate_key, field, delta)
+                    await pipe.execute()
+
+    async def _buckets(self, dates: List[str]) -> List[Dict[str, str]]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for date in dates:
+                pipe.hgetall(AGGREGATE_KEY.format(date=date))
+            buckets = await pipe.execute()
+
+        unfolded = [i for i, bucket in enumerate(buckets) if "folded" not in bucket]
+        if not unfolded:
+            return buckets
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for i in unfolded:
+                await self._claim(keys=self._keys(dates[i]), client=pipe)
+            claimed = await pipe.execute()
+
+        refetch = []
+        for i, legacy in zip(unfolded, claimed):
+            if legacy:
+                await self._fold(dates[i], legacy)
+                refetch.append(i)
+        if refetch:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for i in refetch:
+                    pipe.hgetall(AGGREGATE_KEY.format(date=dates[i]))
+                for i, bucket in zip(refetch, await pipe.execute()):
+                    buckets[i] = bucket
+        return buckets
+
+    async def window(self, since: datetime, until: Optional[datetime] = None, hourly: bool = False) -> Dict[str, float]:
+        """Averages over every day from since's to until's (default today)
+
+        With hourly, the first day only counts from since's hour on. Raw
+        entries folded in without a numeric timestamp have no hour, so
+        they don't count then.
+        """
+        until = until or datetime.now()
+        dates = []
+        day = since.replace(hour=0, minute=0, second=0, microsecond=0)
+        while day <= until:
+            dates.append(day.strftime("%Y%m%d"))
+            day += timedelta(days=1)
+        if not dates:
+            return averages([])
+
+        buckets = await self._buckets(dates)
+        if hourly:
+            first = buckets[0]
+            buckets[0:1] = [
+                {field[3:]: value for field, value in first.items() if field.startswith(f"{hour:02d}:")}
+                for hour in range(since.hour, 24)
+            ]
+        return averages(buckets)
@@ -0,0 +1,235 @@
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Optional
+import redis
+from redis.client import Pipeline
+import asyncio
+import logging
+import math
+import threading
+from .feature_store import FEATURES
+
+logger = logging.getLogger(__name__)
+
+# User whose context applies when a scoring request names none
+DEFAULT_USER = "default"
+
+# (valence, arousal) of each mood id, in [0, 1]
+MOOD_AFFECT = {
+    "happy": (0.9, 0.7),
+    "calm": (0.7, 0.2),
+    "energetic": (0.8, 0.95),
+    "focused": (0.6, 0.5),
+    "relaxed": (0.75, 0.25),
+    "stressed": (0.2, 0.8),
+    "sad": (0.15, 0.2),
+    "anxious": (0.2, 0.75),
+    "angry": (0.1, 0.9),
+    "romantic": (0.8, 0.4),
+    "dreamy": (0.65, 0.3),
+    "neutral": (0.5, 0.5)
+}
+
+# Hash of user ID -> energy ceiling, so a worker can recover a user it never saw or evicted
+ENERGY_CEILINGS_KEY = "context:energy_ceilings"
+
+# Stress level of the latest check-in
+STRESS_KEY = "context:stress_level"
+
+# Keys the mood endpoints write the current manual and AI-detected mood to
+MOOD_KEYS = ("current_mood_manual", "current_mood_ai")
+
+# Pub/sub channel announcing context changes to every worker: a user ID
+# whose energy ceiling changed, or an empty message for moods and stress
+INVALIDATE_CHANNEL = "context:invalidate"
+
+# User contexts held in memory; the least recently used are dropped beyond this
+MAX_USERS = 10000
+
+class UserContext:
+    def __init__(self, energy_ceiling: int = 100):
+        self.energy_ceiling = energy_ceiling
+        self.vector: Optional[np.ndarray] = None
+        self.hour: Optional[int] = None
+        # Encoder revision the cached vector was built at
+        self.revision = -1
+
+class ContextEncoder:
+    """Per-user context vectors for the contextual bandit
+
+    Vectors line up with the track feature columns (valence, energy,
+    daytime, genre, bias) so scoring is a single elementwise product.
+    Moods and stress come from the mood and check-in endpoints, which
+    aren't per user, so every user shares them; the energy ceiling is each
+    user's own preference. All of it lives in Redis, and every change is
+    announced on INVALIDATE_CHANNEL so each worker re-reads it on its next
+    scoring call. Each user's vector is cached and only rebuilt after such
+    a change, or when the hour of day rolls over.
+
+    vector() runs on bandit worker threads and may read Redis. The on_*
+    handlers are called from the event loop, so their Redis writes run in
+    the default executor.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None, max_users: int = MAX_USERS,
+                 subscribe: bool = True):
+        self.redis = redis_client
+        self.max_users = max_users
+        self.subscribe = subscribe
+        self.mood_manual: Optional[str] = None
+        self.mood_ai: Optional[str] = None
+        self.stress_level: Optional[int] = None
+        # Bumped by every shared update, invalidating all cached vectors at once
+        self._revision = 0
+        # Set when the shared moods and stress must be re-read from Redis
+        self._stale = True
+        self.users: "OrderedDict[str, UserContext]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def _start_listener(self):
+        """Listen for context changes made by other workers"""
+        try:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATE_CHANNEL: self._on_invalidate})
+            self._listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+        except redis.RedisError as e:
+            logger.error(f"Error subscribing to context invalidations: {e}")
+
+    def _on_invalidate(self, message: Dict):
+        user_id = message["data"]
+        user_id = user_id.decode() if isinstance(user_id, bytes) else user_id
+        if user_id:
+            # Reloaded with its new energy ceiling on next use
+            with self._lock:
+                self.users.pop(user_id, None)
+        else:
+            self._stale = True
+
+    def close(self):
+        """Stop listening for context changes"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def _refresh(self):
+        """Re-read the shared moods and stress from Redis if another worker changed them"""
+        if not self._stale or self.redis is None:
+            return
+        # Subscribe before reading so no change between the two is missed
+        if self.subscribe and self._listener is None:
+            self._start_listener()
+        self._stale = False
+        try:
+            manual, ai, stress_level = self.redis.mget(*MOOD_KEYS, STRESS_KEY)
+        except redis.RedisError as e:
+            logger.error(f"Error loading mood context: {e}")
+            self._stale = True
+            return
+        self.mood_manual = manual.decode() if isinstance(manual, bytes) else manual
+        self.mood_ai = ai.decode() if isinstance(ai, bytes) else ai
+        if stress_level is not None:
+            self.stress_level = int(stress_level)
+        self._revision += 1
+
+    def _load_energy_ceiling(self, user_id: str) -> int:
+        if self.redis is None:
+            return 100
+        try:
+            energy_ceiling = self.redis.hget(ENERGY_CEILINGS_KEY, user_id)
+        except redis.RedisError as e:
+            logger.error(f"Error loading energy ceiling: {e}")
+            return 100
+        return 100 if energy_ceiling is None else int(energy_ceiling)
+
+    def _user(self, user_id: str) -> UserContext:
+        with self._lock:
+            user = self.users.get(user_id)
+            if user is not None:
+                self.users.move_to_end(user_id)
+                return user
+
+        loaded = UserContext(self._load_energy_ceiling(user_id))
+        return self._remember(user_id, loaded)
+
+    def _remember(self, user_id: str, user: UserContext, replace: bool = False) -> UserContext:
+        with self._lock:
+            if replace:
+                self.users[user_id] = user
+            else:
+                user = self.users.setdefault(user_id, user)
+            self.users.move_to_end(user_id)
+            while len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+            return user
+
+    def _execute(self, queue: Callable[[Pipeline], Pipeline]):
+        try:
+            with self.redis.pipeline(transaction=False) as pipe:
+                queue(pipe).execute()
+        except redis.RedisError as e:
+            logger.error(f"Error saving context: {e}")
+
+    async def _write(self, queue: Callable[[Pipeline], Pipeline]):
+        """Run the writes queue adds to a pipeline in the default executor, off the event loop"""
+        if self.redis is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._execute, queue)
+
+    async def on_mood(self, mood_id: str, source: str = "manual"):
+        """Apply a mood the caller has already stored under its MOOD_KEYS key"""
+        if source == "manual":
+            self.mood_manual = mood_id
+        else:
+            self.mood_ai = mood_id
+        self._revision += 1
+        await self._write(lambda pipe: pipe.publish(INVALIDATE_CHANNEL, ""))
+
+    async def on_checkin(self, stress_level: int):
+        self.stress_level = stress_level
+        self._revision += 1
+        await self._write(lambda pipe: pipe.set(STRESS_KEY, stress_level).publish(INVALIDATE_CHANNEL, ""))
+
+    async def seed_stress(self, stress_level: int):
+        """Seed stress from the latest stored check-in, unless Redis already holds one"""
+        if self.stress_level is None:
+            self.stress_level = stress_level
+            self._revision += 1
+        await self._write(lambda pipe: pipe.set(STRESS_KEY, stress_level, nx=True))
+
+    async def on_preferences(self, energy_ceiling: int, user_id: str = DEFAULT_USER):
+        self._remember(user_id, UserContext(energy_ceiling), replace=True)
+        await self._write(
+            lambda pipe: pipe.hset(ENERGY_CEILINGS_KEY, user_id, energy_ceiling).publish(INVALIDATE_CHANNEL, user_id)
+        )
+
+    def vector(self, user_id: str = DEFAULT_USER, now: Optional[datetime] = None) -> np.ndarray:
+        """Get the cached context vector for a user"""
+        self._refresh()
+        user = self._user(user_id)
+        hour = (now or datetime.now()).hour
+        revision = self._revision
+        if user.vector is None or user.hour != hour or user.revision != revision:
+            user.vector = self.encode(user, hour)
+            user.hour, user.revision = hour, revision
+        return user.vector
+
+    def encode(self, user: UserContext, hour: int) -> np.ndarray:
+        """Build a context vector from the shared mood and stress, a user's energy ceiling and the hour"""
+        # Manual mood overrides the AI-detected one, as in /api/moods/current
+        mood_id = self.mood_manual or self.mood_ai or "neutral"
+        valence, arousal = MOOD_AFFECT.get(mood_id, MOOD_AFFECT["neutral"])
+
+        # High stress (4-5) pulls the energy target down, the ceiling caps it
+        if self.stress_level is not None:
+            arousal *= 1 - (self.stress_level - 1) / 8
+        energy = min(arousal, user.energy_ceiling / 100)
+
+        # 1.0 in the early afternoon, 0.0 in the middle of the night
+        daytime = 0.5 + 0.5 * math.cos(2 * math.pi * (hour - 14) / 24)
+
+        x = np.ones(len(FEATURES))
+        x[FEATURES.index("valence")] = valence
+        x[FEATURES.index("energy")] = energy
+        x[FEATURES.index("daytime")] = daytime
+        return x
@@ -0,0 +1,63 @@
+from typing import AsyncIterator, Optional
+from sqlalchemy import MetaData
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+import logging
+
+logger = logging.getLogger(__name__)
+
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[async_sessionmaker] = None
+
+def create_engine(url: str, pool_size: int = 10, max_overflow: int = 20, pool_timeout: float = 5.0,
+                  pool_recycle: int = 1800, statement_cache_size: int = 500) -> AsyncEngine:
+    """Build a pooled async engine for DATABASE_URL
+
+    statement_cache_size bounds SQLAlchemy's compiled statement cache, and
+    on asyncpg also the per-connection prepared statement cache, so hot
+    queries skip both compilation and server-side parsing.
+    """
+    kwargs = {"query_cache_size": statement_cache_size, "pool_pre_ping": True}
+    if url.startswith("sqlite") and ":memory:" in url:
+        # One shared connection, otherwise each checkout sees a new empty database
+        kwargs.update(poolclass=StaticPool, connect_args={"check_same_thread": False})
+    else:
+        kwargs.update(pool_size=pool_size, max_overflow=max_overflow,
+                      pool_timeout=pool_timeout, pool_recycle=pool_recycle)
+    if url.startswith("postgresql+asyncpg"):
+        kwargs["connect_args"] = {"prepared_statement_cache_size": statement_cache_size}
+    return create_async_engine(url, **kwargs)
+
+def init_engine(url: str, **kwargs) -> AsyncEngine:
+    """Create the process-wide engine and session factory"""
+    global _engine, _session_factory
+    _engine = create_engine(url, **kwargs)
+    # Handlers return ORM objects after committing, so keep their loaded state
+    _session_factory = async_sessionmaker(_engine, expire_on_commit=False)
+    return _engine
+
+async def dispose_engine():
+    global _engine, _session_factory
+    if _engine is not None:
+        await _engine.dispose()
+        _engine, _session_factory = None, None
+
+async def create_tables(metadata: MetaData):
+    async with _engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+
+def open_session() -> AsyncSession:
+    """New session for code outside a request (background tasks, socket events)
+
+    Use as ``async with open_session() as db:``.
+    """
+    if _session_factory is None:
+        raise RuntimeError("Database engine not initialized")
+    return _session_factory()
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency yielding one session per request"""
+    if _session_factory is None:
+        raise RuntimeError("Database engine not initialized")
+    async with _session_factory() as session:
+        yield session
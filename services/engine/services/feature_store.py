@@ -0,0 +1,255 @@
+import numpy as np
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+import redis
+import fcntl
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Column layout of the feature matrix
+FEATURES = ("valence", "energy", "daytime", "genre", "bias")
+
+# Row used for tracks the store has never seen
+DEFAULT_FEATURES = np.array([0.5, 0.5, 0.5, 0.5, 1.0], dtype=np.float32)
+
+# Initial number of rows allocated in the backing file
+INITIAL_CAPACITY = 1024
+
+# JSON of the default user's Preference.genre_weights, shared by every worker
+GENRE_WEIGHTS_KEY = "features:genre_weights"
+
+def genre_text(result: Dict) -> str:
+    """The text of a search result that preferred genres are matched against"""
+    return " ".join([result.get("title") or ""] + list(result.get("artists") or [])).lower()
+
+def genre_score(text: str, genre_weights: Dict[str, int]) -> float:
+    """Average weight of the preferred genres named in text, neutral if none are"""
+    matched = [weight for genre, weight in genre_weights.items() if genre in text]
+    if not matched:
+        return float(DEFAULT_FEATURES[FEATURES.index("genre")])
+    return sum(matched) / len(matched) / 100
+
+class FeatureStore:
+    """Dense float32 track feature matrix backed by a memory-mapped file
+
+    Rows are indexed by track URI. The URI index is kept in a JSON sidecar
+    next to the matrix file so the mapping survives restarts. Every worker
+    process maps the same file, so rows are allocated under an flock on a
+    lock file next to it, after re-reading the sidecar for rows other
+    processes appended.
+
+    Genre weights live in Redis so every worker scores genres alike. Rows
+    from search results keep the text genres were matched against in a
+    second sidecar, and their genre column is recomputed whenever the
+    weights change.
+    """
+
+    def __init__(self, path: str, d: int = len(FEATURES), redis_client: Optional[redis.Redis] = None):
+        self.path = path
+        self.index_path = f"{path}.index.json"
+        self.text_path = f"{path}.text.json"
+        self.lock_path = f"{path}.lock"
+        self.d = d
+        self.redis = redis_client
+        # Last weights read from Redis, used while it is unavailable
+        self.genre_weights: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        # Bumped whenever a URI gets a new row, so callers can re-resolve cached row ids
+        self.generation = 0
+
+        self.uris: List[str] = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.uris = json.load(f)
+        self.index: Dict[str, int] = {uri: i for i, uri in enumerate(self.uris)}
+        # Genre text of each row, None for rows not populated from a search result
+        self.texts: List[Optional[str]] = []
+        self._load_texts()
+        self._open(max(INITIAL_CAPACITY, len(self.uris)))
+
+    def _open(self, capacity: int):
+        """Map the backing file, growing it to hold at least capacity rows"""
+        size = capacity * self.d * 4
+        mode = "r+" if os.path.exists(self.path) else "w+"
+        if mode == "r+" and os.path.getsize(self.path) < size:
+            with open(self.path, "r+b") as f:
+                f.truncate(size)
+        if mode == "r+":
+            capacity = os.path.getsize(self.path) // (self.d * 4)
+        self.matrix = np.memmap(self.path, dtype=np.float32, mode=mode, shape=(capacity, self.d))
+
+    def __len__(self) -> int:
+        return len(self.uris)
+
+    def resolve(self, track_uris: Iterable[str]) -> np.ndarray:
+        """Map track URIs to row ids, -1 for unknown tracks"""
+        return np.array([self.index.get(uri, -1) for uri in track_uris], dtype=np.int64)
+
+    def gather(self, rows: np.ndarray) -> np.ndarray:
+        """Read many rows in one fancy-indexing gather"""
+        out = np.asarray(self.matrix[np.maximum(rows, 0)])
+        out[rows < 0] = DEFAULT_FEATURES
+        return out
+
+    def get(self, track_uris: List[str]) -> np.ndarray:
+        """Get the (n, d) feature matrix for a list of tracks"""
+        return self.gather(self.resolve(track_uris))
+
+    def row(self, track_uri: str) -> np.ndarray:
+        """Get the feature vector for a single track"""
+        i = self.index.get(track_uri)
+        return DEFAULT_FEATURES.copy() if i is None else np.array(self.matrix[i])
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the lock shared by threads of this process and by every other process on path"""
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_texts(self):
+        """Read the genre text sidecar, padded to one entry per row"""
+        texts = []
+        if os.path.exists(self.text_path):
+            with open(self.text_path) as f:
+                texts = json.load(f)
+        # Stores written before the sidecar existed have no text for their rows
+        self.texts = (texts + [None] * len(self.uris))[:len(self.uris)]
+
+    def _reload_index(self):
+        """Adopt rows other processes appended to the sidecar since this one last read it"""
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path) as f:
+            uris = json.load(f)
+        # The sidecar only grows, and only under the lock, so ours is always a prefix of it
+        if len(uris) > len(self.uris):
+            for uri in uris[len(self.uris):]:
+                self.index[uri] = len(self.uris)
+                self.uris.append(uri)
+            self._load_texts()
+            self.generation += 1
+
+    def _upsert(self, features: Dict[str, np.ndarray], texts: Optional[Dict[str, str]] = None):
+        """upsert_many with the lock held and the index reloaded"""
+        new = [uri for uri in features if uri not in self.index]
+        if len(self.uris) + len(new) > self.matrix.shape[0]:
+            self.matrix.flush()
+            self._open(max(2 * self.matrix.shape[0], len(self.uris) + len(new)))
+        for uri in new:
+            self.index[uri] = len(self.uris)
+            self.uris.append(uri)
+            self.texts.append(None)
+
+        rows = self.resolve(features.keys())
+        self.matrix[rows] = np.array(list(features.values()), dtype=np.float32)
+        self.matrix.flush()
+        changed_texts = False
+        for uri, text in (texts or {}).items():
+            i = self.index[uri]
+            changed_texts = changed_texts or self.texts[i] != text
+            self.texts[i] = text
+        if new or changed_texts:
+            self._save_index()
+        if new:
+            self.generation += 1
+
+    def upsert_many(self, features: Dict[str, np.ndarray]):
+        """Insert or overwrite feature rows and persist them"""
+        if not features:
+            return
+
+        with self._exclusive():
+            self._reload_index()
+            self._upsert(features)
+
+    def _save_index(self):
+        for path, data in ((self.text_path, self.texts), (self.index_path, self.uris)):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+
+    def load_genre_weights(self) -> Dict[str, int]:
+        """The shared genre weights, or the last ones seen if Redis is unavailable"""
+        if self.redis is None:
+            return self.genre_weights
+        try:
+            data = self.redis.get(GENRE_WEIGHTS_KEY)
+            self.genre_weights = json.loads(data) if data else {}
+        except (redis.RedisError, json.JSONDecodeError) as e:
+            logger.error(f"Error loading genre weights: {e}")
+        return self.genre_weights
+
+    def set_genre_weights(self, genre_weights: Dict[str, int]):
+        """Share the Preference.genre_weights tracks are scored with, and rescore stored rows
+
+        Rows are shared by every user, so these are the default user's
+        weights; other users' genre preferences don't reach track features.
+        The weights are written and the rows rescored under the store's
+        lock, which populating also holds while it reads the weights, so
+        no row is written with weights older than the rescore used.
+        """
+        genre_weights = {genre.lower(): weight for genre, weight in genre_weights.items()}
+        with self._exclusive():
+            self.genre_weights = genre_weights
+            if self.redis is not None:
+                try:
+                    self.redis.set(GENRE_WEIGHTS_KEY, json.dumps(genre_weights))
+                except redis.RedisError as e:
+                    logger.error(f"Error saving genre weights: {e}")
+
+            self._reload_index()
+            rows = [i for i, text in enumerate(self.texts) if text is not None]
+            if rows:
+                column = FEATURES.index("genre")
+                self.matrix[rows, column] = [genre_score(self.texts[i], genre_weights) for i in rows]
+                self.matrix.flush()
+
+    def extract(self, result: Dict, genre_weights: Optional[Dict[str, int]] = None) -> np.ndarray:
+        """Build a feature row from a search result
+
+        Search results carry no audio analysis, so mood and time-of-day
+        columns stay neutral unless the result provides them. The genre
+        column averages the weights of preferred genres named in the
+        title or artists.
+        """
+        x = DEFAULT_FEATURES.copy()
+        for i, name in enumerate(FEATURES[:3]):
+            if result.get(name) is not None:
+                x[i] = float(result[name])
+
+        if genre_weights is None:
+            genre_weights = self.genre_weights
+        x[FEATURES.index("genre")] = genre_score(genre_text(result), genre_weights)
+        return x
+
+    def populate_from_search(self, results: List[Dict], overwrite: bool = False) -> int:
+        """Bulk-add features for search results, returns the number of rows written"""
+        items = {
+            item["uri"]: item
+            for item in results
+            if item.get("uri") and (overwrite or item["uri"] not in self.index)
+        }
+        if not items:
+            return 0
+        try:
+            with self._exclusive():
+                self._reload_index()
+                genre_weights = self.load_genre_weights()
+                self._upsert(
+                    {uri: self.extract(item, genre_weights) for uri, item in items.items()},
+                    {uri: genre_text(item) for uri, item in items.items()}
+                )
+        except OSError as e:
+            logger.error(f"Error writing track features: {e}")
+            return 0
+        return len(items)
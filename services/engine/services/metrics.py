@@ -0,0 +1,87 @@
+import numpy as np
+from collections import deque
+from typing import Callable, Dict
+import threading
+
+# Recent observations kept per histogram for percentiles
+RESERVOIR_SIZE = 1024
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n: int = 1):
+        with self._lock:
+            self.value += n
+
+    def snapshot(self) -> int:
+        return self.value
+
+class Histogram:
+    """Count, sum and max of all observations, percentiles over the most recent ones"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent = deque(maxlen=RESERVOIR_SIZE)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+            self._recent.append(value)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            recent = np.array(self._recent)
+            count, total, peak = self.count, self.total, self.max
+        p50, p95, p99 = np.percentile(recent, [50, 95, 99]) if len(recent) else (0.0, 0.0, 0.0)
+        return {
+            "count": count,
+            "mean": total / count if count else 0.0,
+            "max": peak,
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99)
+        }
+
+class Gauge:
+    """Value read from a callback at snapshot time"""
+
+    def __init__(self, read: Callable[[], float]):
+        self.read = read
+
+    def snapshot(self) -> float:
+        return self.read()
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+def _get_or_create(name: str, factory):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = factory()
+        return metric
+
+def counter(name: str) -> Counter:
+    return _get_or_create(name, Counter)
+
+def histogram(name: str) -> Histogram:
+    return _get_or_create(name, Histogram)
+
+def gauge(name: str, read: Callable[[], float]) -> Gauge:
+    """Register (or replace) a gauge"""
+    with _registry_lock:
+        metric = _registry[name] = Gauge(read)
+        return metric
+
+def snapshot() -> Dict[str, object]:
+    """Current value of every registered metric, by name"""
+    with _registry_lock:
+        metrics = dict(_registry)
+    return {name: metric.snapshot() for name, metric in sorted(metrics.items())}
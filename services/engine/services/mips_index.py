@@ -0,0 +1,147 @@
+import numpy as np
+from typing import Iterable, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class PartitionedMIPSIndex:
+    """Inverted-file index for approximate maximum inner product search
+
+    Vectors are clustered with k-means into roughly sqrt(n) partitions. A
+    query bounds the best inner product inside each partition by
+    centroid . q + radius * |q|, probes partitions in that order (at least
+    n_probe, and enough to hold probe_factor * k vectors) and ranks only
+    the vectors inside them. Changed vectors are re-assigned to
+    their nearest centroid in place; the clustering is rebuilt once the
+    number of changes since the last build exceeds rebuild_fraction of the
+    indexed vectors.
+    """
+
+    def __init__(self, d: int, n_probe: int = 8, probe_factor: int = 4, rebuild_fraction: float = 0.2,
+                 kmeans_iters: int = 10, sample_size: int = 20000, seed: int = 0):
+        self.d = d
+        self.n_probe = n_probe
+        self.probe_factor = probe_factor
+        self.rebuild_fraction = rebuild_fraction
+        self.kmeans_iters = kmeans_iters
+        self.sample_size = sample_size
+        self.rng = np.random.default_rng(seed)
+
+        self.n = 0
+        self.vectors = np.zeros((0, d))
+        self.assign = np.zeros(0, dtype=np.int64)
+        self.centroids: Optional[np.ndarray] = None
+        self.radii = np.zeros(0)
+        self.lists: List[List[int]] = []
+        self._list_arrays: List[Optional[np.ndarray]] = []
+        self._changes = 0
+
+    def __len__(self) -> int:
+        return self.n
+
+    def _grow(self, n: int):
+        """Make room for ids up to n - 1, growing geometrically"""
+        if n > self.vectors.shape[0]:
+            capacity = max(64, 2 * self.vectors.shape[0], n)
+            vectors = np.zeros((capacity, self.d))
+            assign = np.full(capacity, -1, dtype=np.int64)
+            vectors[:self.n] = self.vectors[:self.n]
+            assign[:self.n] = self.assign[:self.n]
+            self.vectors, self.assign = vectors, assign
+        self.n = max(self.n, n)
+
+    def build(self, vectors: Optional[np.ndarray] = None):
+        """Cluster all vectors from scratch"""
+        if vectors is not None:
+            self.n = 0
+            self.vectors = np.zeros((0, self.d))
+            self.assign = np.zeros(0, dtype=np.int64)
+            self._grow(len(vectors))
+            self.vectors[:self.n] = vectors
+        n = self.n
+        self._changes = 0
+        if n == 0:
+            self.centroids = None
+            self.radii = np.zeros(0)
+            self.lists, self._list_arrays = [], []
+            return
+
+        n_lists = max(1, int(np.sqrt(n)))
+        points = self.vectors[:n]
+        sample = points[self.rng.choice(n, min(n, self.sample_size), replace=False)]
+        centroids = sample[self.rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(self.kmeans_iters):
+            labels = self._nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)[:, None]
+            # Empty clusters keep their previous centroid
+            centroids = np.where(counts > 0, sums / np.maximum(counts, 1), centroids)
+
+        self.centroids = centroids
+        assign = self._nearest(points, centroids)
+        self.assign[:n] = assign
+        self.radii = np.zeros(n_lists)
+        np.maximum.at(self.radii, assign, np.linalg.norm(points - centroids[assign], axis=1))
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(n_lists + 1))
+        self.lists = [order[bounds[j]:bounds[j + 1]].tolist() for j in range(n_lists)]
+        self._list_arrays = [None] * n_lists
+
+    @staticmethod
+    def _nearest(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Nearest centroid by squared L2 distance, in chunks to bound memory"""
+        c_sq = (centroids ** 2).sum(axis=1)
+        labels = np.empty(len(points), dtype=np.int64)
+        for start in range(0, len(points), 65536):
+            chunk = points[start:start + 65536]
+            labels[start:start + len(chunk)] = np.argmin(c_sq - 2 * chunk @ centroids.T, axis=1)
+        return labels
+
+    def upsert(self, ids: Iterable[int], vectors: np.ndarray):
+        """Insert or move vectors after their arms changed"""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        if len(ids) == 0:
+            return
+        self._grow(int(ids.max()) + 1)
+        self.vectors[ids] = vectors
+
+        if self.centroids is None:
+            self.build()
+            return
+
+        labels = self._nearest(self.vectors[ids], self.centroids)
+        for i, old, new in zip(ids.tolist(), self.assign[ids].tolist(), labels.tolist()):
+            if old == new:
+                continue
+            if old >= 0:
+                self.lists[old].remove(i)
+                self._list_arrays[old] = None
+            self.lists[new].append(i)
+            self._list_arrays[new] = None
+        self.assign[ids] = labels
+        np.maximum.at(self.radii, labels, np.linalg.norm(self.vectors[ids] - self.centroids[labels], axis=1))
+
+        self._changes += len(ids)
+        if self._changes > self.rebuild_fraction * self.n:
+            self.build()
+
+    def _list_array(self, j: int) -> np.ndarray:
+        if self._list_arrays[j] is None:
+            self._list_arrays[j] = np.array(self.lists[j], dtype=np.int64)
+        return self._list_arrays[j]
+
+    def search(self, query: np.ndarray, k: int) -> np.ndarray:
+        """Ids of up to k vectors with the largest inner product with query"""
+        if self.centroids is None:
+            return np.zeros(0, dtype=np.int64)
+
+        # Probe the best partitions until they hold probe_factor * k vectors
+        order = np.argsort(-(self.centroids @ query + self.radii * np.linalg.norm(query)))
+        sizes = np.cumsum([len(self.lists[j]) for j in order])
+        n_probe = max(min(self.n_probe, len(order)), int(np.searchsorted(sizes, self.probe_factor * k)) + 1)
+        ids = np.concatenate([self._list_array(j) for j in order[:n_probe]])
+        if len(ids) <= k:
+            return ids
+        scores = self.vectors[ids] @ query
+        return ids[np.argpartition(-scores, k - 1)[:k]]
@@ -0,0 +1,117 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import re
+import time
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Mood identifiers the remote classifier may answer with
+VALID_MOODS = ("happy", "calm", "energetic", "focused", "relaxed", "stressed", "sad", "anxious")
+
+# Snapshots classified by one prompt, and seconds the first of them waits for company
+MAX_BATCH = 32
+MAX_WAIT = 0.03
+
+_JSON_ARRAY = re.compile(r"\[.*\]", re.DOTALL)
+
+def batch_prompt(snapshots: List[Dict[str, Any]]) -> str:
+    """One prompt asking for a mood per numbered snapshot, answered as a JSON array"""
+    numbered = "\n".join(f"{i}. {json.dumps(snapshot, sort_keys=True)}" for i, snapshot in enumerate(snapshots, 1))
+    return f"""
+        Analyze each of the following {len(snapshots)} sets of behavioral metrics and determine the most likely mood:
+        {numbered}
+
+        Consider factors like:
+        - Activity level
+        - Heart rate
+        - Interaction patterns
+        - Time of day
+        - Previous mood states
+
+        For each set, choose a single mood identifier from this list:
+        {", ".join(VALID_MOODS)}
+
+        Return only a JSON array of {len(snapshots)} mood identifiers, in the same order as the sets.
+        """
+
+def parse_moods(text: str, n: int, fallback: str = "neutral") -> List[str]:
+    """Per-snapshot moods from a batch answer; fallback for unknown moods or an unusable answer"""
+    match = _JSON_ARRAY.search(text)
+    try:
+        moods = json.loads(match.group(0)) if match else None
+    except json.JSONDecodeError:
+        moods = None
+    if not isinstance(moods, list) or len(moods) != n:
+        logger.warning(f"Unusable batch mood answer for {n} snapshots: {text[:200]!r}")
+        return [fallback] * n
+    return [
+        str(mood).strip().lower() if str(mood).strip().lower() in VALID_MOODS else fallback
+        for mood in moods
+    ]
+
+class MoodBatcher:
+    """Coalesces concurrent mood inferences into batched calls to a slow classifier
+
+    Each call parks its snapshot and waits. A batch goes out as soon as
+    max_batch snapshots are pending, or max_wait after the first of them
+    arrived, so a lone client pays at most max_wait extra latency while a
+    burst of clients shares one request per max_batch snapshots.
+    classify_fn takes a list of snapshots and returns one mood per
+    snapshot, in order; if it fails the whole batch gets fallback.
+    """
+
+    def __init__(self, classify_fn: Callable[[List[Dict[str, Any]]], Awaitable[List[str]]],
+                 max_batch: int = MAX_BATCH, max_wait: float = MAX_WAIT, fallback: str = "neutral"):
+        self.classify_fn = classify_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.fallback = fallback
+
+        # Only touched from the event loop thread
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # In-flight batches, referenced so they aren't collected mid-flight
+        self._batches = set()
+
+        self.batch_size = metrics.histogram("mood.batch_size")
+        self.batch_time = metrics.histogram("mood.batch_seconds")
+        self.batch_failures = metrics.counter("mood.batch_failures")
+
+    async def __call__(self, snapshot: Dict[str, Any]) -> str:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((snapshot, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        # A caller giving up doesn't withdraw its snapshot from the batch already formed
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            task = asyncio.create_task(self._classify(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _classify(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        self.batch_size.observe(len(batch))
+        started = time.perf_counter()
+        try:
+            moods = await self.classify_fn([snapshot for snapshot, _ in batch])
+            if len(moods) != len(batch):
+                raise ValueError(f"{len(moods)} moods for {len(batch)} snapshots")
+        except Exception as e:
+            logger.error(f"Batched mood inference failed: {e}")
+            self.batch_failures.inc()
+            moods = [self.fallback] * len(batch)
+        self.batch_time.observe(time.perf_counter() - started)
+        for (_, future), mood in zip(batch, moods):
+            if not future.done():
+                future.set_result(mood)
@@ -0,0 +1,108 @@
+import numpy as np
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+import os
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Behavioral fields the classifier reads, as aggregated by insights.process_metrics_batch
+FEATURES = ("typingSpeed", "backspaceRate", "scrollRate", "idleMs", "focusMs")
+
+# Predictions below this probability are escalated to the remote classifier
+MIN_CONFIDENCE = 0.7
+
+def featurize(snapshot: Dict[str, Any]) -> Optional[np.ndarray]:
+    """log1p of each behavioral field, None if any is missing or not a number"""
+    values = []
+    for name in FEATURES:
+        value = snapshot.get(name)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        values.append(max(float(value), 0.0))
+    return np.log1p(np.array(values))
+
+class MoodClassifier:
+    """Multinomial logistic regression over standardized log behavioral features
+
+    Small enough that a prediction is a 5-wide matrix-vector product, so
+    it answers in microseconds. Trained offline with fit and stored as .npz.
+    """
+
+    def __init__(self, labels: Sequence[str], weights: np.ndarray, bias: np.ndarray,
+                 mean: np.ndarray, std: np.ndarray):
+        self.labels = list(labels)
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.std = std
+
+    @classmethod
+    def fit(cls, snapshots: List[Dict[str, Any]], moods: List[str], l2: float = 1e-3,
+            learning_rate: float = 0.5, epochs: int = 500) -> "MoodClassifier":
+        """Train on labelled snapshots with full-batch gradient descent, skipping unusable rows"""
+        rows = [(x, mood) for x, mood in ((featurize(s), m) for s, m in zip(snapshots, moods)) if x is not None]
+        if not rows:
+            raise ValueError("No snapshots with all behavioral fields")
+        labels = sorted({mood for _, mood in rows})
+        X = np.stack([x for x, _ in rows])
+        y = np.array([labels.index(mood) for _, mood in rows])
+
+        mean, std = X.mean(axis=0), X.std(axis=0)
+        std[std == 0] = 1.0
+        Z = (X - mean) / std
+        targets = np.eye(len(labels))[y]
+
+        weights = np.zeros((len(labels), len(FEATURES)))
+        bias = np.zeros(len(labels))
+        for _ in range(epochs):
+            error = cls._softmax(Z @ weights.T + bias) - targets
+            weights -= learning_rate * (error.T @ Z / len(Z) + l2 * weights)
+            bias -= learning_rate * error.mean(axis=0)
+        return cls(labels, weights, bias, mean, std)
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def predict(self, snapshot: Dict[str, Any]) -> Optional[Tuple[str, float]]:
+        """Most likely mood and its probability, None if the snapshot lacks behavioral fields"""
+        x = featurize(snapshot)
+        if x is None:
+            return None
+        p = self._softmax(self.weights @ ((x - self.mean) / self.std) + self.bias)
+        best = int(np.argmax(p))
+        return self.labels[best], float(p[best])
+
+    def save(self, path: str):
+        np.savez(path, labels=np.array(self.labels), weights=self.weights, bias=self.bias,
+                 mean=self.mean, std=self.std)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["MoodClassifier"]:
+        """Load a trained model, None if there is none at path"""
+        if not os.path.exists(path):
+            logger.info(f"No mood model at {path}, every inference goes remote")
+            return None
+        with np.load(path) as data:
+            return cls(data["labels"].tolist(), data["weights"], data["bias"], data["mean"], data["std"])
+
+class LocalFirstClassifier:
+    """Answers from the local model when it is confident, otherwise asks the remote classifier"""
+
+    def __init__(self, local: Optional[MoodClassifier], remote: Callable[[Dict[str, Any]], Awaitable[str]],
+                 min_confidence: float = MIN_CONFIDENCE):
+        self.local = local
+        self.remote = remote
+        self.min_confidence = min_confidence
+        self.local_answers = metrics.counter("mood.local_answers")
+        self.escalations = metrics.counter("mood.escalations")
+
+    async def __call__(self, snapshot: Dict[str, Any]) -> str:
+        prediction = self.local.predict(snapshot) if self.local is not None else None
+        if prediction is not None and prediction[1] >= self.min_confidence:
+            self.local_answers.inc()
+            return prediction[0]
+        self.escalations.inc()
+        return await self.remote(snapshot)
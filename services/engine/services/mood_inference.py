@@ -0,0 +1,120 @@
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+import json
+import logging
+import math
+import time
+from . import metrics
+from .search_cache import MemoryTier
+
+logger = logging.getLogger(__name__)
+
+# Width of a quantization bucket in log1p space, roughly 10% relative change per bucket
+QUANT_STEP = 0.1
+
+# Fields that change on every event without saying anything about mood
+IGNORED_FIELDS = frozenset({"timestamp", "ts", "sessionId"})
+
+def signature(snapshot: Dict[str, Any]) -> str:
+    """Cache key for a metrics snapshot: numeric fields bucketed on a log scale, strings kept"""
+    buckets = {}
+    for name, value in snapshot.items():
+        if name in IGNORED_FIELDS:
+            continue
+        if isinstance(value, bool) or isinstance(value, str):
+            buckets[name] = value
+        elif isinstance(value, (int, float)):
+            buckets[name] = int(math.copysign(round(math.log1p(abs(value)) / QUANT_STEP), value))
+    return json.dumps(buckets, sort_keys=True, separators=(",", ":"))
+
+def _numeric(snapshot: Dict[str, Any]) -> Dict[str, float]:
+    return {
+        name: float(value) for name, value in snapshot.items()
+        if name not in IGNORED_FIELDS and isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+def _categorical(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        name: value for name, value in snapshot.items()
+        if name not in IGNORED_FIELDS and not (isinstance(value, (int, float)) and not isinstance(value, bool))
+    }
+
+def drift(previous: Dict[str, Any], current: Dict[str, Any]) -> float:
+    """Largest relative change of any numeric field, 1.0 if any other field changed"""
+    before, after = _numeric(previous), _numeric(current)
+    if before.keys() != after.keys() or _categorical(previous) != _categorical(current):
+        return 1.0
+    return max(
+        (abs(after[name] - before[name]) / max(abs(after[name]), abs(before[name]), 1.0) for name in after),
+        default=0.0
+    )
+
+@dataclass
+class ClientState:
+    snapshot: Dict[str, Any] = field(default_factory=dict)
+    mood: Optional[str] = None
+    inferred_at: float = 0.0
+
+class MoodInference:
+    """Cache, drift check and per-client rate limit in front of a slow mood classifier
+
+    For each metrics event from a client (sid), the last mood is reused
+    without inference if the metrics drifted less than drift_threshold
+    since the last inference or if min_interval hasn't passed yet.
+    Otherwise the quantized metrics signature is looked up in a TTL cache
+    shared by all clients, and only a miss calls infer_fn. Results equal
+    to fallback (what infer_fn returns on errors) are neither cached nor
+    remembered for the client, so its next event tries again; meanwhile
+    the client's last real mood, if any, is returned instead.
+    """
+
+    def __init__(self, infer_fn: Callable[[Dict[str, Any]], Awaitable[str]], ttl: float = 600,
+                 min_interval: float = 5.0, drift_threshold: float = 0.1,
+                 max_entries: int = 10000, fallback: Optional[str] = "neutral"):
+        self.infer_fn = infer_fn
+        self.min_interval = min_interval
+        self.drift_threshold = drift_threshold
+        self.fallback = fallback
+        # Entries are charged one unit each, so the byte budget is an entry budget
+        self.cache = MemoryTier(max_entries, ttl)
+        self._clients: Dict[str, ClientState] = {}
+
+        self.cache_hits = metrics.counter("mood.cache_hits")
+        self.cache_misses = metrics.counter("mood.cache_misses")
+        self.skipped_drift = metrics.counter("mood.skipped_drift")
+        self.rate_limited = metrics.counter("mood.rate_limited")
+        self.inference_time = metrics.histogram("mood.inference_seconds")
+        metrics.gauge("mood.cache_hit_ratio", self.hit_ratio)
+
+    def hit_ratio(self) -> float:
+        lookups = self.cache_hits.value + self.cache_misses.value
+        return self.cache_hits.value / lookups if lookups else 0.0
+
+    async def infer(self, sid: str, snapshot: Dict[str, Any]) -> str:
+        state = self._clients.setdefault(sid, ClientState())
+        if state.mood is not None:
+            if drift(state.snapshot, snapshot) < self.drift_threshold:
+                self.skipped_drift.inc()
+                return state.mood
+            if time.monotonic() - state.inferred_at < self.min_interval:
+                self.rate_limited.inc()
+                return state.mood
+
+        key = signature(snapshot)
+        mood = self.cache.get(key)
+        if mood is not None:
+            self.cache_hits.inc()
+        else:
+            self.cache_misses.inc()
+            started = time.perf_counter()
+            mood = await self.infer_fn(snapshot)
+            self.inference_time.observe(time.perf_counter() - started)
+            if mood == self.fallback:
+                return mood if state.mood is None else state.mood
+            self.cache.set(key, mood, 1)
+
+        state.snapshot, state.mood, state.inferred_at = dict(snapshot), mood, time.monotonic()
+        return mood
+
+    def forget(self, sid: str):
+        self._clients.pop(sid, None)
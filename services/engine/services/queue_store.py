@@ -0,0 +1,349 @@
+from typing import Dict, List, Optional
+import redis.asyncio as aioredis
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# List the queue was kept in before items and order were split
+LEGACY_KEY = "queue"
+
+# Hash of track URI -> JSON item payload. The {queue} hash tag keeps it in
+# the legacy list's Redis Cluster slot, so one script can touch all three keys
+ITEMS_KEY = "{queue}:items"
+
+# Sorted set of track URI scored by position
+ORDER_KEY = "{queue}:order"
+
+# Queue version, bumped once per mutation that changes the queue
+VERSION_KEY = "{queue}:version"
+
+# List of the most recent JSON change records, oldest first
+LOG_KEY = "{queue}:log"
+
+# Pub/sub channel each change record is published on
+CHANGES_CHANNEL = "{queue}:changes"
+
+# Change records kept for clients catching up; older gaps need a snapshot
+LOG_SIZE = 256
+
+# Gap between positions assigned when appending or renumbering
+POSITION_STEP = 1024.0
+
+# Neighbouring positions closer than this are renumbered before inserting between them
+MIN_GAP = 1e-6
+
+# All scripts take KEYS: items, order, version, log, legacy and
+# ARGV: channel, log size, then their own arguments. Each change bumps the
+# version and is appended to the log and published as one compact record:
+#   {"op": "insert", "version", "uri", "index", "item"}
+#   {"op": "update", "version", "uri", "item"}
+#   {"op": "remove", "version", "uri"}
+#   {"op": "move", "version", "uri", "index"}
+#   {"op": "reorder", "version", "uris"}
+#   {"op": "reset", "version"}   (bulk repair, clients should take a snapshot)
+LOG_CHANGE = """
+local function log_change(change)
+    change['version'] = redis.call('INCR', KEYS[3])
+    local encoded = cjson.encode(change)
+    redis.call('RPUSH', KEYS[4], encoded)
+    redis.call('LTRIM', KEYS[4], -tonumber(ARGV[2]), -1)
+    redis.call('PUBLISH', ARGV[1], encoded)
+end
+"""
+
+# Positions computed in Lua are passed to ZADD with string.format('%.17g'),
+# since redis.call would otherwise stringify numbers to 14 significant digits
+# and collapse nearby midpoints onto their neighbours
+
+# ARGV: uri, payload, step. Returns the queue length
+ADD_SCRIPT = LOG_CHANGE + """
+local uri, payload = ARGV[3], ARGV[4]
+if not redis.call('ZSCORE', KEYS[2], uri) then
+    local last = redis.call('ZRANGE', KEYS[2], -1, -1, 'WITHSCORES')
+    local position = 0
+    if #last > 0 then position = tonumber(last[2]) + tonumber(ARGV[5]) end
+    redis.call('HSET', KEYS[1], uri, payload)
+    redis.call('ZADD', KEYS[2], string.format('%.17g', position), uri)
+    local n = redis.call('ZCARD', KEYS[2])
+    log_change({op = 'insert', uri = uri, index = n - 1, item = cjson.decode(payload)})
+    return n
+end
+if redis.call('HGET', KEYS[1], uri) ~= payload then
+    redis.call('HSET', KEYS[1], uri, payload)
+    log_change({op = 'update', uri = uri, item = cjson.decode(payload)})
+end
+return redis.call('ZCARD', KEYS[2])
+"""
+
+# ARGV: uri. Returns the number of items removed
+REMOVE_SCRIPT = LOG_CHANGE + """
+local removed = redis.call('ZREM', KEYS[2], ARGV[3])
+redis.call('HDEL', KEYS[1], ARGV[3])
+if removed == 1 then log_change({op = 'remove', uri = ARGV[3]}) end
+return removed
+"""
+
+# ARGV: uri, index, step, min_gap. Returns 0 if the uri isn't queued
+MOVE_SCRIPT = LOG_CHANGE + """
+local uri = ARGV[3]
+local rank = redis.call('ZRANK', KEYS[2], uri)
+if not rank then return 0 end
+local n = redis.call('ZCARD', KEYS[2])
+local index = math.max(0, math.min(tonumber(ARGV[4]), n - 1))
+if index == rank then return 1 end
+local step = tonumber(ARGV[5])
+
+local function score_at(r)
+    return tonumber(redis.call('ZRANGE', KEYS[2], r, r, 'WITHSCORES')[2])
+end
+
+-- Neighbours in the queue without the moving item, mapped back to ranks in the full queue
+local function position()
+    local before, after
+    if index > 0 then
+        local j = index - 1
+        if j >= rank then j = j + 1 end
+        before = score_at(j)
+    end
+    if index < n - 1 then
+        local j = index
+        if j >= rank then j = j + 1 end
+        after = score_at(j)
+    end
+    if not before and not after then return 0 end
+    if not before then return after - step end
+    if not after then return before + step end
+    if after - before < tonumber(ARGV[6]) then return nil end
+    return (before + after) / 2
+end
+
+local target = position()
+if not target then
+    for i, queued in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+        redis.call('ZADD', KEYS[2], (i - 1) * step, queued)
+    end
+    target = position()
+end
+redis.call('ZADD', KEYS[2], 'XX', string.format('%.17g', target), uri)
+log_change({op = 'move', uri = uri, index = index})
+return 1
+"""
+
+# ARGV: step, uris... Listed URIs go first in the given order, anything
+# else queued (e.g. added since the client last read) keeps its relative
+# order after them. Returns the queue length
+REORDER_SCRIPT = LOG_CHANGE + """
+local step = tonumber(ARGV[3])
+local current = redis.call('ZRANGE', KEYS[2], 0, -1)
+local ordered, seen = {}, {}
+for i = 4, #ARGV do
+    local uri = ARGV[i]
+    if not seen[uri] and redis.call('ZSCORE', KEYS[2], uri) then
+        seen[uri] = true
+        ordered[#ordered + 1] = uri
+    end
+end
+for _, uri in ipairs(current) do
+    if not seen[uri] then ordered[#ordered + 1] = uri end
+end
+
+local changed = false
+for i, uri in ipairs(ordered) do
+    if current[i] ~= uri then changed = true end
+    redis.call('ZADD', KEYS[2], (i - 1) * step, uri)
+end
+if changed then log_change({op = 'reorder', uris = ordered}) end
+return #ordered
+"""
+
+# ARGV: step. Folds the legacy list in after anything already queued,
+# keeping the first occurrence of each URI, and drops positions without a
+# payload and payloads without a position. Returns {migrated, dropped}
+DEDUPE_SCRIPT = LOG_CHANGE + """
+local step = tonumber(ARGV[3])
+local migrated, dropped = 0, 0
+
+for _, uri in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+    if redis.call('HEXISTS', KEYS[1], uri) == 0 then
+        redis.call('ZREM', KEYS[2], uri)
+        dropped = dropped + 1
+    end
+end
+for _, uri in ipairs(redis.call('HKEYS', KEYS[1])) do
+    if not redis.call('ZSCORE', KEYS[2], uri) then
+        redis.call('HDEL', KEYS[1], uri)
+        dropped = dropped + 1
+    end
+end
+
+if redis.call('TYPE', KEYS[5])['ok'] == 'list' then
+    local last = redis.call('ZRANGE', KEYS[2], -1, -1, 'WITHSCORES')
+    local position = 0
+    if #last > 0 then position = tonumber(last[2]) + step end
+    for _, raw in ipairs(redis.call('LRANGE', KEYS[5], 0, -1)) do
+        local ok, item = pcall(cjson.decode, raw)
+        local uri = ok and type(item) == 'table' and item['uri']
+        if type(uri) ~= 'string' or redis.call('ZSCORE', KEYS[2], uri) then
+            dropped = dropped + 1
+        else
+            redis.call('HSET', KEYS[1], uri, raw)
+            redis.call('ZADD', KEYS[2], string.format('%.17g', position), uri)
+            position = position + step
+            migrated = migrated + 1
+        end
+    end
+    redis.call('DEL', KEYS[5])
+end
+if migrated > 0 or dropped > 0 then log_change({op = 'reset'}) end
+return {migrated, dropped}
+"""
+
+# Returns the payload of the item popped off the front, or nil
+POP_SCRIPT = LOG_CHANGE + """
+local popped = redis.call('ZPOPMIN', KEYS[2])
+if #popped == 0 then return false end
+local payload = redis.call('HGET', KEYS[1], popped[1])
+redis.call('HDEL', KEYS[1], popped[1])
+log_change({op = 'remove', uri = popped[1]})
+return payload
+"""
+
+# Returns {version, payloads...} read at a single point in time
+SNAPSHOT_SCRIPT = """
+local snapshot = {tonumber(redis.call('GET', KEYS[3]) or '0')}
+for _, uri in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+    local payload = redis.call('HGET', KEYS[1], uri)
+    if payload then snapshot[#snapshot + 1] = payload end
+end
+return snapshot
+"""
+
+class QueueStore:
+    """Play queue kept as a payload hash plus a sorted set of positions
+
+    Positions are sparse floats. Appending takes the last position plus a
+    step and moving an item takes the midpoint of its new neighbours, so
+    add, remove and move touch O(log n) entries instead of rewriting the
+    list. The queue is renumbered only when repeated moves exhaust the
+    gap between two neighbours. Each URI appears at most once.
+
+    Every mutation is a registered Lua script, so it runs atomically in a
+    single round trip (EVALSHA, falling back to EVAL after a script flush),
+    and records a versioned change that clients apply instead of refetching
+    the queue.
+    """
+
+    # Keys already checked for a legacy list in this process
+    _migrated = set()
+
+    def __init__(self, redis_client: aioredis.Redis, items_key: str = ITEMS_KEY,
+                 order_key: str = ORDER_KEY, legacy_key: str = LEGACY_KEY,
+                 version_key: str = VERSION_KEY, log_key: str = LOG_KEY,
+                 channel: str = CHANGES_CHANNEL):
+        self.redis = redis_client
+        self.items_key = items_key
+        self.order_key = order_key
+        self.legacy_key = legacy_key
+        self.version_key = version_key
+        self.log_key = log_key
+        self.channel = channel
+
+        self._add = redis_client.register_script(ADD_SCRIPT)
+        self._remove = redis_client.register_script(REMOVE_SCRIPT)
+        self._move = redis_client.register_script(MOVE_SCRIPT)
+        self._reorder = redis_client.register_script(REORDER_SCRIPT)
+        self._dedupe = redis_client.register_script(DEDUPE_SCRIPT)
+        self._pop = redis_client.register_script(POP_SCRIPT)
+        self._snapshot = redis_client.register_script(SNAPSHOT_SCRIPT)
+
+    async def _run(self, script, *args):
+        keys = [self.items_key, self.order_key, self.version_key, self.log_key, self.legacy_key]
+        return await script(keys=keys, args=[self.channel, LOG_SIZE, *args])
+
+    async def _ensure_migrated(self):
+        if self.order_key not in QueueStore._migrated:
+            await self.dedupe()
+            QueueStore._migrated.add(self.order_key)
+
+    async def dedupe(self) -> int:
+        """Migrate the legacy JSON list and drop duplicate or orphaned entries
+
+        Returns the number of items migrated.
+        """
+        migrated, dropped = await self._run(self._dedupe, POSITION_STEP)
+        if migrated or dropped:
+            logger.info(f"Migrated {migrated} queue items to {self.order_key}, dropped {dropped}")
+        return migrated
+
+    async def length(self) -> int:
+        await self._ensure_migrated()
+        return await self.redis.zcard(self.order_key)
+
+    async def page(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """Get items in queue order, starting at offset"""
+        await self._ensure_migrated()
+        stop = -1 if limit is None else offset + limit - 1
+        uris = await self.redis.zrange(self.order_key, offset, stop)
+        if not uris:
+            return []
+        payloads = await self.redis.hmget(self.items_key, uris)
+        return [json.loads(payload) for payload in payloads if payload is not None]
+
+    async def snapshot(self) -> Dict:
+        """The whole queue with the version it was read at"""
+        await self._ensure_migrated()
+        version, *payloads = await self._run(self._snapshot)
+        return {"version": version, "items": [json.loads(payload) for payload in payloads]}
+
+    async def changes_since(self, version: int) -> Optional[List[Dict]]:
+        """Change records after version, oldest first
+
+        Returns None if the log no longer reaches back to version (or the
+        client is ahead of the server), in which case the client needs a
+        snapshot instead.
+        """
+        await self._ensure_migrated()
+        changes = [json.loads(raw) for raw in await self.redis.lrange(self.log_key, 0, -1)]
+        current = changes[-1]["version"] if changes else int(await self.redis.get(self.version_key) or 0)
+        if version == current:
+            return []
+        if version > current or not changes or changes[0]["version"] > version + 1:
+            return None
+        return [change for change in changes if change["version"] > version]
+
+    async def add(self, item: Dict) -> int:
+        """Append an item, or update its payload in place if the URI is queued
+
+        Returns the queue length.
+        """
+        await self._ensure_migrated()
+        return await self._run(self._add, item["uri"], json.dumps(item), POSITION_STEP)
+
+    async def remove(self, uri: str) -> int:
+        """Remove an item by URI, returns the number of items removed"""
+        await self._ensure_migrated()
+        return await self._run(self._remove, uri)
+
+    async def move(self, uri: str, index: int) -> bool:
+        """Move an item to index (clamped to the queue), returns False if it isn't queued"""
+        await self._ensure_migrated()
+        return bool(await self._run(self._move, uri, index, POSITION_STEP, MIN_GAP))
+
+    async def move_to_front(self, uri: str) -> bool:
+        return await self.move(uri, 0)
+
+    async def reorder(self, uris: List[str]) -> int:
+        """Put uris first in the given order, returns the queue length
+
+        Queued items missing from uris keep their relative order after the
+        listed ones rather than being dropped.
+        """
+        await self._ensure_migrated()
+        return await self._run(self._reorder, POSITION_STEP, *uris)
+
+    async def pop_next(self) -> Optional[Dict]:
+        """Take the item at the front of the queue, None if it's empty"""
+        await self._ensure_migrated()
+        payload = await self._run(self._pop)
+        return json.loads(payload) if payload is not None else None
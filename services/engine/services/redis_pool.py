@@ -0,0 +1,73 @@
+from typing import Dict, Optional
+import redis
+import redis.asyncio as aioredis
+import logging
+import time
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[aioredis.Redis] = None
+
+def init_redis(url: str, max_connections: int = 50, socket_timeout: float = 2.0,
+               connect_timeout: float = 2.0, pool_timeout: float = 1.0,
+               health_check_interval: int = 30) -> aioredis.Redis:
+    """Create the process-wide async Redis client
+
+    Connections come from a bounded pool. A request that finds every
+    connection busy waits up to pool_timeout for one to free up, then
+    fails with a RedisError instead of opening more connections. Every
+    command is bounded by socket_timeout.
+    """
+    global _client
+    pool = aioredis.BlockingConnectionPool.from_url(
+        url,
+        max_connections=max_connections,
+        timeout=pool_timeout,
+        socket_timeout=socket_timeout,
+        socket_connect_timeout=connect_timeout,
+        health_check_interval=health_check_interval,
+        retry_on_timeout=True,
+        decode_responses=True
+    )
+    _client = aioredis.Redis(connection_pool=pool)
+
+    metrics.gauge("redis.pool.max", lambda: pool.max_connections)
+    metrics.gauge("redis.pool.in_use", lambda: len(pool._in_use_connections))
+    metrics.gauge("redis.pool.idle", lambda: len(pool._available_connections))
+    return _client
+
+async def close_redis():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def get_redis() -> aioredis.Redis:
+    """FastAPI dependency (and plain accessor for Socket.IO handlers) for the shared client"""
+    if _client is None:
+        raise RuntimeError("Redis pool not initialized")
+    return _client
+
+async def check_redis(client: aioredis.Redis) -> Dict:
+    """Ping Redis and report round-trip latency with the pool's usage"""
+    started = time.perf_counter()
+    try:
+        await client.ping()
+    except redis.RedisError as e:
+        metrics.counter("redis.health_failures").inc()
+        logger.error(f"Redis health check failed: {e}")
+        return {"status": "unavailable"}
+
+    latency = time.perf_counter() - started
+    metrics.histogram("redis.ping_seconds").observe(latency)
+    pool = client.connection_pool
+    return {
+        "status": "ok",
+        "latencyMs": round(latency * 1000, 3),
+        "pool": {
+            "max": pool.max_connections,
+            "inUse": len(getattr(pool, "_in_use_connections", ())),
+            "idle": len(getattr(pool, "_available_connections", ()))
+        }
+    }
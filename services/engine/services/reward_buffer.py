@@ -0,0 +1,146 @@
+import numpy as np
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import threading
+import time
+from .bandit_pool import BanditPool
+from .context import DEFAULT_USER
+
+logger = logging.getLogger(__name__)
+
+Update = Tuple[np.ndarray, np.ndarray]
+
+def _merge(pending: Dict, key, update: Update):
+    """Add an update (feature rows, sum of r x) to the one pending under key"""
+    X, db = update
+    if key in pending:
+        pending_X, pending_db = pending[key]
+        X, db = np.vstack([pending_X, X]), pending_db + db
+    pending[key] = (X, db)
+
+class RewardBuffer:
+    """Write-behind buffer that coalesces rewards per arm before they reach the bandit
+
+    Each (user, arm) pair accumulates the feature rows x and the sum of r x
+    over its pending rewards, the rows being what the arm's cached inverse
+    is updated with; in hybrid mode each arm also accumulates every user's
+    rewards for the shared model. A flush applies each user's touched arms
+    in one batched update and one Redis transaction, and the shared model's
+    in one more. Updates a flush fails to store are merged back and retried
+    by the next one. Flushes happen once max_pending rewards are buffered
+    or the oldest reward is max_delay seconds old.
+    """
+
+    def __init__(self, bandits: BanditPool, max_pending: int = 1000, max_delay: float = 5.0):
+        self.bandits = bandits
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str], Update] = {}
+        self._shared: Dict[str, Update] = {}
+        self._count = 0
+        self._oldest: Optional[float] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, track_uri: str, reward: float, user_id: str = DEFAULT_USER, context: Optional[Dict] = None):
+        """Buffer one reward, flushing if a threshold is reached
+
+        Raises ValueError if the track is not in the user's choice set.
+        """
+        x = self.bandits.reward_features(user_id, track_uri, context)
+        update = (x[None, :], reward * x)
+        with self._lock:
+            _merge(self._pending, (user_id, track_uri), update)
+            if self.bandits.shared is not None:
+                _merge(self._shared, track_uri, update)
+            self._count += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+        if self.due():
+            self.flush()
+
+    def add_many(self, rewards: List[Tuple[str, float]], user_id: str = DEFAULT_USER,
+                 context: Optional[Dict] = None) -> List[str]:
+        """Buffer several rewards from one user, returns the URIs rejected as unknown tracks"""
+        rejected = []
+        for track_uri, reward in rewards:
+            try:
+                self.add(track_uri, reward, user_id, context)
+            except ValueError:
+                rejected.append(track_uri)
+        return rejected
+
+    def due(self) -> bool:
+        """Whether the size or age threshold has been reached"""
+        if self._count >= self.max_pending:
+            return True
+        return self._oldest is not None and time.monotonic() - self._oldest >= self.max_delay
+
+    def flush(self) -> int:
+        """Apply all pending rewards to the bandits, returns the number of rewards flushed"""
+        with self._lock:
+            pending, shared, count = self._pending, self._shared, self._count
+            self._pending, self._shared, self._count, self._oldest = {}, {}, 0, None
+
+        by_user: Dict[str, Dict[str, Update]] = {}
+        for (user_id, track_uri), update in pending.items():
+            by_user.setdefault(user_id, {})[track_uri] = update
+        failed: Dict[Tuple[str, str], Update] = {}
+        for user_id, updates in by_user.items():
+            try:
+                self.bandits.apply_batch(user_id, updates)
+            except Exception as e:
+                logger.error(f"Error flushing rewards for user {user_id}, will retry: {e}")
+                failed.update({(user_id, track_uri): update for track_uri, update in updates.items()})
+        failed_shared: Dict[str, Update] = {}
+        if shared:
+            try:
+                self.bandits.apply_shared_batch(shared)
+            except Exception as e:
+                logger.error(f"Error flushing shared rewards, will retry: {e}")
+                failed_shared = shared
+
+        retried = self._requeue(failed, failed_shared)
+        if pending:
+            logger.info(f"Flushed {count - retried} rewards across {len(pending)} arms")
+        return count - retried
+
+    def _requeue(self, failed: Dict[Tuple[str, str], Update], failed_shared: Dict[str, Update]) -> int:
+        """Merge updates a flush failed to store back into the buffer, returns how many rewards that is"""
+        if not failed and not failed_shared:
+            return 0
+        rewards = max(
+            sum(len(X) for X, _ in failed.values()),
+            sum(len(X) for X, _ in failed_shared.values())
+        )
+        with self._lock:
+            for key, update in failed.items():
+                _merge(self._pending, key, update)
+            for track_uri, update in failed_shared.items():
+                _merge(self._shared, track_uri, update)
+            self._count += rewards
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+        return rewards
+
+    async def run(self, interval: Optional[float] = None, flush: Optional[Callable[[], Awaitable[int]]] = None):
+        """Flush on the age threshold even when no new rewards arrive
+
+        flush, if given, is an async replacement for self.flush, e.g. one
+        that runs it off the event loop.
+        """
+        interval = interval or self.max_delay / 2
+        while True:
+            await asyncio.sleep(interval)
+            if self.due():
+                try:
+                    if flush is not None:
+                        await flush()
+                    else:
+                        self.flush()
+                except Exception as e:
+                    logger.error(f"Error flushing rewards: {e}")
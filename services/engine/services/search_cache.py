@@ -0,0 +1,152 @@
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+import redis
+import hashlib
+import json
+import logging
+import threading
+import time
+import unicodedata
+import zlib
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the shared Redis tier's keys, bumped if the payload format changes
+KEY_PREFIX = "search:v1:"
+
+# zlib level for Redis payloads
+COMPRESS_LEVEL = 6
+
+def normalize_query(query: str) -> str:
+    """Cache key form of a query: NFKC, case-folded, with whitespace collapsed"""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+class MemoryTier:
+    """In-process LRU with per-entry expiry, bounded by the encoded size of its values
+
+    Expired entries are kept for up to stale_ttl more seconds (space
+    permitting) so callers can fall back to them when a refresh fails.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, stale_ttl: float = 0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.bytes = 0
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, stale: bool = False) -> Optional[Any]:
+        """Get an unexpired value, or with stale=True one still within its stale window"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, size, value = entry
+            now = time.monotonic()
+            if expires + self.stale_ttl <= now:
+                del self._entries[key]
+                self.bytes -= size
+                return None
+            if expires <= now and not stale:
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, size: int, ttl: Optional[float] = None):
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._entries[key] = (expires, size, value)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+
+class SearchCache:
+    """Two-tier cache of search results keyed by normalized query and limit
+
+    Lookups try the in-process tier first, then a Redis tier shared by every
+    worker, holding zlib-compressed JSON with the same TTL. A Redis hit is
+    copied into the local tier for the key's remaining lifetime. Redis errors
+    degrade to a miss rather than failing the search. The client must be
+    created without decode_responses since payloads are raw bytes.
+
+    Expired results stay available locally through get_stale for stale_ttl
+    seconds, for serving when the upstream search is slow or failing.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis], ttl: int = 3600,
+                 max_bytes: int = 8 * 1024 * 1024, stale_ttl: int = 86400):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.memory = MemoryTier(max_bytes, ttl, stale_ttl)
+
+        self.memory_hits = metrics.counter("search.cache.memory_hits")
+        self.redis_hits = metrics.counter("search.cache.redis_hits")
+        self.misses = metrics.counter("search.cache.misses")
+        metrics.gauge("search.cache.memory_bytes", lambda: self.memory.bytes)
+        metrics.gauge("search.cache.memory_entries", lambda: len(self.memory))
+
+    def key(self, query: str, limit: int) -> str:
+        return f"{normalize_query(query)}|{limit}"
+
+    def _redis_key(self, key: str) -> str:
+        # Hashed so arbitrary user input never ends up in a key name
+        return KEY_PREFIX + hashlib.sha1(key.encode()).hexdigest()
+
+    def get_local(self, query: str, limit: int) -> Optional[List[dict]]:
+        """Check only the in-process tier, cheap enough to call on the event loop"""
+        results = self.memory.get(self.key(query, limit))
+        if results is not None:
+            self.memory_hits.inc()
+        return results
+
+    def get_stale(self, query: str, limit: int) -> Optional[List[dict]]:
+        """Local results for the query even if expired, within the stale window"""
+        return self.memory.get(self.key(query, limit), stale=True)
+
+    def get(self, query: str, limit: int) -> Optional[List[dict]]:
+        """Check both tiers; may block on Redis"""
+        key = self.key(query, limit)
+        results = self.memory.get(key)
+        if results is not None:
+            self.memory_hits.inc()
+            return results
+
+        if self.redis is not None:
+            try:
+                with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.get(self._redis_key(key))
+                    pipe.pttl(self._redis_key(key))
+                    payload, ttl_ms = pipe.execute()
+            except redis.RedisError as e:
+                logger.error(f"Redis error reading search cache: {e}")
+                payload = None
+            if payload is not None:
+                encoded = zlib.decompress(payload)
+                results = json.loads(encoded)
+                self.memory.set(key, results, len(encoded), ttl_ms / 1000 if ttl_ms > 0 else None)
+                self.redis_hits.inc()
+                return results
+
+        self.misses.inc()
+        return None
+
+    def set(self, query: str, limit: int, results: List[dict]):
+        key = self.key(query, limit)
+        encoded = json.dumps(results, separators=(",", ":")).encode()
+        self.memory.set(key, results, len(encoded))
+        if self.redis is not None:
+            try:
+                self.redis.set(self._redis_key(key), zlib.compress(encoded, COMPRESS_LEVEL), ex=self.ttl)
+            except redis.RedisError as e:
+                logger.error(f"Redis error writing search cache: {e}")
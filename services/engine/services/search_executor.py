@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import asyncio
+import logging
+import time
+from . import metrics
+from .search_cache import SearchCache
+
+logger = logging.getLogger(__name__)
+
+class SearchOverloaded(Exception):
+    """Raised when the search queue is full and a query is shed instead of queued"""
+
+class SearchTimeout(Exception):
+    """Raised when a query misses its deadline and there are no stale results to serve"""
+
+class SearchExecutor:
+    """Runs blocking upstream searches on a bounded thread pool with single-flight
+
+    Concurrent calls for the same normalized query and limit share one
+    upstream call. Each caller waits at most timeout seconds; on timeout or
+    upstream failure it gets the last cached results for the query, even if
+    expired, and the upstream call keeps running to refresh the cache.
+    At most max_workers distinct searches run at once and max_queue more
+    wait, beyond that queries fail fast with SearchOverloaded.
+    """
+
+    def __init__(self, search_fn: Callable[[str, int], List[dict]], cache: SearchCache,
+                 max_workers: int = 4, max_queue: int = 32, timeout: float = 3.0):
+        self.search_fn = search_fn
+        self.cache = cache
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+
+        # Cache key -> future of the upstream call; only touched from the event loop thread
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+        self.coalesced = metrics.counter("search.coalesced")
+        self.stale_served = metrics.counter("search.stale_served")
+        self.timeouts = metrics.counter("search.timeouts")
+        self.rejected = metrics.counter("search.rejected")
+        self.upstream_time = metrics.histogram("search.upstream_seconds")
+        metrics.gauge("search.in_flight", lambda: len(self._in_flight))
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def _timed(self, query: str, limit: int) -> List[dict]:
+        started = time.perf_counter()
+        try:
+            return self.search_fn(query, limit)
+        finally:
+            self.upstream_time.observe(time.perf_counter() - started)
+
+    def _flight(self, query: str, limit: int) -> asyncio.Future:
+        """The in-flight future for the query, starting one if there is none"""
+        key = self.cache.key(query, limit)
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced.inc()
+            return future
+
+        if len(self._in_flight) >= self.max_workers + self.max_queue:
+            self.rejected.inc()
+            raise SearchOverloaded(f"Search queue full ({len(self._in_flight)} queries in flight)")
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self._timed, query, limit)
+        self._in_flight[key] = future
+
+        def done(f: asyncio.Future):
+            self._in_flight.pop(key, None)
+            # Mark any error retrieved, every waiter may have timed out already
+            if not f.cancelled():
+                f.exception()
+
+        future.add_done_callback(done)
+        return future
+
+    async def search(self, query: str, limit: int = 20, timeout: Optional[float] = None) -> List[dict]:
+        results = self.cache.get_local(query, limit)
+        if results is not None:
+            return results
+
+        future = self._flight(query, limit)
+        try:
+            # Shielded so one caller's deadline doesn't cancel the call others share
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            self.timeouts.inc()
+            stale = self.cache.get_stale(query, limit)
+            if stale is None:
+                raise SearchTimeout(f"Search for {query!r} timed out")
+        except Exception:
+            stale = self.cache.get_stale(query, limit)
+            if stale is None:
+                raise
+        self.stale_served.inc()
+        return stale
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
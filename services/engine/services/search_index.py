@@ -0,0 +1,125 @@
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Set
+import re
+import threading
+from .search_cache import normalize_query
+
+# Tracks kept in the index; the least recently seen are dropped beyond this
+MAX_TRACKS = 50000
+
+_TOKEN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(normalize_query(text))
+
+def from_queue_item(item: Dict) -> Dict:
+    """Search result shaped track from a queue item"""
+    return {
+        "id": item["uri"].rsplit(":", 1)[-1],
+        "title": item["title"],
+        "artists": [item["artist"]],
+        "thumbnail": item.get("thumbnail"),
+        "uri": item["uri"]
+    }
+
+def merge_results(local: List[Dict], remote: List[Dict], limit: int) -> List[Dict]:
+    """Local hits first, then remote results not already among them"""
+    seen = {track["uri"] for track in local}
+    return (local + [track for track in remote if track["uri"] not in seen])[:limit]
+
+class SearchIndex:
+    """In-memory inverted index over the title and artist tokens of tracks we've seen
+
+    Every query token matches as a prefix of an indexed token, so partial
+    words typed so far still find tracks. A track must match all query
+    tokens; whole-word matches rank above prefix matches, then the most
+    recently seen track wins. Prefixes are resolved with a binary search
+    over the sorted vocabulary.
+    """
+
+    def __init__(self, max_tracks: int = MAX_TRACKS):
+        self.max_tracks = max_tracks
+        self._tracks: "OrderedDict[str, Dict]" = OrderedDict()
+        self._tokens: Dict[str, Set[str]] = {}
+        # URI -> sequence number of when it was last added, for ranking by recency
+        self._seen: Dict[str, int] = {}
+        self._sequence = 0
+        self._postings: Dict[str, Set[str]] = {}
+        self._vocabulary: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def add(self, track: Dict):
+        """Index a track in search result shape, refreshing it if already known"""
+        uri = track["uri"]
+        tokens = set(tokenize(" ".join([track["title"], *track["artists"]])))
+        with self._lock:
+            self._unindex(uri)
+            self._tracks[uri] = track
+            self._tokens[uri] = tokens
+            self._sequence += 1
+            self._seen[uri] = self._sequence
+            for token in tokens:
+                posting = self._postings.get(token)
+                if posting is None:
+                    posting = self._postings[token] = set()
+                    insort(self._vocabulary, token)
+                posting.add(uri)
+            while len(self._tracks) > self.max_tracks:
+                self._unindex(next(iter(self._tracks)))
+
+    def add_many(self, tracks: Iterable[Dict]):
+        for track in tracks:
+            self.add(track)
+
+    def _unindex(self, uri: str):
+        if self._tracks.pop(uri, None) is None:
+            return
+        del self._seen[uri]
+        for token in self._tokens.pop(uri):
+            posting = self._postings[token]
+            posting.discard(uri)
+            if not posting:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+
+    def _prefix_matches(self, prefix: str) -> Set[str]:
+        matches = set()
+        i = bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            matches |= self._postings[self._vocabulary[i]]
+            i += 1
+        return matches
+
+    def complete(self, prefix: str, n: int = 3) -> List[str]:
+        """Indexed tokens extending prefix, most common first"""
+        with self._lock:
+            i = bisect_left(self._vocabulary, prefix)
+            extensions = []
+            while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+                if self._vocabulary[i] != prefix:
+                    extensions.append(self._vocabulary[i])
+                i += 1
+            extensions.sort(key=lambda token: -len(self._postings[token]))
+            return extensions[:n]
+
+    def search(self, query: str, limit: int = 20) -> List[Dict]:
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        with self._lock:
+            # Narrowest token first so the intersection shrinks quickly
+            candidates = None
+            for matches in sorted((self._prefix_matches(token) for token in tokens), key=len):
+                candidates = matches if candidates is None else candidates & matches
+                if not candidates:
+                    return []
+
+            ranked = sorted(
+                candidates,
+                key=lambda uri: (-sum(token in self._tokens[uri] for token in tokens), -self._seen[uri])
+            )
+            return [self._tracks[uri] for uri in ranked[:limit]]
@@ -0,0 +1,113 @@
+from typing import Awaitable, Callable, Dict, List, Set
+import asyncio
+import logging
+from . import metrics
+from .search_cache import SearchCache
+from .search_executor import SearchExecutor, SearchOverloaded, SearchTimeout
+from .search_index import SearchIndex, merge_results, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Seconds a query has to stand before it goes upstream; later keystrokes cancel it
+DEBOUNCE = 0.15
+
+# Completions of the last token searched ahead of the user after each query
+PREFETCH_COMPLETIONS = 2
+
+class Typeahead:
+    """Interactive search with at most one live query per sid
+
+    Each query is answered straight away from the local index and the
+    in-process search cache. If that falls short of the limit, the query
+    goes upstream once it has stood for the debounce interval, and the
+    merged results follow. A newer query from the same sid cancels the
+    older one, though a shared upstream call already running still
+    completes and fills the cache. Afterwards the most common completions
+    of the last token are searched in the background while the pool has
+    idle workers, so the next keystrokes are likely cache hits.
+    """
+
+    def __init__(self, index: SearchIndex, cache: SearchCache, executor: SearchExecutor,
+                 debounce: float = DEBOUNCE, prefetch: int = PREFETCH_COMPLETIONS):
+        self.index = index
+        self.cache = cache
+        self.executor = executor
+        self.debounce = debounce
+        self.prefetch = prefetch
+
+        # sid -> task answering its latest query; only touched from the event loop thread
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Background prefetches, referenced so they aren't collected mid-flight
+        self._prefetching: Set[asyncio.Task] = set()
+
+        self.superseded = metrics.counter("typeahead.superseded")
+        self.answered_locally = metrics.counter("typeahead.answered_locally")
+        self.prefetched = metrics.counter("typeahead.prefetched")
+
+    def query(self, sid: str, text: str, limit: int, emit: Callable[[Dict], Awaitable[None]]) -> asyncio.Task:
+        """Start answering text for sid, cancelling its previous query
+
+        emit is called with {"query", "results", "partial"} once for the
+        immediate answer and again if upstream results follow.
+        """
+        self.cancel(sid)
+        task = asyncio.create_task(self._answer(text, limit, emit))
+        self._tasks[sid] = task
+
+        def done(t: asyncio.Task):
+            if self._tasks.get(sid) is t:
+                del self._tasks[sid]
+
+        task.add_done_callback(done)
+        return task
+
+    def cancel(self, sid: str):
+        task = self._tasks.pop(sid, None)
+        if task is not None and not task.done():
+            self.superseded.inc()
+            task.cancel()
+
+    def _local(self, text: str, limit: int) -> List[Dict]:
+        cached = self.cache.get_local(text, limit)
+        return merge_results(self.index.search(text, limit), cached or [], limit)
+
+    async def _answer(self, text: str, limit: int, emit: Callable[[Dict], Awaitable[None]]):
+        results = self._local(text, limit)
+        if len(results) >= limit:
+            self.answered_locally.inc()
+            await emit({"query": text, "results": results, "partial": False})
+            self._prefetch(text, limit)
+            return
+
+        await emit({"query": text, "results": results, "partial": True})
+        await asyncio.sleep(self.debounce)
+        try:
+            remote = await self.executor.search(text, limit)
+        except (SearchOverloaded, SearchTimeout):
+            # The partial answer already sent stands
+            return
+        except Exception as e:
+            logger.error(f"Typeahead search for {text!r} failed: {e}")
+            return
+        await emit({"query": text, "results": merge_results(results, remote, limit), "partial": False})
+        self._prefetch(text, limit)
+
+    def _prefetch(self, text: str, limit: int):
+        tokens = tokenize(text)
+        if not tokens:
+            return
+        for completion in self.index.complete(tokens[-1], self.prefetch):
+            if self.executor.in_flight >= self.executor.max_workers:
+                return
+            candidate = " ".join([*tokens[:-1], completion])
+            if self.cache.memory.get(self.cache.key(candidate, limit)) is None:
+                self.prefetched.inc()
+                task = asyncio.create_task(self._warm(candidate, limit))
+                self._prefetching.add(task)
+                task.add_done_callback(self._prefetching.discard)
+
+    async def _warm(self, text: str, limit: int):
+        try:
+            await self.executor.search(text, limit)
+        except Exception as e:
+            logger.debug(f"Typeahead prefetch for {text!r} failed: {e}")
@@ -0,0 +1,406 @@
+import pytest
+import numpy as np
+import json
+import time
+import redis
+from fakeredis import FakeRedis
+from services.bandit import LinUCB, ucb_scores
+from services import bandit_store
+from services.bandit_store import ArmStore, sherman_morrison
+from services.bandit_pool import BanditPool
+from services.feature_store import FeatureStore
+from services.reward_buffer import RewardBuffer
+from services.mips_index import PartitionedMIPSIndex
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
+
+@pytest.fixture
+def bandit(fake_redis):
+    return LinUCB(fake_redis, subscribe=False)
+
+def test_ucb_scores_matches_per_arm_loop():
+    rng = np.random.default_rng(0)
+    n, d = 8, 5
+    A = np.stack([np.eye(d) + m @ m.T for m in rng.random((n, d, d))])
+    b = rng.random((n, d))
+    X = rng.random((n, d))
+
+    expected = []
+    for i in range(n):
+        A_inv = np.linalg.inv(A[i])
+        theta = A_inv @ b[i]
+        expected.append(X[i] @ theta + np.sqrt(X[i] @ A_inv @ X[i]))
+
+    scores = ucb_scores(np.linalg.inv(A), b, X, alpha=1.0)
+    assert np.allclose(scores, expected)
+
+def test_empty_choice_set(bandit):
+    with pytest.raises(ValueError):
+        bandit.get_recommendation()
+
+def test_add_choice_grows_arms(bandit):
+    for i in range(100):
+        bandit.add_choice(f"spotify:track:{i}")
+    bandit.add_choice("spotify:track:0")
+
+    assert bandit.n_arms == 100
+    assert bandit.A.shape[0] >= 100
+    assert np.array_equal(bandit.A[99], np.eye(bandit.d))
+
+def test_get_top_k(bandit):
+    for i in range(10):
+        bandit.add_choice(f"spotify:track:{i}")
+    bandit.b[3] = 1.0
+
+    top = bandit.get_top_k(3)
+    assert len(top) == 3
+    assert top[0] == "spotify:track:3"
+    assert bandit.get_recommendation() == "spotify:track:3"
+    assert len(bandit.get_top_k(50)) == 10
+
+def test_update_unknown_track(bandit):
+    with pytest.raises(ValueError):
+        bandit.update("spotify:track:missing", 1.0)
+
+def test_state_round_trip(fake_redis, bandit):
+    bandit.add_choice("spotify:track:1")
+    bandit.add_choice("spotify:track:2")
+    bandit.update("spotify:track:2", 1.0)
+
+    restored = LinUCB(fake_redis, subscribe=False)
+    restored._ensure_loaded()
+    assert restored.arms == ["spotify:track:1", "spotify:track:2"]
+    assert np.allclose(restored.A[:2], bandit.A[:2])
+    assert np.allclose(restored.b[:2], bandit.b[:2])
+
+def test_inverse_matches_after_updates(bandit):
+    bandit.add_choice("spotify:track:1")
+    for reward in [1.0, 0.0, 0.5, 0.8]:
+        bandit.update("spotify:track:1", reward)
+
+    assert np.allclose(bandit.A_inv[0], np.linalg.inv(bandit.A[0]))
+
+def test_sherman_morrison_matches_inverse():
+    rng = np.random.default_rng(0)
+    X = rng.random((3, 5))
+    assert np.allclose(sherman_morrison(np.eye(5), X), np.linalg.inv(np.eye(5) + X.T @ X))
+    assert sherman_morrison(np.eye(5), np.array([[np.nan] * 5])) is None
+
+def test_inverse_recomputed_only_periodically(bandit, monkeypatch):
+    monkeypatch.setattr(bandit_store, "REINVERT_EVERY", 3)
+    inv = np.linalg.inv
+    inversions = []
+    def counting_inv(a):
+        inversions.append(a)
+        return inv(a)
+    monkeypatch.setattr(np.linalg, "inv", counting_inv)
+
+    # Writes 1 to 6 to the arm; the 3rd and 6th re-invert, the rest are rank-one updates
+    bandit.add_choice("spotify:track:1")
+    for reward in [1.0, 0.0, 0.5, 0.8, 0.3]:
+        bandit.update("spotify:track:1", reward)
+    monkeypatch.undo()
+
+    assert len(inversions) == 2
+    assert bandit.versions["spotify:track:1"] == 6
+    assert np.allclose(bandit.A_inv[0], np.linalg.inv(bandit.A[0]))
+
+def test_concurrent_updates_from_two_workers_both_count(fake_redis):
+    worker_a = LinUCB(fake_redis, subscribe=False)
+    worker_b = LinUCB(fake_redis, subscribe=False)
+    worker_a.add_choice("spotify:track:1")
+    worker_b.add_choice("spotify:track:1")
+
+    # Neither worker has seen the other's reward before writing its own
+    worker_a.update("spotify:track:1", 1.0)
+    worker_b.update("spotify:track:1", 1.0)
+
+    x = worker_a.reward_features("spotify:track:1")
+    restored = LinUCB(fake_redis, subscribe=False)
+    restored._ensure_loaded()
+    assert np.allclose(restored.A[0], np.eye(5) + 2 * np.outer(x, x))
+    assert np.allclose(restored.b[0], 2 * x)
+    assert np.allclose(restored.A_inv[0], np.linalg.inv(restored.A[0]))
+    assert np.allclose(worker_b.A[0], restored.A[0])
+
+def test_update_retries_when_another_worker_writes_first(fake_redis, monkeypatch):
+    worker_a = LinUCB(fake_redis, subscribe=False)
+    worker_b = LinUCB(fake_redis, subscribe=False)
+    worker_a.add_choice("spotify:track:1")
+    worker_b.add_choice("spotify:track:1")
+
+    # worker_b's reward lands between worker_a's read and its write
+    read = redis.client.Pipeline.hmget
+    attempts = []
+    def read_then_interleave(pipe, key, *args):
+        payloads = read(pipe, key, *args)
+        if key != "bandit:arms":
+            return payloads
+        attempts.append(payloads)
+        if len(attempts) == 1:
+            worker_b.update("spotify:track:1", 1.0)
+        return payloads
+    monkeypatch.setattr(redis.client.Pipeline, "hmget", read_then_interleave)
+    worker_a.update("spotify:track:1", 1.0)
+    monkeypatch.undo()
+
+    x = worker_a.reward_features("spotify:track:1")
+    assert np.allclose(worker_a.A[0], np.eye(5) + 2 * np.outer(x, x))
+    assert worker_a.versions["spotify:track:1"] == 3
+    # worker_a's first read, worker_b's read, then worker_a's retry
+    assert len(attempts) == 3
+
+def test_update_writes_single_arm(fake_redis, bandit):
+    bandit.add_choice("spotify:track:1")
+    bandit.add_choice("spotify:track:2")
+    before = fake_redis.hget("bandit:arms", "spotify:track:1")
+    bandit.update("spotify:track:2", 1.0)
+
+    assert fake_redis.hlen("bandit:arms") == 2
+    assert fake_redis.hget("bandit:arms", "spotify:track:1") == before
+    assert len(fake_redis.hget("bandit:arms", "spotify:track:2")) == 8 * (2 * 25 + 5)
+
+def test_migrate_legacy_blob_state(fake_redis):
+    A = (np.eye(5) * 2).tolist()
+    fake_redis.set("bandit:A", json.dumps({"spotify:track:1": A}))
+    fake_redis.set("bandit:b", json.dumps({"spotify:track:1": [1.0] * 5}))
+
+    bandit = LinUCB(fake_redis, subscribe=False)
+    bandit._ensure_loaded()
+    assert bandit.arms == ["spotify:track:1"]
+    assert np.allclose(bandit.A_inv[0], np.eye(5) / 2)
+    assert np.allclose(bandit.b[0], 1.0)
+    assert not fake_redis.exists("bandit:A", "bandit:b", "bandit:A_inv")
+    assert ArmStore(fake_redis, 5).migrate_legacy() == 0
+
+def test_lazy_hydration(fake_redis):
+    fake_redis.hset("bandit:arms", "spotify:track:1", ArmStore(fake_redis, 5).pack(np.eye(5), np.eye(5), np.zeros(5)))
+    bandit = LinUCB(fake_redis, subscribe=False)
+    assert bandit.n_arms == 0
+
+    assert bandit.get_recommendation() == "spotify:track:1"
+
+def test_invalidation_refreshes_only_changed_arm(fake_redis):
+    worker_a = LinUCB(fake_redis, subscribe=False)
+    worker_b = LinUCB(fake_redis, subscribe=False)
+    worker_a.add_choice("spotify:track:1")
+    worker_a.add_choice("spotify:track:2")
+    worker_b._ensure_loaded()
+
+    worker_a.update("spotify:track:2", 1.0)
+    worker_a.add_choice("spotify:track:3")
+    for track_uri, version in worker_a.versions.items():
+        worker_b._on_invalidate({"data": f"{version} {track_uri}".encode()})
+
+    assert worker_b._stale == {"spotify:track:2", "spotify:track:3"}
+    worker_b._ensure_loaded()
+    assert worker_b.arms == ["spotify:track:1", "spotify:track:2", "spotify:track:3"]
+    assert np.allclose(worker_b.A[1], worker_a.A[1])
+    assert worker_b.versions == worker_a.versions
+
+def test_pubsub_listener(fake_redis):
+    worker_a = LinUCB(fake_redis, subscribe=False)
+    worker_b = LinUCB(fake_redis)
+    worker_b._ensure_loaded()
+    try:
+        worker_a.add_choice("spotify:track:1")
+        for _ in range(50):
+            if worker_b._stale:
+                break
+            time.sleep(0.05)
+        assert worker_b._stale == {"spotify:track:1"}
+    finally:
+        worker_b.close()
+
+def test_features_from_store(fake_redis, tmp_path):
+    store = FeatureStore(str(tmp_path / "features.f32"))
+    bandit = LinUCB(fake_redis, subscribe=False, feature_store=store)
+    bandit.add_choice("spotify:track:1")
+    bandit.add_choice("spotify:track:2")
+
+    store.upsert_many({"spotify:track:2": np.array([1.0, 0.0, 0.0, 0.0, 1.0])})
+    assert np.allclose(bandit._get_feature_matrix()[1], [1.0, 0.0, 0.0, 0.0, 1.0])
+    assert np.allclose(bandit._get_features("spotify:track:2"), [1.0, 0.0, 0.0, 0.0, 1.0])
+
+    bandit.update("spotify:track:2", 1.0)
+    assert np.allclose(bandit.b[1], [1.0, 0.0, 0.0, 0.0, 1.0])
+
+def test_context_weights_features(bandit):
+    bandit.add_choice("spotify:track:1")
+    context = {"vector": np.array([0.0, 1.0, 1.0, 1.0, 1.0])}
+    bandit.update("spotify:track:1", 1.0, context=context)
+
+    assert bandit.b[0][0] == 0.0
+    assert len(bandit.score(context)) == 1
+
+def test_reward_buffer_matches_sequential_updates(fake_redis):
+    sequential = LinUCB(fake_redis, subscribe=False)
+    pool = BanditPool(FakeRedis(), hybrid=False, subscribe=False)
+    buffered = pool.get("default")
+    rewards = [("spotify:track:1", 1.0), ("spotify:track:2", 0.5), ("spotify:track:1", 0.2)]
+    for bandit in (sequential, buffered):
+        bandit.add_choice("spotify:track:1")
+        bandit.add_choice("spotify:track:2")
+
+    for track_uri, reward in rewards:
+        sequential.update(track_uri, reward)
+    buffer = RewardBuffer(pool, max_pending=100, max_delay=60)
+    assert buffer.add_many(rewards + [("spotify:track:missing", 1.0)]) == ["spotify:track:missing"]
+    assert len(buffer) == 3
+    assert np.allclose(buffered.A[0], np.eye(5))
+
+    assert buffer.flush() == 3
+    assert np.allclose(buffered.A[:2], sequential.A[:2])
+    assert np.allclose(buffered.A_inv[:2], sequential.A_inv[:2])
+    assert np.allclose(buffered.b[:2], sequential.b[:2])
+    assert buffered.versions == {"spotify:track:1": 2, "spotify:track:2": 2}
+
+def test_reward_buffer_flushes_on_size(fake_redis):
+    pool = BanditPool(fake_redis, subscribe=False)
+    pool.add_choice("alice", "spotify:track:1")
+    buffer = RewardBuffer(pool, max_pending=2, max_delay=60)
+    buffer.add("spotify:track:1", 1.0, "alice")
+    assert len(buffer) == 1
+    buffer.add("spotify:track:1", 1.0, "alice")
+    assert len(buffer) == 0
+    assert pool.get("alice").b[0].sum() > 0
+    assert pool.shared.b[0].sum() > 0
+
+def test_concurrent_flushes_keep_every_batch(fake_redis):
+    # Two workers, each with its own pool and buffer, rewarding users who share the hybrid model
+    worker_a = BanditPool(fake_redis, subscribe=False)
+    worker_b = BanditPool(fake_redis, subscribe=False)
+    worker_a.add_choice("alice", "spotify:track:1")
+    worker_b.add_choice("bob", "spotify:track:1")
+    buffer_a = RewardBuffer(worker_a, max_pending=100, max_delay=60)
+    buffer_b = RewardBuffer(worker_b, max_pending=100, max_delay=60)
+    buffer_a.add_many([("spotify:track:1", 1.0)] * 3, "alice")
+    buffer_b.add_many([("spotify:track:1", 0.5)] * 2, "bob")
+
+    buffer_a.flush()
+    buffer_b.flush()
+
+    x = worker_a.reward_features("alice", "spotify:track:1")
+    restored = LinUCB(fake_redis, subscribe=False)
+    restored._ensure_loaded()
+    assert np.allclose(restored.A[0], np.eye(5) + 5 * np.outer(x, x))
+    assert np.allclose(restored.b[0], 4 * x)
+    assert np.allclose(worker_b.shared.A[0], restored.A[0])
+
+@pytest.mark.parametrize("failing", ["alice", None])
+def test_failed_flush_is_retried_once(fake_redis, monkeypatch, failing):
+    # Redis is down for alice's model, or for the shared one (no namespace), during the first flush
+    pool = BanditPool(fake_redis, subscribe=False)
+    pool.add_choice("alice", "spotify:track:1")
+    pool.add_choice("bob", "spotify:track:1")
+    buffer = RewardBuffer(pool, max_pending=100, max_delay=60)
+    buffer.add_many([("spotify:track:1", 1.0)] * 2, "alice")
+    buffer.add("spotify:track:1", 1.0, "bob")
+
+    add_to_arms = ArmStore.add_to_arms
+    def unavailable(store, deltas):
+        if store.namespace == failing:
+            raise redis.ConnectionError("Redis unavailable")
+        return add_to_arms(store, deltas)
+    monkeypatch.setattr(ArmStore, "add_to_arms", unavailable)
+    retried = 2 if failing == "alice" else 3
+    assert buffer.flush() == 3 - retried
+    assert len(buffer) == retried
+    monkeypatch.undo()
+
+    assert buffer.flush() == retried
+    assert len(buffer) == 0
+    x = pool.reward_features("alice", "spotify:track:1")
+    for namespace, rewards in (("alice", 2), ("bob", 1), (None, 3)):
+        restored = LinUCB(fake_redis, subscribe=False, namespace=namespace)
+        restored._ensure_loaded()
+        assert np.allclose(restored.A[0], np.eye(5) + rewards * np.outer(x, x))
+        assert np.allclose(restored.b[0], rewards * x)
+
+def test_pool_shards_state_per_user(fake_redis):
+    pool = BanditPool(fake_redis, subscribe=False)
+    pool.add_choice("alice", "spotify:track:1")
+    pool.add_choice("bob", "spotify:track:2")
+    pool.update("alice", "spotify:track:1", 1.0)
+
+    assert fake_redis.hkeys("bandit:{alice}:arms") == [b"spotify:track:1"]
+    assert fake_redis.hkeys("bandit:{bob}:arms") == [b"spotify:track:2"]
+    assert fake_redis.hlen("bandit:arms") == 2
+
+    # Bob can be rewarded for a track only alice chose, via the shared catalog
+    pool.update("bob", "spotify:track:1", 1.0)
+    assert sorted(pool.get("bob").arms) == ["spotify:track:1", "spotify:track:2"]
+
+def test_pool_evicts_least_recently_used(fake_redis):
+    pool = BanditPool(fake_redis, max_models=2, subscribe=False)
+    pool.add_choice("alice", "spotify:track:1")
+    pool.add_choice("bob", "spotify:track:1")
+    pool.get("alice")
+    pool.add_choice("carol", "spotify:track:1")
+
+    assert list(pool.models) == ["alice", "carol"]
+    assert pool.get_recommendation("bob") == "spotify:track:1"
+    assert pool.get("bob").n_arms == 1
+
+def test_pool_blends_personal_and_shared_scores(fake_redis):
+    pool = BanditPool(fake_redis, subscribe=False, personal_weight=1.0)
+    for i in range(5):
+        pool.add_choice("alice", f"spotify:track:{i}")
+    pool.add_choice("bob", "spotify:track:4")
+    for _ in range(10):
+        pool.update("bob", "spotify:track:4", 1.0)
+    for _ in range(5):
+        pool.update("alice", "spotify:track:2", 1.0)
+
+    # The shared model prefers track 4 overall, alice's own history prefers track 2
+    pool.shared.alpha = pool.get("alice").alpha = 0.0
+    assert pool.shared.get_recommendation() == "spotify:track:4"
+    assert pool.get_recommendation("alice") == "spotify:track:2"
+    assert pool.get_recommendation("bob") == "spotify:track:4"
+
+def test_mips_index_search():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, 4))
+    index = PartitionedMIPSIndex(4)
+    index.build(vectors)
+
+    query = np.array([1.0, 0.5, 0.0, -0.5])
+    expected = set(np.argsort(-(vectors @ query))[:10])
+    assert expected <= set(index.search(query, 50).tolist())
+
+    index.upsert([7], np.array([[100.0, 100.0, 0.0, -100.0]]))
+    assert 7 in index.search(query, 10)
+    index.upsert([2000], np.array([[200.0, 200.0, 0.0, -200.0]]))
+    assert len(index) == 2001
+    assert 2000 in index.search(query, 10)
+
+def test_approx_mode_finds_best_arm(fake_redis, tmp_path):
+    store = FeatureStore(str(tmp_path / "features.f32"))
+    rng = np.random.default_rng(1)
+    uris = [f"spotify:track:{i}" for i in range(500)]
+    store.upsert_many({uri: np.append(rng.random(4), 1.0) for uri in uris})
+
+    pool = BanditPool(fake_redis, hybrid=False, subscribe=False, feature_store=store, mode="approx", n_candidates=32)
+    bandit = pool.get("default")
+    buffer = RewardBuffer(pool, max_pending=10000, max_delay=60)
+    for uri in uris:
+        bandit.add_choice(uri)
+        buffer.add(uri, 0.1)
+    buffer.add("spotify:track:42", 1.0)
+    buffer.add("spotify:track:42", 1.0)
+    buffer.flush()
+
+    bandit.alpha = 0.0
+    assert bandit.get_recommendation() == "spotify:track:42"
+    for _ in range(5):
+        bandit.update("spotify:track:7", 1.0)
+    bandit.alpha = 1.0
+    approx = bandit.get_recommendation()
+    bandit.mode = "exact"
+    assert bandit.get_recommendation() == approx
+
+def test_unknown_scoring_mode(fake_redis):
+    with pytest.raises(ValueError):
+        LinUCB(fake_redis, mode="fast")
@@ -0,0 +1,51 @@
+import pytest
+import asyncio
+import threading
+from fakeredis import FakeRedis
+from services import metrics
+from services.bandit_pool import BanditPool
+from services.bandit_executor import BanditExecutor, BanditOverloaded
+from services.reward_buffer import RewardBuffer
+
+@pytest.fixture
+def executor():
+    bandits = BanditPool(FakeRedis(), subscribe=False)
+    executor = BanditExecutor(bandits, RewardBuffer(bandits), max_workers=1, max_queue=1)
+    yield executor
+    executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_runs_bandit_calls_off_loop(executor):
+    await executor.add_choice("alice", "spotify:track:1")
+    await executor.update("alice", "spotify:track:1", 1.0)
+    assert await executor.get_top_k("alice", 1) == ["spotify:track:1"]
+    assert await executor.add_rewards([("spotify:track:missing", 1.0)], "alice") == ["spotify:track:missing"]
+    assert executor.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_full(executor):
+    release = threading.Event()
+    rejected_before = metrics.counter("bandit.rejected").value
+
+    # One call running and one queued fill max_workers + max_queue
+    running = asyncio.ensure_future(executor.run(release.wait))
+    queued = asyncio.ensure_future(executor.run(lambda: "done"))
+    await asyncio.sleep(0)
+    with pytest.raises(BanditOverloaded):
+        await executor.run(lambda: None)
+    assert metrics.counter("bandit.rejected").value == rejected_before + 1
+
+    release.set()
+    assert await running is True
+    assert await queued == "done"
+    assert executor.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_records_queue_wait_and_compute_time(executor):
+    count = metrics.histogram("bandit.compute_seconds").count
+    await executor.run(sum, [1, 2, 3])
+
+    snapshot = metrics.snapshot()
+    assert snapshot["bandit.compute_seconds"]["count"] == count + 1
+    assert snapshot["bandit.queue_wait_seconds"]["count"] >= 1
+    assert snapshot["bandit.in_flight"] == 0
@@ -0,0 +1,73 @@
+import pytest
+import json
+from datetime import datetime, timedelta
+from fakeredis import FakeAsyncRedis
+from services.behavior_aggregates import BehaviorAggregates, AGGREGATE_KEY, increments, averages
+
+# Recording and folding are Lua scripts, which fakeredis runs through lupa
+pytest.importorskip("lupa")
+
+DAY = datetime(2024, 3, 10, 9, 30)
+
+@pytest.fixture
+def redis_client():
+    return FakeAsyncRedis(decode_responses=True)
+
+@pytest.fixture
+def aggregates(redis_client):
+    return BehaviorAggregates(redis_client)
+
+def test_increments_count_missing_fields_as_zero():
+    assert increments({"typingSpeed": 10, "idleMs": "x"}, None) == {"count": 1.0, "sum:typingSpeed": 10.0}
+    assert increments({"typingSpeed": 10}, 9) == {
+        "count": 1.0, "sum:typingSpeed": 10.0, "09:count": 1.0, "09:sum:typingSpeed": 10.0
+    }
+
+def test_averages_empty():
+    assert averages([]) == dict.fromkeys(
+        ["avgTypingSpeed", "avgBackspaceRate", "avgScrollRate", "avgIdleTime", "avgFocusTime"], 0
+    )
+
+@pytest.mark.asyncio
+async def test_window_sums_recorded_days(aggregates, redis_client):
+    await aggregates.record({"typingSpeed": 100, "focusMs": 1000}, DAY)
+    await aggregates.record({"typingSpeed": 200}, DAY + timedelta(days=1))
+    await aggregates.record({"typingSpeed": 600}, DAY + timedelta(days=5))
+
+    result = await aggregates.window(DAY, until=DAY + timedelta(days=1))
+    assert result["avgTypingSpeed"] == 150.0
+    assert result["avgFocusTime"] == 500.0
+    # Raw entries are still kept for training
+    assert json.loads((await redis_client.lrange("metrics:20240310", 0, -1))[0]) == {"typingSpeed": 100, "focusMs": 1000}
+
+@pytest.mark.asyncio
+async def test_window_reads_no_raw_entries(aggregates, redis_client):
+    await aggregates.record({"typingSpeed": 100}, DAY)
+    await aggregates.window(DAY, until=DAY)
+    await redis_client.delete("metrics:20240310")
+    assert (await aggregates.window(DAY, until=DAY))["avgTypingSpeed"] == 100.0
+
+@pytest.mark.asyncio
+async def test_hourly_window_trims_first_day(aggregates):
+    await aggregates.record({"typingSpeed": 100}, DAY.replace(hour=8))
+    await aggregates.record({"typingSpeed": 300}, DAY)
+    await aggregates.record({"typingSpeed": 500}, DAY + timedelta(days=1, hours=-9))
+
+    assert (await aggregates.window(DAY, until=DAY + timedelta(days=1)))["avgTypingSpeed"] == 300.0
+    assert (await aggregates.window(DAY, until=DAY + timedelta(days=1), hourly=True))["avgTypingSpeed"] == 400.0
+
+@pytest.mark.asyncio
+async def test_days_before_aggregation_are_folded_once(aggregates, redis_client):
+    timestamp = int(DAY.timestamp() * 1000)
+    await redis_client.rpush("metrics:20240310", *(json.dumps({"typingSpeed": speed, "timestamp": timestamp}) for speed in (100, 200)))
+    await redis_client.rpush("metrics:20240310", "not json")
+    # A metric recorded after the legacy ones is counted once, not folded again
+    await aggregates.record({"typingSpeed": 600}, DAY)
+
+    for _ in range(2):
+        result = await aggregates.window(DAY, until=DAY)
+        assert result["avgTypingSpeed"] == 900 / 4
+    bucket = await redis_client.hgetall(AGGREGATE_KEY.format(date="20240310"))
+    assert float(bucket["count"]) == 4
+    assert float(bucket["09:count"]) == 3
+    assert (await aggregates.window(DAY, until=DAY, hourly=True))["avgTypingSpeed"] == 300.0
@@ -4,7 +4,7 @@ from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from main import app
 from models import BreathingSession
-from routers.breathing import get_current_phase
+from routers.breathing import get_current_phase, get_session
 
 @pytest.fixture
 async def client():
@@ -12,21 +12,28 @@ async def client():
         yield client
 
 @pytest.fixture
-def db_session():
-    # Create a test database session
+def db_session(tmp_path):
+    # The app's async engine and this sync session share one SQLite file
     from sqlalchemy import create_engine
     from sqlalchemy.orm import sessionmaker
-    
-    engine = create_engine('sqlite:///:memory:')
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    
-    # Create tables
+    from sqlalchemy.ext.asyncio import async_sessionmaker
     from models import Base
+    from services.database import create_engine as create_async_engine
+
+    db_path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{db_path}")
     Base.metadata.create_all(engine)
-    
+
+    factory = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}"), expire_on_commit=False)
+    async def override_session():
+        async with factory() as session:
+            yield session
+    app.dependency_overrides[get_session] = override_session
+
+    session = sessionmaker(bind=engine)()
     yield session
     session.close()
+    app.dependency_overrides.pop(get_session, None)
 
 def test_get_current_phase():
     # Test phase transitions
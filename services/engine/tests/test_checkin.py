@@ -1,9 +1,11 @@
 import pytest
 import httpx
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from datetime import datetime, timedelta
+from sqlalchemy.exc import SQLAlchemyError
 from main import app
 from routers.mood import MOODS
+from routers.checkin import get_session
 from models import CheckIn
 
 @pytest.fixture
@@ -11,30 +13,56 @@ async def client():
     async with httpx.AsyncClient(app=app, base_url="http://test") as client:
         yield client
 
+@pytest.fixture
+def db_session(tmp_path):
+    # The app's async engine and this sync session share one SQLite file
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from models import Base
+    from services.database import create_engine as create_async_engine
+
+    db_path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+
+    factory = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}"), expire_on_commit=False)
+    async def override_session():
+        async with factory() as session:
+            yield session
+    app.dependency_overrides[get_session] = override_session
+
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    app.dependency_overrides.pop(get_session, None)
+
+@pytest.fixture
+def failing_session():
+    session = MagicMock()
+    session.execute = AsyncMock(side_effect=SQLAlchemyError("Database error"))
+    session.commit = AsyncMock(side_effect=SQLAlchemyError("Database error"))
+    async def override_session():
+        yield session
+    app.dependency_overrides[get_session] = override_session
+    yield session
+    app.dependency_overrides.pop(get_session, None)
+
 @pytest.mark.asyncio
-async def test_create_checkin_success(client):
-    with patch("routers.checkin.database") as mock_db:
-        mock_db.execute.return_value = MagicMock(lastrowid=1)
-        mock_db.fetch_one.return_value = MagicMock(
-            id=1,
-            timestamp=datetime.utcnow(),
-            mood_id="happy",
-            stress_level=3,
-            note="Test note"
-        )
-        
-        response = await client.post("/api/checkin", json={
-            "moodId": "happy",
-            "stressLevel": 3,
-            "note": "Test note"
-        })
-        
-        assert response.status_code == 200
-        data = response.json()
-        assert data["id"] == 1
-        assert data["mood_id"] == "happy"
-        assert data["stress_level"] == 3
-        assert data["note"] == "Test note"
+async def test_create_checkin_success(client, db_session):
+    response = await client.post("/api/checkin", json={
+        "moodId": "happy",
+        "stressLevel": 3,
+        "note": "Test note"
+    })
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["id"] == 1
+    assert data["moodId"] == "happy"
+    assert data["stressLevel"] == 3
+    assert data["note"] == "Test note"
+    assert db_session.query(CheckIn).count() == 1
 
 @pytest.mark.asyncio
 async def test_create_checkin_invalid_stress_level(client):
@@ -53,66 +81,45 @@ async def test_create_checkin_invalid_mood(client):
     assert response.status_code == 400
 
 @pytest.mark.asyncio
-async def test_create_checkin_db_error(client):
-    with patch("routers.checkin.database") as mock_db:
-        mock_db.execute.side_effect = Exception("Database error")
-        response = await client.post("/api/checkin", json={
-            "moodId": "happy",
-            "stressLevel": 3
-        })
-        assert response.status_code == 503
+async def test_create_checkin_db_error(client, failing_session):
+    response = await client.post("/api/checkin", json={
+        "moodId": "happy",
+        "stressLevel": 3
+    })
+    assert response.status_code == 503
 
 @pytest.mark.asyncio
-async def test_get_today_checkin(client):
-    with patch("routers.checkin.database") as mock_db:
-        mock_db.fetch_one.return_value = MagicMock(
-            id=1,
-            timestamp=datetime.utcnow(),
-            mood_id="happy",
-            stress_level=3,
-            note="Test note"
-        )
-        
-        response = await client.get("/api/checkin/today")
-        assert response.status_code == 200
-        data = response.json()
-        assert data["id"] == 1
-        assert data["mood_id"] == "happy"
+async def test_get_today_checkin(client, db_session):
+    db_session.add(CheckIn(timestamp=datetime.utcnow(), mood_id="happy", stress_level=3, note="Test note"))
+    db_session.commit()
+
+    response = await client.get("/api/checkin/today")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["id"] == 1
+    assert data["mood_id"] == "happy"
 
 @pytest.mark.asyncio
-async def test_get_today_checkin_none(client):
-    with patch("routers.checkin.database") as mock_db:
-        mock_db.fetch_one.return_value = None
-        response = await client.get("/api/checkin/today")
-        assert response.status_code == 200
-        assert response.json() is None
+async def test_get_today_checkin_none(client, db_session):
+    response = await client.get("/api/checkin/today")
+    assert response.status_code == 200
+    assert response.json() is None
 
 @pytest.mark.asyncio
-async def test_get_checkin_history(client):
-    with patch("routers.checkin.database") as mock_db:
-        mock_db.fetch_all.return_value = [
-            MagicMock(
-                id=1,
-                timestamp=datetime.utcnow(),
-                mood_id="happy",
-                stress_level=3,
-                note="Test note"
-            ),
-            MagicMock(
-                id=2,
-                timestamp=datetime.utcnow() - timedelta(days=1),
-                mood_id="calm",
-                stress_level=2,
-                note=None
-            )
-        ]
-        
-        response = await client.get("/api/checkin/history?days=2")
-        assert response.status_code == 200
-        data = response.json()
-        assert len(data) == 2
-        assert data[0]["mood_id"] == "happy"
-        assert data[1]["mood_id"] == "calm"
+async def test_get_checkin_history(client, db_session):
+    db_session.add_all([
+        CheckIn(timestamp=datetime.utcnow(), mood_id="happy", stress_level=3, note="Test note"),
+        CheckIn(timestamp=datetime.utcnow() - timedelta(days=1), mood_id="calm", stress_level=2),
+        CheckIn(timestamp=datetime.utcnow() - timedelta(days=5), mood_id="sad", stress_level=4)
+    ])
+    db_session.commit()
+
+    response = await client.get("/api/checkin/history?days=2")
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 2
+    assert data[0]["mood_id"] == "happy"
+    assert data[1]["mood_id"] == "calm"
 
 @pytest.mark.asyncio
 async def test_get_checkin_history_invalid_days(client):
@@ -120,8 +127,6 @@ async def test_get_checkin_history_invalid_days(client):
     assert response.status_code == 422
 
 @pytest.mark.asyncio
-async def test_get_checkin_history_db_error(client):
-    with patch("routers.checkin.database") as mock_db:
-        mock_db.fetch_all.side_effect = Exception("Database error")
-        response = await client.get("/api/checkin/history")
-        assert response.status_code == 503 
\ No newline at end of file
+async def test_get_checkin_history_db_error(client, failing_session):
+    response = await client.get("/api/checkin/history")
+    assert response.status_code == 503 
\ No newline at end of file
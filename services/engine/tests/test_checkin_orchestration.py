@@ -4,6 +4,7 @@ from unittest.mock import patch, MagicMock
 from datetime import datetime
 from sqlalchemy.orm import Session
 from main import app
+from routers.checkin import get_session
 from models import CheckIn, BreathingSession
 from fastapi import BackgroundTasks
 
@@ -13,21 +14,30 @@ async def client():
         yield client
 
 @pytest.fixture
-def db_session():
-    # Create a test database session
+def db_session(tmp_path):
+    # The app's async engine and this sync session share one SQLite file
     from sqlalchemy import create_engine
     from sqlalchemy.orm import sessionmaker
-    
-    engine = create_engine('sqlite:///:memory:')
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    
-    # Create tables
+    from sqlalchemy.ext.asyncio import async_sessionmaker
     from models import Base
+    from services.database import create_engine as create_async_engine
+
+    db_path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{db_path}")
     Base.metadata.create_all(engine)
-    
-    yield session
+
+    factory = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}"), expire_on_commit=False)
+    async def override_session():
+        async with factory() as session:
+            yield session
+    app.dependency_overrides[get_session] = override_session
+
+    session = sessionmaker(bind=engine)()
+    # Background tasks open their own sessions outside the request
+    with patch('routers.checkin.open_session', factory):
+        yield session
     session.close()
+    app.dependency_overrides.pop(get_session, None)
 
 @pytest.fixture
 def mock_background_tasks():
@@ -81,9 +91,9 @@ async def test_checkin_with_high_stress(db_session, client, mock_background_task
 @pytest.mark.asyncio
 async def test_checkin_with_breathing_error(db_session, client, mock_background_tasks):
     with patch('routers.checkin.background_tasks', mock_background_tasks), \
-         patch('httpx.AsyncClient.post') as mock_post:
+         patch('routers.checkin.begin_session') as mock_begin:
         # Mock breathing service error
-        mock_post.side_effect = Exception("Breathing service error")
+        mock_begin.side_effect = Exception("Breathing service error")
         
         # Create check-in with high stress
         response = await client.post(
@@ -131,4 +141,15 @@ async def test_checkin_with_db_error(db_session, client, mock_background_tasks):
         assert check_in is None
         
         # Verify no breathing session was scheduled
-        assert len(mock_background_tasks.tasks) == 0 
\ No newline at end of file
+        assert len(mock_background_tasks.tasks) == 0 
+
+@pytest.mark.asyncio
+async def test_breathing_session_started_in_process(db_session):
+    from routers.checkin import start_breathing_session
+
+    await start_breathing_session()
+    assert db_session.query(BreathingSession).filter(BreathingSession.end.is_(None)).count() == 1
+
+    # A second high-stress check-in doesn't start another
+    await start_breathing_session()
+    assert db_session.query(BreathingSession).count() == 1
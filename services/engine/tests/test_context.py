@@ -0,0 +1,131 @@
+import pytest
+import numpy as np
+import time
+from datetime import datetime
+from fakeredis import FakeRedis
+from services.context import ContextEncoder, MOOD_AFFECT, STRESS_KEY
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
+
+@pytest.fixture
+def encoder(fake_redis):
+    return ContextEncoder(fake_redis, subscribe=False)
+
+async def set_mood(fake_redis, encoder, mood_id, source="manual"):
+    # The mood endpoints store the mood before telling the encoder
+    fake_redis.set(f"current_mood_{source}", mood_id)
+    await encoder.on_mood(mood_id, source)
+
+def deliver(encoder, data):
+    encoder._on_invalidate({"data": data.encode()})
+
+def test_hydrates_mood_from_redis(fake_redis, encoder):
+    fake_redis.set("current_mood_ai", "sad")
+    x = encoder.vector(now=datetime(2024, 1, 1, 14))
+
+    assert x[0] == pytest.approx(MOOD_AFFECT["sad"][0])
+    assert x[2] == pytest.approx(1.0)
+    assert x[4] == 1.0
+
+@pytest.mark.asyncio
+async def test_manual_mood_overrides_ai(fake_redis, encoder):
+    await set_mood(fake_redis, encoder, "sad", "ai")
+    await set_mood(fake_redis, encoder, "happy", "manual")
+    assert encoder.vector()[0] == pytest.approx(MOOD_AFFECT["happy"][0])
+
+@pytest.mark.asyncio
+async def test_vector_is_cached_until_an_update(encoder):
+    now = datetime(2024, 1, 1, 9)
+    first = encoder.vector(now=now)
+    assert encoder.vector(now=now) is first
+
+    await encoder.on_checkin(5)
+    second = encoder.vector(now=now)
+    assert second is not first
+    assert second[1] < first[1]
+    assert encoder.vector(now=datetime(2024, 1, 1, 10)) is not second
+
+@pytest.mark.asyncio
+async def test_energy_ceiling_caps_energy(fake_redis, encoder):
+    await set_mood(fake_redis, encoder, "energetic")
+    await encoder.on_preferences(30)
+    assert encoder.vector()[1] == pytest.approx(0.3)
+
+@pytest.mark.asyncio
+async def test_every_user_gets_shared_mood_and_stress(fake_redis, encoder):
+    await set_mood(fake_redis, encoder, "energetic")
+    await encoder.on_checkin(5)
+    await encoder.on_preferences(30, "alice")
+    now = datetime(2024, 1, 1, 9)
+
+    alice, bob = encoder.vector("alice", now), encoder.vector("bob", now)
+    assert alice[0] == bob[0] == pytest.approx(MOOD_AFFECT["energetic"][0])
+    assert alice[1] == pytest.approx(0.3)
+    assert bob[1] == pytest.approx(MOOD_AFFECT["energetic"][1] / 2)
+
+    # A shared update invalidates every user's cached vector
+    await set_mood(fake_redis, encoder, "sad")
+    assert encoder.vector("alice", now)[0] == pytest.approx(MOOD_AFFECT["sad"][0])
+
+@pytest.mark.asyncio
+async def test_users_are_evicted_but_keep_their_energy_ceiling(fake_redis):
+    encoder = ContextEncoder(fake_redis, max_users=2, subscribe=False)
+    await set_mood(fake_redis, encoder, "energetic")
+    await encoder.on_preferences(30, "alice")
+    encoder.vector("bob")
+    encoder.vector("carol")
+
+    assert list(encoder.users) == ["bob", "carol"]
+    assert encoder.vector("alice")[1] == pytest.approx(0.3)
+    assert ContextEncoder(fake_redis, subscribe=False).vector("alice")[1] == pytest.approx(0.3)
+
+@pytest.mark.asyncio
+async def test_changes_reach_other_workers(fake_redis):
+    worker_a = ContextEncoder(fake_redis, subscribe=False)
+    worker_b = ContextEncoder(fake_redis, subscribe=False)
+    now = datetime(2024, 1, 1, 9)
+    before = worker_b.vector("alice", now)
+
+    await set_mood(fake_redis, worker_a, "energetic", "ai")
+    await worker_a.on_checkin(5)
+    await worker_a.on_preferences(30, "alice")
+    assert worker_b.vector("alice", now) is before
+
+    deliver(worker_b, "")
+    deliver(worker_b, "alice")
+    assert worker_b.vector("alice", now)[0] == pytest.approx(MOOD_AFFECT["energetic"][0])
+    assert worker_b.stress_level == 5
+    assert worker_b.vector("alice", now)[1] == pytest.approx(0.3)
+    assert worker_b.vector("bob", now)[1] == pytest.approx(MOOD_AFFECT["energetic"][1] / 2)
+
+@pytest.mark.asyncio
+async def test_listener_marks_shared_context_stale(fake_redis):
+    worker_a = ContextEncoder(fake_redis, subscribe=False)
+    worker_b = ContextEncoder(fake_redis)
+    worker_b.vector()
+    try:
+        await worker_a.on_checkin(5)
+        for _ in range(50):
+            if worker_b._stale:
+                break
+            time.sleep(0.05)
+        assert worker_b._stale
+        assert worker_b.vector()[1] < MOOD_AFFECT["neutral"][1]
+    finally:
+        worker_b.close()
+
+@pytest.mark.asyncio
+async def test_stress_seeded_only_when_redis_has_none(fake_redis, encoder):
+    await encoder.seed_stress(4)
+    assert fake_redis.get(STRESS_KEY) == b"4"
+    assert encoder.stress_level == 4
+
+    # A later check-in already in Redis wins over another worker's seed
+    await encoder.on_checkin(5)
+    restarted = ContextEncoder(fake_redis, subscribe=False)
+    await restarted.seed_stress(4)
+    now = datetime(2024, 1, 1, 9)
+    assert np.allclose(restarted.vector(now=now), encoder.vector(now=now))
+    assert restarted.stress_level == 5
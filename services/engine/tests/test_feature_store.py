@@ -0,0 +1,110 @@
+import pytest
+import numpy as np
+from fakeredis import FakeRedis
+from services.feature_store import FeatureStore, DEFAULT_FEATURES, GENRE_WEIGHTS_KEY
+
+@pytest.fixture
+def store(tmp_path):
+    return FeatureStore(str(tmp_path / "features.f32"))
+
+def test_unknown_track_gets_default_row(store):
+    assert np.array_equal(store.row("youtube:video:missing"), DEFAULT_FEATURES)
+    assert np.array_equal(store.get(["youtube:video:missing"]), [DEFAULT_FEATURES])
+
+def test_upsert_and_gather(store):
+    store.upsert_many({
+        "youtube:video:1": np.array([0.1, 0.2, 0.3, 0.4, 1.0]),
+        "youtube:video:2": np.array([0.5, 0.6, 0.7, 0.8, 1.0])
+    })
+    rows = store.resolve(["youtube:video:2", "youtube:video:missing", "youtube:video:1"])
+    assert rows.tolist() == [1, -1, 0]
+
+    matrix = store.gather(rows)
+    assert matrix.dtype == np.float32
+    assert np.allclose(matrix, [[0.5, 0.6, 0.7, 0.8, 1.0], DEFAULT_FEATURES, [0.1, 0.2, 0.3, 0.4, 1.0]])
+
+def test_grows_past_capacity(store):
+    features = {f"youtube:video:{i}": np.full(5, i, dtype=np.float32) for i in range(3000)}
+    store.upsert_many(features)
+
+    assert len(store) == 3000
+    assert store.matrix.shape[0] >= 3000
+    assert np.allclose(store.row("youtube:video:2999"), 2999)
+
+def test_persists_across_instances(tmp_path):
+    path = str(tmp_path / "features.f32")
+    FeatureStore(path).upsert_many({"youtube:video:1": np.array([0.1, 0.2, 0.3, 0.4, 1.0])})
+
+    reopened = FeatureStore(path)
+    assert reopened.uris == ["youtube:video:1"]
+    assert np.allclose(reopened.row("youtube:video:1"), [0.1, 0.2, 0.3, 0.4, 1.0])
+
+def test_instances_sharing_a_path_allocate_distinct_rows(tmp_path):
+    # Two worker processes mapping the same file
+    path = str(tmp_path / "features.f32")
+    worker_a, worker_b = FeatureStore(path), FeatureStore(path)
+    worker_a.upsert_many({"youtube:video:a": np.full(5, 1.0)})
+    worker_b.upsert_many({"youtube:video:b": np.full(5, 2.0)})
+
+    assert np.allclose(worker_a.row("youtube:video:a"), 1.0)
+    assert np.allclose(worker_b.row("youtube:video:a"), 1.0)
+    assert np.allclose(worker_b.row("youtube:video:b"), 2.0)
+
+    worker_a.upsert_many({"youtube:video:c": np.full(5, 3.0)})
+    assert worker_a.uris == ["youtube:video:a", "youtube:video:b", "youtube:video:c"]
+    assert np.allclose(worker_a.row("youtube:video:b"), 2.0)
+
+    reopened = FeatureStore(path)
+    assert reopened.uris == ["youtube:video:a", "youtube:video:b", "youtube:video:c"]
+    assert np.allclose(reopened.get(["youtube:video:a", "youtube:video:b", "youtube:video:c"])[:, 0], [1, 2, 3])
+
+def test_instance_sees_file_grown_by_another(tmp_path):
+    path = str(tmp_path / "features.f32")
+    worker_a, worker_b = FeatureStore(path), FeatureStore(path)
+    worker_b.upsert_many({f"youtube:video:{i}": np.full(5, i, dtype=np.float32) for i in range(3000)})
+    worker_a.upsert_many({"youtube:video:new": np.full(5, -1.0)})
+
+    assert worker_a.index["youtube:video:new"] == 3000
+    assert np.allclose(worker_a.row("youtube:video:2999"), 2999)
+    assert np.allclose(FeatureStore(path).row("youtube:video:new"), -1.0)
+
+def test_populate_from_search(store):
+    store.set_genre_weights({"Jazz": 80, "Rock": 20})
+    written = store.populate_from_search([
+        {"uri": "youtube:video:1", "title": "Late Night Jazz", "artists": ["Trio"]},
+        {"uri": "youtube:video:2", "title": "Song", "artists": ["Band"], "energy": 0.9}
+    ])
+
+    assert written == 2
+    assert store.row("youtube:video:1")[3] == pytest.approx(0.8)
+    assert store.row("youtube:video:2")[1] == pytest.approx(0.9)
+    assert store.populate_from_search([{"uri": "youtube:video:1", "title": "Jazz"}]) == 0
+
+def test_genre_weights_shared_through_redis(tmp_path):
+    redis_client = FakeRedis(decode_responses=True)
+    path = str(tmp_path / "features.f32")
+    worker_a = FeatureStore(path, redis_client=redis_client)
+    worker_b = FeatureStore(path, redis_client=redis_client)
+    worker_a.set_genre_weights({"Jazz": 80})
+
+    assert redis_client.get(GENRE_WEIGHTS_KEY) == '{"jazz": 80}'
+    worker_b.populate_from_search([{"uri": "youtube:video:1", "title": "Jazz Standards"}])
+    assert worker_b.row("youtube:video:1")[3] == pytest.approx(0.8)
+
+def test_changed_genre_weights_rescore_stored_rows(tmp_path):
+    path = str(tmp_path / "features.f32")
+    store = FeatureStore(path)
+    store.set_genre_weights({"jazz": 80})
+    store.populate_from_search([
+        {"uri": "youtube:video:1", "title": "Jazz Standards", "energy": 0.9},
+        {"uri": "youtube:video:2", "title": "Rock Anthem"}
+    ])
+    store.upsert_many({"youtube:video:3": np.array([0.1, 0.2, 0.3, 0.4, 1.0])})
+
+    # Another process, started later, changes the weights
+    FeatureStore(path).set_genre_weights({"rock": 30})
+    assert store.row("youtube:video:1")[3] == pytest.approx(0.5)
+    assert store.row("youtube:video:1")[1] == pytest.approx(0.9)
+    assert store.row("youtube:video:2")[3] == pytest.approx(0.3)
+    # Rows not populated from search keep their genre value
+    assert store.row("youtube:video:3")[3] == pytest.approx(0.4)
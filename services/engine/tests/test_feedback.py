@@ -1,8 +1,17 @@
 import pytest
 import httpx
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from main import app
-from routers.feedback import bandit
+from routers.feedback import bandits, reward_buffer, bandit_executor, BanditOverloaded, get_redis
+
+@pytest.fixture
+def mock_redis():
+    mock = AsyncMock()
+    # Pipelines are created synchronously and entered with async with
+    mock.pipeline = MagicMock()
+    app.dependency_overrides[get_redis] = lambda: mock
+    yield mock
+    app.dependency_overrides.pop(get_redis, None)
 
 @pytest.fixture
 async def client():
@@ -10,21 +19,20 @@ async def client():
         yield client
 
 @pytest.mark.asyncio
-async def test_add_feedback_success(client):
-    with patch("routers.feedback.redis_client") as mock_redis:
-        mock_pipe = MagicMock()
-        mock_redis.pipeline.return_value.__enter__.return_value = mock_pipe
-        mock_pipe.execute.return_value = [1, 1]  # rpush and incr results
+async def test_add_feedback_success(client, mock_redis):
+    mock_pipe = MagicMock()
+    mock_redis.pipeline.return_value.__aenter__.return_value = mock_pipe
+    mock_pipe.execute = AsyncMock(return_value=[1, 1])  # rpush and incr results
 
-        response = await client.post("/api/feedback", json={
-            "trackUri": "spotify:track:123",
-            "action": "like"
-        })
-        
-        assert response.status_code == 200
-        assert response.json() == {"success": True}
-        mock_pipe.rpush.assert_called_once()
-        mock_pipe.incr.assert_called_once()
+    response = await client.post("/api/feedback", json={
+        "trackUri": "spotify:track:123",
+        "action": "like"
+    })
+
+    assert response.status_code == 200
+    assert response.json() == {"success": True}
+    mock_pipe.rpush.assert_called_once()
+    mock_pipe.incr.assert_called_once()
 
 @pytest.mark.asyncio
 async def test_add_feedback_invalid_action(client):
@@ -35,25 +43,24 @@ async def test_add_feedback_invalid_action(client):
     assert response.status_code == 422
 
 @pytest.mark.asyncio
-async def test_add_feedback_redis_error(client):
-    with patch("routers.feedback.redis_client") as mock_redis:
-        mock_redis.pipeline.side_effect = Exception("Redis error")
-        response = await client.post("/api/feedback", json={
-            "trackUri": "spotify:track:123",
-            "action": "like"
-        })
-        assert response.status_code == 503
+async def test_add_feedback_redis_error(client, mock_redis):
+    mock_redis.pipeline.side_effect = Exception("Redis error")
+    response = await client.post("/api/feedback", json={
+        "trackUri": "spotify:track:123",
+        "action": "like"
+    })
+    assert response.status_code == 503
 
 @pytest.mark.asyncio
 async def test_add_reward_success(client):
-    with patch.object(bandit, "update") as mock_update:
+    with patch.object(bandits, "update") as mock_update:
         response = await client.post("/api/feedback/reward", json={
             "trackUri": "spotify:track:123",
             "reward": 0.8
         })
         assert response.status_code == 200
         assert response.json() == {"success": True}
-        mock_update.assert_called_once_with("spotify:track:123", 0.8)
+        mock_update.assert_called_once_with("default", "spotify:track:123", 0.8)
 
 @pytest.mark.asyncio
 async def test_add_reward_invalid_reward(client):
@@ -65,7 +72,7 @@ async def test_add_reward_invalid_reward(client):
 
 @pytest.mark.asyncio
 async def test_add_reward_invalid_track(client):
-    with patch.object(bandit, "update") as mock_update:
+    with patch.object(bandits, "update") as mock_update:
         mock_update.side_effect = ValueError("Track not in choice set")
         response = await client.post("/api/feedback/reward", json={
             "trackUri": "spotify:track:123",
@@ -74,29 +81,77 @@ async def test_add_reward_invalid_track(client):
         assert response.status_code == 400
 
 @pytest.mark.asyncio
-async def test_get_stats_success(client):
-    with patch("routers.feedback.redis_client") as mock_redis:
-        mock_pipe = MagicMock()
-        mock_redis.pipeline.return_value.__enter__.return_value = mock_pipe
-        mock_pipe.execute.return_value = ["5", "2", "1"]  # likes, dislikes, never
-
-        response = await client.get("/api/feedback/stats?trackUri=spotify:track:123")
+async def test_add_rewards_batch(client):
+    with patch.object(reward_buffer, "add_many") as mock_add_many:
+        mock_add_many.return_value = ["spotify:track:missing"]
+        response = await client.post("/api/feedback/rewards:batch", json={
+            "rewards": [
+                {"trackUri": "spotify:track:123", "reward": 0.8},
+                {"trackUri": "spotify:track:missing", "reward": 0.2}
+            ]
+        })
         assert response.status_code == 200
-        data = response.json()
-        assert data == {
-            "likes": 5,
-            "dislikes": 2,
-            "never": 1
-        }
+        assert response.json() == {"accepted": 1, "rejected": ["spotify:track:missing"]}
+        mock_add_many.assert_called_once_with([
+            ("spotify:track:123", 0.8),
+            ("spotify:track:missing", 0.2)
+        ], "default")
 
 @pytest.mark.asyncio
-async def test_get_stats_redis_error(client):
-    with patch("routers.feedback.redis_client") as mock_redis:
-        mock_redis.pipeline.side_effect = Exception("Redis error")
-        response = await client.get("/api/feedback/stats?trackUri=spotify:track:123")
-        assert response.status_code == 503
+async def test_add_rewards_batch_invalid_reward(client):
+    response = await client.post("/api/feedback/rewards:batch", json={
+        "rewards": [{"trackUri": "spotify:track:123", "reward": 1.5}]
+    })
+    assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_get_stats_success(client, mock_redis):
+    mock_pipe = MagicMock()
+    mock_redis.pipeline.return_value.__aenter__.return_value = mock_pipe
+    mock_pipe.execute = AsyncMock(return_value=["5", "2", "1"])  # likes, dislikes, never
+
+    response = await client.get("/api/feedback/stats?trackUri=spotify:track:123")
+    assert response.status_code == 200
+    data = response.json()
+    assert data == {
+        "likes": 5,
+        "dislikes": 2,
+        "never": 1
+    }
+
+@pytest.mark.asyncio
+async def test_get_stats_redis_error(client, mock_redis):
+    mock_redis.pipeline.side_effect = Exception("Redis error")
+    response = await client.get("/api/feedback/stats?trackUri=spotify:track:123")
+    assert response.status_code == 503
 
 @pytest.mark.asyncio
 async def test_get_stats_missing_track_uri(client):
     response = await client.get("/api/feedback/stats")
-    assert response.status_code == 422 
\ No newline at end of file
+    assert response.status_code == 422 
+@pytest.mark.asyncio
+async def test_get_recommendations(client):
+    with patch.object(bandits, "get_top_k") as mock_top_k:
+        mock_top_k.return_value = ["spotify:track:1", "spotify:track:2"]
+        response = await client.get("/api/feedback/recommendations?userId=alice&k=2")
+        assert response.status_code == 200
+        assert response.json() == {"userId": "alice", "tracks": ["spotify:track:1", "spotify:track:2"]}
+        mock_top_k.assert_called_once_with("alice", 2)
+
+@pytest.mark.asyncio
+async def test_get_recommendations_empty_choice_set(client):
+    with patch.object(bandits, "get_top_k") as mock_top_k:
+        mock_top_k.side_effect = ValueError("No tracks in choice set")
+        response = await client.get("/api/feedback/recommendations")
+        assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_add_reward_overloaded(client):
+    with patch.object(bandit_executor, "update") as mock_update:
+        mock_update.side_effect = BanditOverloaded("Bandit queue full")
+        response = await client.post("/api/feedback/reward", json={
+            "trackUri": "spotify:track:123",
+            "reward": 0.8
+        })
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
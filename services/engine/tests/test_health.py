@@ -1,6 +1,9 @@
 import pytest
 import httpx
-from main import app
+from unittest.mock import AsyncMock
+from fakeredis import FakeAsyncRedis
+import redis
+from main import app, get_redis
 
 @pytest.fixture
 async def client():
@@ -17,4 +20,28 @@ async def test_health_check(client):
 async def test_404_not_found(client):
     response = await client.get("/nonexistent")
     assert response.status_code == 404
-    assert "detail" in response.json() 
\ No newline at end of file
+    assert "detail" in response.json() 
+
+@pytest.mark.asyncio
+async def test_redis_health(client):
+    app.dependency_overrides[get_redis] = lambda: FakeAsyncRedis()
+    try:
+        response = await client.get("/health/redis")
+    finally:
+        app.dependency_overrides.pop(get_redis, None)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "ok"
+    assert set(data["pool"]) == {"max", "inUse", "idle"}
+
+@pytest.mark.asyncio
+async def test_redis_health_unavailable(client):
+    mock = AsyncMock()
+    mock.ping.side_effect = redis.ConnectionError("Connection refused")
+    app.dependency_overrides[get_redis] = lambda: mock
+    try:
+        response = await client.get("/health/redis")
+    finally:
+        app.dependency_overrides.pop(get_redis, None)
+    assert response.status_code == 503
+    assert response.json() == {"status": "unavailable"}
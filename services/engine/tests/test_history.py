@@ -1,13 +1,21 @@
 import pytest
 import httpx
-from unittest.mock import patch
-from fakeredis import FakeRedis
+from unittest.mock import patch, AsyncMock
+from fakeredis import FakeRedis, FakeAsyncRedis, FakeServer
 import json
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
+import redis
 from main import app
 from models import CheckIn
-from routers.history import get_date_keys
+from routers.history import get_date_keys, get_redis, get_session
+
+@pytest.fixture
+def mock_redis():
+    mock = AsyncMock()
+    app.dependency_overrides[get_redis] = lambda: mock
+    yield mock
+    app.dependency_overrides.pop(get_redis, None)
 
 @pytest.fixture
 async def client():
@@ -16,24 +24,35 @@ async def client():
 
 @pytest.fixture
 def fake_redis():
-    return FakeRedis()
+    # Sync view for seeding and assertions, sharing data with the async client the app uses
+    server = FakeServer()
+    app.dependency_overrides[get_redis] = lambda: FakeAsyncRedis(server=server, decode_responses=True)
+    yield FakeRedis(server=server, decode_responses=True)
+    app.dependency_overrides.pop(get_redis, None)
 
 @pytest.fixture
-def db_session():
-    # Create a test database session
+def db_session(tmp_path):
+    # The app's async engine and this sync session share one SQLite file
     from sqlalchemy import create_engine
     from sqlalchemy.orm import sessionmaker
-    
-    engine = create_engine('sqlite:///:memory:')
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    
-    # Create tables
+    from sqlalchemy.ext.asyncio import async_sessionmaker
     from models import Base
+    from services.database import create_engine as create_async_engine
+
+    db_path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{db_path}")
     Base.metadata.create_all(engine)
-    
+
+    factory = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}"), expire_on_commit=False)
+    async def override_session():
+        async with factory() as session:
+            yield session
+    app.dependency_overrides[get_session] = override_session
+
+    session = sessionmaker(bind=engine)()
     yield session
     session.close()
+    app.dependency_overrides.pop(get_session, None)
 
 def test_get_date_keys():
     since = datetime(2024, 1, 1)
@@ -97,53 +116,104 @@ async def test_get_mood_history(db_session, client):
 
 @pytest.mark.asyncio
 async def test_get_play_history_empty(client, fake_redis):
-    with patch('routers.history.redis_client', fake_redis):
-        response = await client.get("/api/history/plays?since=2024-01-01T00:00:00")
-        assert response.status_code == 200
-        assert response.json() == []
+    response = await client.get("/api/history/plays?since=2024-01-01T00:00:00")
+    assert response.status_code == 200
+    assert response.json() == []
 
 @pytest.mark.asyncio
 async def test_get_play_history(client, fake_redis):
-    with patch('routers.history.redis_client', fake_redis):
-        # Add test data for two days
-        today = datetime.now()
-        yesterday = today - timedelta(days=1)
-        
-        # Add plays for yesterday
-        play_yesterday = {
-            "timestamp": int(yesterday.timestamp() * 1000),
-            "uri": "spotify:track:123"
-        }
-        fake_redis.rpush(f"plays:{yesterday.strftime('%Y%m%d')}", json.dumps(play_yesterday))
-        
-        # Add plays for today
-        play_today = {
-            "timestamp": int(today.timestamp() * 1000),
-            "uri": "spotify:track:456"
-        }
-        fake_redis.rpush(f"plays:{today.strftime('%Y%m%d')}", json.dumps(play_today))
-        
-        # Get plays since yesterday
-        response = await client.get(f"/api/history/plays?since={yesterday.isoformat()}")
-        assert response.status_code == 200
-        
-        results = response.json()
-        assert len(results) == 2
-        assert all(play["uri"] in ["spotify:track:123", "spotify:track:456"] for play in results)
-        
-        # Get plays since today
-        response = await client.get(f"/api/history/plays?since={today.isoformat()}")
-        assert response.status_code == 200
-        
-        results = response.json()
-        assert len(results) == 1
-        assert results[0]["uri"] == "spotify:track:456"
+    # Add test data for two days
+    today = datetime.now()
+    yesterday = today - timedelta(days=1)
+
+    # Add plays for yesterday
+    play_yesterday = {
+        "timestamp": int(yesterday.timestamp() * 1000),
+        "uri": "spotify:track:123"
+    }
+    fake_redis.rpush(f"plays:{yesterday.strftime('%Y%m%d')}", json.dumps(play_yesterday))
+
+    # Add plays for today
+    play_today = {
+        "timestamp": int(today.timestamp() * 1000),
+        "uri": "spotify:track:456"
+    }
+    fake_redis.rpush(f"plays:{today.strftime('%Y%m%d')}", json.dumps(play_today))
+
+    # Get plays since yesterday
+    response = await client.get(f"/api/history/plays?since={yesterday.isoformat()}")
+    assert response.status_code == 200
+
+    results = response.json()
+    assert len(results) == 2
+    assert all(play["uri"] in ["spotify:track:123", "spotify:track:456"] for play in results)
+
+    # Get plays since today
+    response = await client.get(f"/api/history/plays?since={today.isoformat()}")
+    assert response.status_code == 200
+
+    results = response.json()
+    assert len(results) == 1
+    assert results[0]["uri"] == "spotify:track:456"
+
+@pytest.mark.asyncio
+async def test_get_play_history_error(client, mock_redis):
+    mock_redis.lrange.side_effect = redis.RedisError("Redis error")
+
+    response = await client.get("/api/history/plays?since=2024-01-01T00:00:00")
+    assert response.status_code == 503
+    assert "Service temporarily unavailable" in response.json()["detail"]
+
+def seed_plays(fake_redis, day, n):
+    fake_redis.rpush(
+        f"plays:{day.strftime('%Y%m%d')}",
+        *(json.dumps({"timestamp": i, "uri": f"spotify:track:{day.day}-{i}"}) for i in range(n))
+    )
+
+@pytest.mark.asyncio
+async def test_stream_play_history(client, fake_redis):
+    today = datetime.now()
+    yesterday = today - timedelta(days=1)
+    seed_plays(fake_redis, yesterday, 3)
+    seed_plays(fake_redis, today, 2)
+
+    response = await client.get(f"/api/history/plays/stream?since={yesterday.isoformat()}")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [play["uri"] for play in lines] == [
+        *(f"spotify:track:{yesterday.day}-{i}" for i in range(3)),
+        *(f"spotify:track:{today.day}-{i}" for i in range(2))
+    ]
 
 @pytest.mark.asyncio
-async def test_get_play_history_error(client):
-    with patch('routers.history.redis_client') as mock_redis:
-        mock_redis.llen.side_effect = Exception("Redis error")
-        
-        response = await client.get("/api/history/plays?since=2024-01-01T00:00:00")
-        assert response.status_code == 503
-        assert "Service temporarily unavailable" in response.json()["detail"] 
\ No newline at end of file
+async def test_stream_play_history_pages_by_cursor(client, fake_redis):
+    today = datetime.now()
+    yesterday = today - timedelta(days=1)
+    seed_plays(fake_redis, yesterday, 3)
+    seed_plays(fake_redis, today, 2)
+
+    uris, cursor = [], ""
+    for _ in range(5):
+        response = await client.get(
+            f"/api/history/plays/stream?since={yesterday.isoformat()}&limit=2&cursor={cursor}"
+        )
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        uris += [line["uri"] for line in lines if "uri" in line]
+        if "nextCursor" not in lines[-1]:
+            break
+        cursor = lines[-1]["nextCursor"]
+    assert len(uris) == 5 and len(set(uris)) == 5
+
+@pytest.mark.asyncio
+async def test_stream_play_history_bad_cursor(client, fake_redis):
+    response = await client.get("/api/history/plays/stream?since=2024-01-01T00:00:00&cursor=nope")
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_stream_play_history_error(client, mock_redis):
+    mock_redis.lrange.side_effect = redis.RedisError("Redis error")
+
+    response = await client.get("/api/history/plays/stream?since=2024-01-01T00:00:00")
+    assert response.status_code == 200
+    assert json.loads(response.text.splitlines()[-1]) == {"error": "Service temporarily unavailable"}
@@ -1,11 +1,13 @@
 import pytest
 import httpx
 from unittest.mock import patch
-from fakeredis import FakeRedis
+from fakeredis import FakeRedis, FakeAsyncRedis, FakeServer
 import json
 from datetime import datetime, timedelta
+import redis
 from main import app
-from routers.insights import get_date_keys, process_metrics_batch
+from services.behavior_aggregates import BehaviorAggregates
+from routers.insights import get_date_keys, process_metrics_batch, get_redis
 
 @pytest.fixture
 async def client():
@@ -14,7 +16,11 @@ async def client():
 
 @pytest.fixture
 def fake_redis():
-    return FakeRedis()
+    # Sync view for seeding and assertions, sharing data with the async client the app uses
+    server = FakeServer()
+    app.dependency_overrides[get_redis] = lambda: FakeAsyncRedis(server=server, decode_responses=True)
+    yield FakeRedis(server=server, decode_responses=True)
+    app.dependency_overrides.pop(get_redis, None)
 
 def test_get_date_keys():
     since = datetime(2024, 1, 1)
@@ -62,51 +68,62 @@ def test_process_metrics_batch():
 
 @pytest.mark.asyncio
 async def test_get_behavioral_insights(client, fake_redis):
-    with patch('routers.insights.redis_client', fake_redis):
-        # Add test data for two days
-        today = datetime.now()
-        yesterday = today - timedelta(days=1)
-        
-        # Add metrics for yesterday
-        metrics_yesterday = {
-            "typingSpeed": 100,
-            "backspaceRate": 0.1,
-            "scrollRate": 2.0,
-            "idleMs": 5000,
-            "focusMs": 10000,
-            "timestamp": int(yesterday.timestamp() * 1000)
-        }
-        fake_redis.rpush(f"metrics:{yesterday.strftime('%Y%m%d')}", json.dumps(metrics_yesterday))
-        
-        # Add metrics for today
-        metrics_today = {
-            "typingSpeed": 200,
-            "backspaceRate": 0.2,
-            "scrollRate": 3.0,
-            "idleMs": 6000,
-            "focusMs": 12000,
-            "timestamp": int(today.timestamp() * 1000)
-        }
-        fake_redis.rpush(f"metrics:{today.strftime('%Y%m%d')}", json.dumps(metrics_today))
-        
-        # Get insights since yesterday
-        response = await client.get(f"/api/insights/behavioral?since={yesterday.isoformat()}")
-        assert response.status_code == 200
-        
-        result = response.json()
-        assert result == {
-            "avgTypingSpeed": 150.0,
-            "avgBackspaceRate": 0.15,
-            "avgScrollRate": 2.5,
-            "avgIdleTime": 5500.0,
-            "avgFocusTime": 11000.0
-        }
+    # Add test data for two days
+    today = datetime.now()
+    yesterday = today - timedelta(days=1)
+
+    # Add metrics for yesterday
+    metrics_yesterday = {
+        "typingSpeed": 100,
+        "backspaceRate": 0.1,
+        "scrollRate": 2.0,
+        "idleMs": 5000,
+        "focusMs": 10000,
+        "timestamp": int(yesterday.timestamp() * 1000)
+    }
+    fake_redis.rpush(f"metrics:{yesterday.strftime('%Y%m%d')}", json.dumps(metrics_yesterday))
+
+    # Add metrics for today
+    metrics_today = {
+        "typingSpeed": 200,
+        "backspaceRate": 0.2,
+        "scrollRate": 3.0,
+        "idleMs": 6000,
+        "focusMs": 12000,
+        "timestamp": int(today.timestamp() * 1000)
+    }
+    fake_redis.rpush(f"metrics:{today.strftime('%Y%m%d')}", json.dumps(metrics_today))
+
+    # Get insights since yesterday
+    response = await client.get(f"/api/insights/behavioral?since={yesterday.isoformat()}")
+    assert response.status_code == 200
+
+    result = response.json()
+    assert result == {
+        "avgTypingSpeed": 150.0,
+        "avgBackspaceRate": 0.15,
+        "avgScrollRate": 2.5,
+        "avgIdleTime": 5500.0,
+        "avgFocusTime": 11000.0
+    }
+
+@pytest.mark.asyncio
+async def test_get_behavioral_insights_recorded(client, fake_redis):
+    # Metrics recorded at ingest are answered from the running sums alone
+    aggregates = BehaviorAggregates(app.dependency_overrides[get_redis]())
+    now = datetime.now()
+    await aggregates.record({"typingSpeed": 100, "idleMs": 5000}, now)
+    await aggregates.record({"typingSpeed": 300, "idleMs": 7000}, now)
+    fake_redis.delete(f"metrics:{now.strftime('%Y%m%d')}")
+
+    response = await client.get(f"/api/insights/behavioral?since={now.isoformat()}")
+    assert response.status_code == 200
+    assert response.json()["avgTypingSpeed"] == 200.0
+    assert response.json()["avgIdleTime"] == 6000.0
 
 @pytest.mark.asyncio
-async def test_get_behavioral_insights_error(client):
-    with patch('routers.insights.redis_client') as mock_redis:
-        mock_redis.llen.side_effect = Exception("Redis error")
-        
+async def test_get_behavioral_insights_error(client, fake_redis):
+    with patch.object(BehaviorAggregates, "window", side_effect=redis.RedisError("Redis error")):
         response = await client.get("/api/insights/behavioral?since=2024-01-01T00:00:00")
-        assert response.status_code == 503
-        assert "Service temporarily unavailable" in response.json()["detail"] 
\ No newline at end of file
+    assert response.status_code == 503
+    assert "Service temporarily unavailable" in response.json()["detail"]
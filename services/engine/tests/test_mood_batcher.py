@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from services.mood_batcher import MoodBatcher, batch_prompt, parse_moods
+
+class FakeBatchClassifier:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    async def __call__(self, snapshots):
+        self.batches.append(snapshots)
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("quota exceeded")
+        return ["calm" if s["typingSpeed"] < 100 else "energetic" for s in snapshots]
+
+def test_batch_prompt_numbers_snapshots():
+    prompt = batch_prompt([{"typingSpeed": 1}, {"typingSpeed": 2}])
+    assert '1. {"typingSpeed": 1}' in prompt and '2. {"typingSpeed": 2}' in prompt
+    assert "JSON array of 2" in prompt
+
+def test_parse_moods():
+    assert parse_moods('```json\n["Calm", "sad"]\n```', 2) == ["calm", "sad"]
+    assert parse_moods('["calm", "grumpy"]', 2) == ["calm", "neutral"]
+    assert parse_moods('["calm"]', 2) == ["neutral", "neutral"]
+    assert parse_moods("calm, sad", 2) == ["neutral", "neutral"]
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_a_batch():
+    classifier = FakeBatchClassifier()
+    batcher = MoodBatcher(classifier, max_batch=10, max_wait=0.01)
+    moods = await asyncio.gather(*(batcher({"typingSpeed": speed}) for speed in (50, 150, 60)))
+    assert moods == ["calm", "energetic", "calm"]
+    assert len(classifier.batches) == 1
+
+@pytest.mark.asyncio
+async def test_full_batch_goes_out_without_waiting():
+    classifier = FakeBatchClassifier()
+    batcher = MoodBatcher(classifier, max_batch=2, max_wait=60)
+    moods = await asyncio.wait_for(
+        asyncio.gather(*(batcher({"typingSpeed": speed}) for speed in (50, 150, 60, 160))), 1
+    )
+    assert moods == ["calm", "energetic", "calm", "energetic"]
+    assert [len(batch) for batch in classifier.batches] == [2, 2]
+
+@pytest.mark.asyncio
+async def test_failed_batch_falls_back():
+    batcher = MoodBatcher(FakeBatchClassifier(fail=True), max_batch=10, max_wait=0.01)
+    moods = await asyncio.gather(batcher({"typingSpeed": 50}), batcher({"typingSpeed": 150}))
+    assert moods == ["neutral", "neutral"]
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_leaves_batch_intact():
+    classifier = FakeBatchClassifier()
+    batcher = MoodBatcher(classifier, max_batch=10, max_wait=0.01)
+    abandoned = asyncio.create_task(batcher({"typingSpeed": 50}))
+    await asyncio.sleep(0)
+    abandoned.cancel()
+    assert await batcher({"typingSpeed": 150}) == "energetic"
+    assert len(classifier.batches[0]) == 2
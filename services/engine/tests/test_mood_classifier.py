@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from services.mood_classifier import MoodClassifier, LocalFirstClassifier, featurize
+
+class FakeRemote:
+    def __init__(self, mood="anxious"):
+        self.mood = mood
+        self.calls = 0
+
+    async def __call__(self, snapshot):
+        self.calls += 1
+        return self.mood
+
+def snapshot(typing_speed, idle_ms):
+    return {"typingSpeed": typing_speed, "backspaceRate": 0.1, "scrollRate": 5, "idleMs": idle_ms, "focusMs": 1000}
+
+@pytest.fixture
+def model():
+    rng = np.random.default_rng(0)
+    snapshots, moods = [], []
+    for _ in range(100):
+        snapshots.append(snapshot(rng.uniform(200, 300), rng.uniform(0, 100)))
+        moods.append("energetic")
+        snapshots.append(snapshot(rng.uniform(5, 20), rng.uniform(20000, 60000)))
+        moods.append("tired")
+    return MoodClassifier.fit(snapshots, moods)
+
+def test_featurize_requires_every_field():
+    assert featurize(snapshot(100, 0)).shape == (5,)
+    assert featurize({"typingSpeed": 100}) is None
+    assert featurize({**snapshot(100, 0), "idleMs": "long"}) is None
+
+def test_fit_rejects_unusable_snapshots():
+    with pytest.raises(ValueError):
+        MoodClassifier.fit([{"typingSpeed": 1}], ["calm"])
+
+def test_predict_separable_moods(model):
+    mood, confidence = model.predict(snapshot(250, 50))
+    assert (mood, confidence > 0.9) == ("energetic", True)
+    assert model.predict(snapshot(10, 40000))[0] == "tired"
+    assert model.predict({"typingSpeed": 250}) is None
+
+def test_save_load_round_trip(model, tmp_path):
+    path = str(tmp_path / "mood_model.npz")
+    model.save(path)
+    loaded = MoodClassifier.load(path)
+    assert loaded.labels == model.labels
+    assert loaded.predict(snapshot(250, 50)) == pytest.approx(model.predict(snapshot(250, 50)))
+    assert MoodClassifier.load(str(tmp_path / "missing.npz")) is None
+
+@pytest.mark.asyncio
+async def test_confident_predictions_stay_local(model):
+    remote = FakeRemote()
+    classifier = LocalFirstClassifier(model, remote, min_confidence=0.7)
+    assert await classifier(snapshot(250, 50)) == "energetic"
+    assert remote.calls == 0
+
+@pytest.mark.asyncio
+async def test_escalates_when_unsure_or_unable(model):
+    remote = FakeRemote()
+    classifier = LocalFirstClassifier(model, remote, min_confidence=1.01)
+    assert await classifier(snapshot(250, 50)) == "anxious"
+    classifier.min_confidence = 0.7
+    assert await classifier({"typingSpeed": 250}) == "anxious"
+    assert await LocalFirstClassifier(None, remote)(snapshot(250, 50)) == "anxious"
+    assert remote.calls == 3
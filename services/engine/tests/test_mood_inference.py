@@ -0,0 +1,81 @@
+import pytest
+from services.mood_inference import MoodInference, signature, drift
+
+class FakeClassifier:
+    def __init__(self, mood="calm"):
+        self.mood = mood
+        self.calls = 0
+
+    async def __call__(self, snapshot):
+        self.calls += 1
+        return self.mood
+
+@pytest.fixture
+def classifier():
+    return FakeClassifier()
+
+@pytest.fixture
+def inference(classifier):
+    return MoodInference(classifier, ttl=60, min_interval=0, drift_threshold=0.1)
+
+def test_signature_quantizes_and_ignores_timestamps():
+    assert signature({"typingSpeed": 100, "timestamp": "a"}) == signature({"typingSpeed": 102, "timestamp": "b"})
+    assert signature({"typingSpeed": 100}) != signature({"typingSpeed": 200})
+    assert signature({"activity": "walking"}) != signature({"activity": "running"})
+
+def test_drift():
+    assert drift({"typingSpeed": 100}, {"typingSpeed": 105}) == pytest.approx(5 / 105)
+    assert drift({"typingSpeed": 100}, {"typingSpeed": 100, "idleMs": 5}) == 1.0
+    assert drift({"activity": "walking"}, {"activity": "running"}) == 1.0
+    assert drift({"idleMs": 0}, {"idleMs": 0.5}) == 0.5
+
+@pytest.mark.asyncio
+async def test_small_drift_skips_inference(inference, classifier):
+    assert await inference.infer("sid1", {"typingSpeed": 100}) == "calm"
+    assert await inference.infer("sid1", {"typingSpeed": 103}) == "calm"
+    assert classifier.calls == 1
+    assert inference.skipped_drift.value >= 1
+
+@pytest.mark.asyncio
+async def test_signature_cache_shared_across_clients(inference, classifier):
+    hits = inference.cache_hits.value
+    await inference.infer("sid1", {"typingSpeed": 100})
+    await inference.infer("sid2", {"typingSpeed": 101})
+    assert classifier.calls == 1
+    assert inference.cache_hits.value == hits + 1
+    assert 0 < inference.hit_ratio() <= 1
+
+@pytest.mark.asyncio
+async def test_min_interval_rate_limits(classifier):
+    inference = MoodInference(classifier, ttl=60, min_interval=60, drift_threshold=0.1)
+    await inference.infer("sid1", {"typingSpeed": 100})
+    classifier.mood = "stressed"
+    assert await inference.infer("sid1", {"typingSpeed": 500}) == "calm"
+    assert classifier.calls == 1
+
+    # Other clients aren't limited by sid1
+    assert await inference.infer("sid2", {"typingSpeed": 500}) == "stressed"
+
+@pytest.mark.asyncio
+async def test_fallback_not_cached(inference, classifier):
+    classifier.mood = "neutral"
+    await inference.infer("sid1", {"typingSpeed": 100})
+    inference.forget("sid1")
+    await inference.infer("sid1", {"typingSpeed": 100})
+    assert classifier.calls == 2
+
+@pytest.mark.asyncio
+async def test_fallback_not_remembered_for_client(inference, classifier):
+    classifier.mood = "neutral"
+    for speed in (100, 101, 102):
+        assert await inference.infer("sid1", {"typingSpeed": speed}) == "neutral"
+    assert classifier.calls == 3
+
+    classifier.mood = "calm"
+    assert await inference.infer("sid1", {"typingSpeed": 103}) == "calm"
+    # A later failure keeps the client's last real mood, and the next event retries
+    classifier.mood = "neutral"
+    assert await inference.infer("sid1", {"typingSpeed": 500}) == "calm"
+    classifier.mood = "stressed"
+    assert await inference.infer("sid1", {"typingSpeed": 510}) == "stressed"
+    assert classifier.calls == 6
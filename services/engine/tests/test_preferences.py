@@ -3,8 +3,17 @@ import httpx
 from unittest.mock import patch, MagicMock
 from datetime import datetime
 from sqlalchemy.orm import Session
+from fakeredis import FakeAsyncRedis
 from main import app
 from models import Preference
+from routers.preferences import get_redis, get_session, feature_store
+
+@pytest.fixture(autouse=True)
+def fake_redis():
+    fake = FakeAsyncRedis(decode_responses=True)
+    app.dependency_overrides[get_redis] = lambda: fake
+    yield fake
+    app.dependency_overrides.pop(get_redis, None)
 
 @pytest.fixture
 async def client():
@@ -12,21 +21,28 @@ async def client():
         yield client
 
 @pytest.fixture
-def db_session():
-    # Create a test database session
+def db_session(tmp_path):
+    # The app's async engine and this sync session share one SQLite file
     from sqlalchemy import create_engine
     from sqlalchemy.orm import sessionmaker
-    
-    engine = create_engine('sqlite:///:memory:')
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    
-    # Create tables
+    from sqlalchemy.ext.asyncio import async_sessionmaker
     from models import Base
+    from services.database import create_engine as create_async_engine
+
+    db_path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{db_path}")
     Base.metadata.create_all(engine)
-    
+
+    factory = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}"), expire_on_commit=False)
+    async def override_session():
+        async with factory() as session:
+            yield session
+    app.dependency_overrides[get_session] = override_session
+
+    session = sessionmaker(bind=engine)()
     yield session
     session.close()
+    app.dependency_overrides.pop(get_session, None)
 
 @pytest.mark.asyncio
 async def test_get_default_preferences(db_session, client):
@@ -114,6 +130,22 @@ async def test_reset_preferences(db_session, client):
     assert data["genre_weights"] == {}
     assert data["explore_new_music"] is True
 
+@pytest.mark.asyncio
+async def test_only_default_user_sets_track_genre_weights(db_session, client):
+    feature_store.set_genre_weights({"jazz": 80})
+    body = {"energy_ceiling": 80, "genre_weights": {"rock": 70}, "explore_new_music": True}
+
+    response = await client.post("/api/preferences?user_id=test", json=body)
+    assert response.status_code == 200
+    assert feature_store.genre_weights == {"jazz": 80}
+
+    response = await client.post("/api/preferences?user_id=default", json=body)
+    assert response.status_code == 200
+    assert feature_store.genre_weights == {"rock": 70}
+
+    await client.post("/api/preferences/reset?user_id=default")
+    assert feature_store.genre_weights == {}
+
 @pytest.mark.asyncio
 async def test_db_error(db_session, client):
     with patch('sqlalchemy.orm.Session.commit') as mock_commit:
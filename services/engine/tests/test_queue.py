@@ -1,10 +1,12 @@
 import pytest
 import httpx
-from unittest.mock import patch, MagicMock
-from fakeredis import FakeRedis
+from unittest.mock import patch
+from fakeredis import FakeRedis, FakeAsyncRedis, FakeServer
 import json
+import redis
 from main import app
-from routers.queue import QueueItem
+from routers.queue import QueueItem, get_redis
+from services.queue_store import QueueStore
 
 @pytest.fixture
 async def client():
@@ -13,93 +15,200 @@ async def client():
 
 @pytest.fixture
 def fake_redis():
-    return FakeRedis()
+    # Sync view for seeding and assertions, sharing data with the async client the app uses
+    # Queue mutations are Lua scripts, which fakeredis runs through lupa
+    pytest.importorskip("lupa")
+    server = FakeServer()
+    QueueStore._migrated.clear()
+    app.dependency_overrides[get_redis] = lambda: FakeAsyncRedis(server=server, decode_responses=True)
+    yield FakeRedis(server=server, decode_responses=True)
+    app.dependency_overrides.pop(get_redis, None)
 
 @pytest.mark.asyncio
 async def test_get_queue_empty(client, fake_redis):
-    with patch('routers.queue.redis_client', fake_redis):
-        response = await client.get("/api/queue")
-        assert response.status_code == 200
-        assert response.json() == []
+    response = await client.get("/api/queue")
+    assert response.status_code == 200
+    assert response.json() == []
 
 @pytest.mark.asyncio
 async def test_add_to_queue(client, fake_redis):
-    with patch('routers.queue.redis_client', fake_redis):
-        item = {
-            "uri": "spotify:track:123",
-            "title": "Test Track",
-            "artist": "Test Artist",
-            "thumbnail": "http://example.com/thumb.jpg"
-        }
-        response = await client.post("/api/queue/add", json=item)
-        assert response.status_code == 200
-        assert response.json() == {"length": 1}
-        
-        # Verify item was added
-        stored = fake_redis.lrange("queue", 0, -1)
-        assert len(stored) == 1
-        assert json.loads(stored[0]) == item
+    item = {
+        "uri": "spotify:track:123",
+        "title": "Test Track",
+        "artist": "Test Artist",
+        "thumbnail": "http://example.com/thumb.jpg"
+    }
+    response = await client.post("/api/queue/add", json=item)
+    assert response.status_code == 200
+    assert response.json() == {"length": 1}
+
+    # Verify item was added
+    assert fake_redis.zrange("{queue}:order", 0, -1) == ["spotify:track:123"]
+    assert json.loads(fake_redis.hget("{queue}:items", "spotify:track:123")) == item
+
+    # Adding the same track again keeps a single entry
+    response = await client.post("/api/queue/add", json=item)
+    assert response.json() == {"length": 1}
 
 @pytest.mark.asyncio
 async def test_remove_from_queue(client, fake_redis):
-    with patch('routers.queue.redis_client', fake_redis):
-        # Add two items with same URI
-        item = {
-            "uri": "spotify:track:123",
-            "title": "Test Track",
-            "artist": "Test Artist",
-            "thumbnail": "http://example.com/thumb.jpg"
+    # Legacy list with the same URI twice, deduplicated on migration
+    item = {
+        "uri": "spotify:track:123",
+        "title": "Test Track",
+        "artist": "Test Artist",
+        "thumbnail": "http://example.com/thumb.jpg"
+    }
+    fake_redis.rpush("queue", json.dumps(item))
+    fake_redis.rpush("queue", json.dumps(item))
+
+    # Remove items
+    response = await client.post("/api/queue/remove", json={"uri": "spotify:track:123"})
+    assert response.status_code == 200
+    assert response.json() == {"removedCount": 1}
+
+    # Verify queue is empty
+    assert fake_redis.zcard("{queue}:order") == 0
+    assert fake_redis.hlen("{queue}:items") == 0
+    assert not fake_redis.exists("queue")
+
+@pytest.mark.asyncio
+async def test_reorder_queue(client, fake_redis):
+    # Add items
+    items = [
+        {
+            "uri": "spotify:track:1",
+            "title": "Track 1",
+            "artist": "Artist 1",
+            "thumbnail": "http://example.com/1.jpg"
+        },
+        {
+            "uri": "spotify:track:2",
+            "title": "Track 2",
+            "artist": "Artist 2",
+            "thumbnail": "http://example.com/2.jpg"
         }
+    ]
+    for item in items:
         fake_redis.rpush("queue", json.dumps(item))
-        fake_redis.rpush("queue", json.dumps(item))
-        
-        # Remove items
-        response = await client.post("/api/queue/remove", json={"uri": "spotify:track:123"})
-        assert response.status_code == 200
-        assert response.json() == {"removedCount": 2}
-        
-        # Verify queue is empty
-        assert len(fake_redis.lrange("queue", 0, -1)) == 0
+
+    # Reorder
+    response = await client.post("/api/queue/reorder", json={
+        "uris": ["spotify:track:2", "spotify:track:1"]
+    })
+    assert response.status_code == 200
+    assert response.json() == {"success": True}
+
+    # Verify new order
+    assert fake_redis.zrange("{queue}:order", 0, -1) == ["spotify:track:2", "spotify:track:1"]
 
 @pytest.mark.asyncio
-async def test_reorder_queue(client, fake_redis):
-    with patch('routers.queue.redis_client', fake_redis):
-        # Add items
-        items = [
-            {
-                "uri": "spotify:track:1",
-                "title": "Track 1",
-                "artist": "Artist 1",
-                "thumbnail": "http://example.com/1.jpg"
-            },
-            {
-                "uri": "spotify:track:2",
-                "title": "Track 2",
-                "artist": "Artist 2",
-                "thumbnail": "http://example.com/2.jpg"
-            }
-        ]
-        for item in items:
-            fake_redis.rpush("queue", json.dumps(item))
-        
-        # Reorder
-        response = await client.post("/api/queue/reorder", json={
-            "uris": ["spotify:track:2", "spotify:track:1"]
+async def test_reorder_keeps_unlisted_items(client, fake_redis):
+    for i in range(3):
+        await client.post("/api/queue/add", json={
+            "uri": f"spotify:track:{i}",
+            "title": f"Track {i}",
+            "artist": "Artist",
+            "thumbnail": f"http://example.com/{i}.jpg"
         })
-        assert response.status_code == 200
-        assert response.json() == {"success": True}
-        
-        # Verify new order
-        stored = fake_redis.lrange("queue", 0, -1)
-        assert len(stored) == 2
-        assert json.loads(stored[0])["uri"] == "spotify:track:2"
-        assert json.loads(stored[1])["uri"] == "spotify:track:1"
+
+    # A client that hasn't seen track 2 yet reorders what it knows about
+    response = await client.post("/api/queue/reorder", json={"uris": ["spotify:track:1", "spotify:track:0"]})
+    assert response.status_code == 200
+    assert fake_redis.zrange("{queue}:order", 0, -1) == ["spotify:track:1", "spotify:track:0", "spotify:track:2"]
 
 @pytest.mark.asyncio
-async def test_redis_error_handling(client):
-    with patch('routers.queue.redis_client') as mock_redis:
-        mock_redis.lrange.side_effect = Exception("Redis error")
-        
+async def test_pop_next(client, fake_redis):
+    item = {
+        "uri": "spotify:track:1",
+        "title": "Track 1",
+        "artist": "Artist 1",
+        "thumbnail": "http://example.com/1.jpg"
+    }
+    await client.post("/api/queue/add", json=item)
+
+    response = await client.post("/api/queue/next")
+    assert response.status_code == 200
+    assert response.json() == item
+    assert fake_redis.hlen("{queue}:items") == 0
+
+    response = await client.post("/api/queue/next")
+    assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_redis_error_handling(client, fake_redis):
+    with patch.object(QueueStore, "page", side_effect=redis.RedisError("Redis error")):
         response = await client.get("/api/queue")
-        assert response.status_code == 503
-        assert "Service temporarily unavailable" in response.json()["detail"] 
\ No newline at end of file
+    assert response.status_code == 503
+    assert "Service temporarily unavailable" in response.json()["detail"]
+
+@pytest.mark.asyncio
+async def test_get_queue_paged(client, fake_redis):
+    for i in range(5):
+        await client.post("/api/queue/add", json={
+            "uri": f"spotify:track:{i}",
+            "title": f"Track {i}",
+            "artist": "Artist",
+            "thumbnail": f"http://example.com/{i}.jpg"
+        })
+
+    response = await client.get("/api/queue?offset=1&limit=2")
+    assert response.status_code == 200
+    assert [item["uri"] for item in response.json()] == ["spotify:track:1", "spotify:track:2"]
+
+@pytest.mark.asyncio
+async def test_get_queue_returns_whole_queue_without_limit(client, fake_redis):
+    for i in range(150):
+        await client.post("/api/queue/add", json={
+            "uri": f"spotify:track:{i}",
+            "title": f"Track {i}",
+            "artist": "Artist",
+            "thumbnail": f"http://example.com/{i}.jpg"
+        })
+
+    response = await client.get("/api/queue")
+    assert response.status_code == 200
+    assert [item["uri"] for item in response.json()] == [f"spotify:track:{i}" for i in range(150)]
+
+    response = await client.get("/api/queue?offset=100")
+    assert len(response.json()) == 50
+
+@pytest.mark.asyncio
+async def test_move_in_queue(client, fake_redis):
+    for i in range(3):
+        await client.post("/api/queue/add", json={
+            "uri": f"spotify:track:{i}",
+            "title": f"Track {i}",
+            "artist": "Artist",
+            "thumbnail": f"http://example.com/{i}.jpg"
+        })
+
+    response = await client.post("/api/queue/move", json={"uri": "spotify:track:2", "index": 0})
+    assert response.status_code == 200
+    assert fake_redis.zrange("{queue}:order", 0, -1) == ["spotify:track:2", "spotify:track:0", "spotify:track:1"]
+
+    response = await client.post("/api/queue/move", json={"uri": "spotify:track:missing", "index": 0})
+    assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_snapshot_and_changes(client, fake_redis):
+    item = {
+        "uri": "spotify:track:1",
+        "title": "Track 1",
+        "artist": "Artist 1",
+        "thumbnail": "http://example.com/1.jpg"
+    }
+    await client.post("/api/queue/add", json=item)
+
+    response = await client.get("/api/queue/snapshot")
+    assert response.status_code == 200
+    assert response.json() == {"version": 1, "items": [item]}
+
+    response = await client.get("/api/queue/changes?since=0")
+    assert response.status_code == 200
+    assert response.json()["changes"] == [
+        {"op": "insert", "version": 1, "uri": "spotify:track:1", "index": 0, "item": item}
+    ]
+
+    response = await client.get("/api/queue/changes?since=5")
+    assert response.status_code == 410
@@ -0,0 +1,147 @@
+import pytest
+import json
+from fakeredis import FakeAsyncRedis
+from services.queue_store import QueueStore, POSITION_STEP, ITEMS_KEY, ORDER_KEY
+
+# Queue mutations are Lua scripts, which fakeredis runs through lupa
+pytest.importorskip("lupa")
+
+@pytest.fixture
+def store():
+    QueueStore._migrated.clear()
+    return QueueStore(FakeAsyncRedis(decode_responses=True))
+
+def item(i):
+    return {"uri": f"spotify:track:{i}", "title": f"Track {i}", "artist": "Artist", "thumbnail": ""}
+
+async def uris(store):
+    return [entry["uri"] for entry in await store.page()]
+
+@pytest.mark.asyncio
+async def test_add_and_page(store):
+    for i in range(5):
+        assert await store.add(item(i)) == i + 1
+    assert await store.add(item(2)) == 5
+
+    assert await uris(store) == [f"spotify:track:{i}" for i in range(5)]
+    assert [entry["uri"] for entry in await store.page(3, 10)] == ["spotify:track:3", "spotify:track:4"]
+    assert await store.page(10, 10) == []
+
+@pytest.mark.asyncio
+async def test_move_uses_midpoints(store):
+    for i in range(4):
+        await store.add(item(i))
+
+    assert await store.move("spotify:track:3", 1)
+    assert await uris(store) == ["spotify:track:0", "spotify:track:3", "spotify:track:1", "spotify:track:2"]
+    assert await store.redis.zscore(ORDER_KEY, "spotify:track:3") == POSITION_STEP / 2
+    # Only the moved item's position changed
+    assert await store.redis.zscore(ORDER_KEY, "spotify:track:1") == POSITION_STEP
+
+    assert await store.move("spotify:track:0", 99)
+    assert await uris(store) == ["spotify:track:3", "spotify:track:1", "spotify:track:2", "spotify:track:0"]
+    assert not await store.move("spotify:track:missing", 0)
+
+    assert await store.move_to_front("spotify:track:0")
+    assert await uris(store) == ["spotify:track:0", "spotify:track:3", "spotify:track:1", "spotify:track:2"]
+
+@pytest.mark.asyncio
+async def test_repeated_moves_renumber(store):
+    for i in range(3):
+        await store.add(item(i))
+
+    # Keep splitting the same gap until it has to be renumbered
+    for n in range(80):
+        moving = "spotify:track:2" if n % 2 == 0 else "spotify:track:1"
+        assert await store.move(moving, 1)
+        assert (await uris(store))[1] == moving
+    assert await store.length() == 3
+
+@pytest.mark.asyncio
+async def test_remove_and_reorder(store):
+    for i in range(4):
+        await store.add(item(i))
+
+    assert await store.remove("spotify:track:1") == 1
+    assert await store.remove("spotify:track:1") == 0
+
+    # Unlisted and unknown URIs neither drop nor add items
+    assert await store.reorder(["spotify:track:3", "spotify:track:0", "spotify:track:missing"]) == 3
+    assert await uris(store) == ["spotify:track:3", "spotify:track:0", "spotify:track:2"]
+
+@pytest.mark.asyncio
+async def test_migrate_legacy_list(store):
+    await store.redis.rpush("queue", json.dumps(item(1)), json.dumps(item(2)), json.dumps(item(1)), "not json")
+
+    assert await store.length() == 2
+    assert await uris(store) == ["spotify:track:1", "spotify:track:2"]
+    assert not await store.redis.exists("queue")
+
+@pytest.mark.asyncio
+async def test_dedupe_drops_orphans(store):
+    await store.add(item(1))
+    await store.redis.hset(ITEMS_KEY, "spotify:track:orphan", json.dumps(item("orphan")))
+    await store.redis.zadd(ORDER_KEY, {"spotify:track:ghost": 5000.0})
+    await store.redis.rpush("queue", json.dumps(item(1)), json.dumps(item(2)))
+
+    assert await store.dedupe() == 1
+    assert await uris(store) == ["spotify:track:1", "spotify:track:2"]
+    assert await store.redis.hlen(ITEMS_KEY) == 2
+
+@pytest.mark.asyncio
+async def test_pop_next(store):
+    for i in range(2):
+        await store.add(item(i))
+
+    assert (await store.pop_next())["uri"] == "spotify:track:0"
+    assert (await store.pop_next())["uri"] == "spotify:track:1"
+    assert await store.pop_next() is None
+    assert await store.redis.hlen(ITEMS_KEY) == 0
+
+@pytest.mark.asyncio
+async def test_mutations_log_versioned_changes(store):
+    await store.add(item(0))
+    await store.add(item(1))
+    await store.add(item(1))  # unchanged payload, no change recorded
+    await store.move("spotify:track:1", 0)
+    await store.reorder(["spotify:track:0"])
+    await store.remove("spotify:track:0")
+    await store.pop_next()
+
+    changes = await store.changes_since(0)
+    assert [(change["version"], change["op"]) for change in changes] == [
+        (1, "insert"), (2, "insert"), (3, "move"), (4, "reorder"), (5, "remove"), (6, "remove")
+    ]
+    assert changes[1]["index"] == 1
+    assert changes[1]["item"] == item(1)
+    assert changes[2] == {"op": "move", "version": 3, "uri": "spotify:track:1", "index": 0}
+    assert changes[3]["uris"] == ["spotify:track:0", "spotify:track:1"]
+
+    assert [change["version"] for change in await store.changes_since(4)] == [5, 6]
+    assert await store.changes_since(6) == []
+    # Ahead of the server, e.g. after Redis was flushed
+    assert await store.changes_since(7) is None
+
+@pytest.mark.asyncio
+async def test_changes_since_gap_needs_snapshot(store, monkeypatch):
+    monkeypatch.setattr("services.queue_store.LOG_SIZE", 2)
+    for i in range(4):
+        await store.add(item(i))
+
+    assert [change["version"] for change in await store.changes_since(2)] == [3, 4]
+    assert await store.changes_since(1) is None
+
+    snapshot = await store.snapshot()
+    assert snapshot["version"] == 4
+    assert [entry["uri"] for entry in snapshot["items"]] == [f"spotify:track:{i}" for i in range(4)]
+
+@pytest.mark.asyncio
+async def test_changes_are_published(store):
+    pubsub = store.redis.pubsub()
+    await pubsub.subscribe(store.channel)
+    await pubsub.get_message(timeout=1)
+
+    await store.add(item(0))
+    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
+    assert json.loads(message["data"])["op"] == "insert"
+    await pubsub.aclose()
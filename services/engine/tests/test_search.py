@@ -2,14 +2,29 @@ import pytest
 import httpx
 from unittest.mock import patch, MagicMock
 import os
+from fakeredis import FakeRedis
 from main import app
-from routers.search import search_songs
+from routers.search import search_songs, search_executor
+from services.search_cache import SearchCache
+from services.search_index import SearchIndex
 
 @pytest.fixture
 async def client():
     async with httpx.AsyncClient(app=app, base_url="http://test") as client:
         yield client
 
+@pytest.fixture(autouse=True)
+def search_cache():
+    cache = SearchCache(FakeRedis(), ttl=60)
+    with patch('routers.search.search_cache', cache), patch.object(search_executor, 'cache', cache):
+        yield cache
+
+@pytest.fixture(autouse=True)
+def search_index():
+    index = SearchIndex()
+    with patch('routers.search.search_index', index):
+        yield index
+
 @pytest.fixture
 def mock_ytmusic():
     with patch('routers.search.YTMusic') as mock:
@@ -58,6 +73,22 @@ def test_search_caching(mock_ytmusic):
     # Verify YTMusic.search was called only once
     mock_ytmusic.search.assert_called_once_with("test query", filter='songs', limit=20)
 
+def test_search_cache_shared_across_workers(mock_ytmusic, search_cache):
+    mock_ytmusic.search.return_value = [
+        {
+            "videoId": "test123",
+            "title": "Test Song",
+            "artists": [{"name": "Artist 1"}],
+            "thumbnails": []
+        }
+    ]
+    search_songs("Test Query")
+
+    # Another worker's empty local tier falls through to Redis, not YTMusic
+    search_cache.memory = type(search_cache.memory)(search_cache.memory.max_bytes, 60)
+    assert search_songs("test  query")[0]["id"] == "test123"
+    assert mock_ytmusic.search.call_count == 1
+
 @pytest.mark.asyncio
 async def test_search_endpoint(client, mock_ytmusic):
     # Mock YTMusic search response
@@ -91,4 +122,48 @@ async def test_search_error_handling(client, mock_ytmusic):
     # Call search endpoint
     response = await client.get("/api/search?q=test query")
     assert response.status_code == 502
-    assert "Search service temporarily unavailable" in response.json()["detail"] 
\ No newline at end of file
+    assert "Search service temporarily unavailable" in response.json()["detail"] 
+
+@pytest.mark.asyncio
+async def test_search_served_locally(client, mock_ytmusic, search_index):
+    search_index.add({
+        "id": "local1",
+        "title": "Local Song",
+        "artists": ["Artist 1"],
+        "thumbnail": None,
+        "uri": "youtube:video:local1"
+    })
+
+    response = await client.get("/api/search?query=local so&limit=1")
+    assert response.status_code == 200
+    assert [song["id"] for song in response.json()] == ["local1"]
+    mock_ytmusic.search.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_search_merges_local_and_remote(client, mock_ytmusic, search_index):
+    search_index.add({
+        "id": "test123",
+        "title": "Test Song",
+        "artists": ["Artist 1"],
+        "thumbnail": None,
+        "uri": "youtube:video:test123"
+    })
+    mock_ytmusic.search.return_value = [
+        {
+            "videoId": "test123",
+            "title": "Test Song",
+            "artists": [{"name": "Artist 1"}],
+            "thumbnails": []
+        },
+        {
+            "videoId": "test456",
+            "title": "Test Song 2",
+            "artists": [{"name": "Artist 2"}],
+            "thumbnails": []
+        }
+    ]
+
+    response = await client.get("/api/search?query=test&limit=5")
+    assert [song["id"] for song in response.json()] == ["test123", "test456"]
+    # Remote results are indexed for next time
+    assert len(search_index) == 2
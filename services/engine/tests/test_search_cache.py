@@ -0,0 +1,94 @@
+import pytest
+import json
+import time
+import zlib
+import redis
+from unittest.mock import MagicMock
+from fakeredis import FakeRedis, FakeServer
+from services.search_cache import SearchCache, MemoryTier, normalize_query
+
+RESULTS = [{"id": "abc", "title": "Test Song", "artists": ["Artist"], "thumbnail": None, "uri": "youtube:video:abc"}]
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+@pytest.fixture
+def cache(server):
+    return SearchCache(FakeRedis(server=server), ttl=60)
+
+def test_normalize_query():
+    assert normalize_query("  Daft   PUNK ") == "daft punk"
+    assert normalize_query("ＡＢＢＡ") == "abba"
+    assert normalize_query("Straße") == normalize_query("STRASSE")
+
+def test_memory_hit_after_set(cache):
+    assert cache.get("test", 20) is None
+    cache.set("test", 20, RESULTS)
+
+    hits = cache.memory_hits.value
+    assert cache.get("  TEST ", 20) == RESULTS
+    assert cache.memory_hits.value == hits + 1
+    # The limit is part of the key
+    assert cache.get("test", 10) is None
+
+def test_shared_tier_across_workers(server, cache):
+    cache.set("test", 20, RESULTS)
+    other_worker = SearchCache(FakeRedis(server=server), ttl=60)
+
+    hits = other_worker.redis_hits.value
+    assert other_worker.get("test", 20) == RESULTS
+    assert other_worker.redis_hits.value == hits + 1
+    # Now served locally
+    assert other_worker.get("test", 20) == RESULTS
+    assert other_worker.redis_hits.value == hits + 1
+
+def test_redis_payload_is_compressed_with_ttl(server, cache):
+    cache.set("test", 20, RESULTS)
+    client = FakeRedis(server=server)
+    key = cache._redis_key(cache.key("test", 20))
+    assert json.loads(zlib.decompress(client.get(key))) == RESULTS
+    assert 0 < client.ttl(key) <= 60
+
+def test_redis_errors_degrade_to_miss():
+    client = MagicMock()
+    client.pipeline.side_effect = redis.ConnectionError("Connection refused")
+    client.set.side_effect = redis.ConnectionError("Connection refused")
+    cache = SearchCache(client, ttl=60)
+
+    cache.set("test", 20, RESULTS)  # memory tier still filled
+    assert cache.get("test", 20) == RESULTS
+    assert cache.get("other", 20) is None
+
+def test_memory_tier_byte_budget():
+    tier = MemoryTier(max_bytes=100, ttl=60)
+    tier.set("a", "A", 40)
+    tier.set("b", "B", 40)
+    tier.get("a")
+    tier.set("c", "C", 40)
+
+    # b was least recently used
+    assert tier.get("b") is None
+    assert tier.get("a") == "A" and tier.get("c") == "C"
+    assert tier.bytes == 80
+
+    tier.set("huge", "H", 1000)
+    assert tier.get("huge") is None
+
+def test_memory_tier_expiry():
+    tier = MemoryTier(max_bytes=100, ttl=60)
+    tier.set("a", "A", 10, ttl=0.01)
+    time.sleep(0.02)
+    assert tier.get("a") is None
+    assert tier.bytes == 0
+
+def test_memory_tier_stale_window():
+    tier = MemoryTier(max_bytes=100, ttl=60, stale_ttl=60)
+    tier.set("a", "A", 10, ttl=0.01)
+    time.sleep(0.02)
+    assert tier.get("a") is None
+    assert tier.get("a", stale=True) == "A"
+
+    tier.stale_ttl = 0
+    assert tier.get("a", stale=True) is None
+    assert tier.bytes == 0
@@ -0,0 +1,100 @@
+import pytest
+import asyncio
+import threading
+import time
+from services.search_cache import SearchCache
+from services.search_executor import SearchExecutor, SearchOverloaded, SearchTimeout
+
+RESULTS = [{"id": "abc", "title": "Test Song", "artists": ["Artist"], "thumbnail": None, "uri": "youtube:video:abc"}]
+
+class FakeUpstream:
+    """Blocking search function that caches like search_songs and counts upstream calls"""
+
+    def __init__(self, cache: SearchCache):
+        self.cache = cache
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+
+    def __call__(self, query: str, limit: int):
+        self.calls += 1
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        self.cache.set(query, limit, RESULTS)
+        return RESULTS
+
+@pytest.fixture
+def cache():
+    return SearchCache(None, ttl=60)
+
+@pytest.fixture
+def upstream(cache):
+    return FakeUpstream(cache)
+
+@pytest.fixture
+def executor(upstream, cache):
+    executor = SearchExecutor(upstream, cache, max_workers=2, max_queue=1, timeout=1.0)
+    yield executor
+    upstream.release.set()
+    executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_identical_queries_share_one_call(executor, upstream):
+    upstream.release.clear()
+    searches = [asyncio.create_task(executor.search(query, 20)) for query in ("test", "Test", " test ")]
+    await asyncio.sleep(0.05)
+    assert executor.in_flight == 1
+
+    upstream.release.set()
+    assert await asyncio.gather(*searches) == [RESULTS] * 3
+    assert upstream.calls == 1
+    assert executor.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_cached_query_skips_the_pool(executor, upstream):
+    await executor.search("test", 20)
+    await executor.search("test", 20)
+    assert upstream.calls == 1
+
+@pytest.mark.asyncio
+async def test_timeout_serves_stale(executor, upstream, cache):
+    cache.memory.set(cache.key("test", 20), RESULTS, 100, ttl=0.01)
+    time.sleep(0.02)
+
+    upstream.release.clear()
+    assert await executor.search("test", 20, timeout=0.05) == RESULTS
+
+    # The upstream call carries on and refreshes the cache
+    upstream.release.set()
+    await asyncio.sleep(0.05)
+    assert cache.get_local("test", 20) == RESULTS
+
+@pytest.mark.asyncio
+async def test_timeout_without_stale(executor, upstream):
+    upstream.release.clear()
+    with pytest.raises(SearchTimeout):
+        await executor.search("test", 20, timeout=0.05)
+
+@pytest.mark.asyncio
+async def test_upstream_error_serves_stale(executor, upstream, cache):
+    cache.memory.set(cache.key("test", 20), RESULTS, 100, ttl=0.01)
+    time.sleep(0.02)
+    upstream.error = RuntimeError("YTMusic error")
+    assert await executor.search("test", 20) == RESULTS
+
+    with pytest.raises(RuntimeError):
+        await executor.search("other", 20)
+
+@pytest.mark.asyncio
+async def test_overload_rejects_distinct_queries(executor, upstream):
+    upstream.release.clear()
+    searches = [asyncio.create_task(executor.search(f"query {i}", 20)) for i in range(3)]
+    await asyncio.sleep(0.05)
+
+    with pytest.raises(SearchOverloaded):
+        await executor.search("one too many", 20)
+
+    upstream.release.set()
+    await asyncio.gather(*searches)
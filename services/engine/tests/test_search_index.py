@@ -0,0 +1,72 @@
+import pytest
+from services.search_index import SearchIndex, from_queue_item, tokenize
+
+def track(video_id, title, *artists):
+    return {
+        "id": video_id,
+        "title": title,
+        "artists": list(artists),
+        "thumbnail": None,
+        "uri": f"youtube:video:{video_id}"
+    }
+
+@pytest.fixture
+def index():
+    index = SearchIndex()
+    index.add_many([
+        track("a", "Harder, Better, Faster, Stronger", "Daft Punk"),
+        track("b", "One More Time", "Daft Punk"),
+        track("c", "Harvest Moon", "Neil Young"),
+    ])
+    return index
+
+def test_tokenize():
+    assert tokenize("Harder, Better  FASTER!") == ["harder", "better", "faster"]
+
+def test_prefix_search(index):
+    assert [t["id"] for t in index.search("daft")] == ["b", "a"]
+    assert [t["id"] for t in index.search("har")] == ["c", "a"]
+    assert [t["id"] for t in index.search("daft har")] == ["a"]
+    assert index.search("daft moon") == []
+    assert index.search("   ") == []
+
+def test_whole_words_rank_first(index):
+    index.add(track("d", "Harvest", "Someone"))
+    index.add(track("e", "Harvester", "Someone"))
+    assert [t["id"] for t in index.search("harvest")][:2] == ["d", "c"]
+
+def test_limit(index):
+    assert len(index.search("daft", limit=1)) == 1
+
+def test_readding_refreshes_tokens(index):
+    index.add(track("b", "Around the World", "Daft Punk"))
+    assert index.search("more") == []
+    assert [t["id"] for t in index.search("around")] == ["b"]
+    assert len(index) == 3
+
+def test_evicts_least_recently_seen():
+    index = SearchIndex(max_tracks=2)
+    index.add(track("a", "First", "Artist"))
+    index.add(track("b", "Second", "Artist"))
+    index.add(track("a", "First", "Artist"))
+    index.add(track("c", "Third", "Artist"))
+
+    assert [t["id"] for t in index.search("artist")] == ["c", "a"]
+    assert index.search("second") == []
+    assert "second" not in index._vocabulary
+
+def test_from_queue_item():
+    item = {"uri": "youtube:video:xyz", "title": "Song", "artist": "Band", "thumbnail": "http://example.com/t.jpg"}
+    assert from_queue_item(item) == {
+        "id": "xyz",
+        "title": "Song",
+        "artists": ["Band"],
+        "thumbnail": "http://example.com/t.jpg",
+        "uri": "youtube:video:xyz"
+    }
+
+def test_complete(index):
+    index.add(track("d", "Harvest", "Someone"))
+    assert index.complete("har") == ["harvest", "harder"]
+    assert index.complete("har", n=1) == ["harvest"]
+    assert index.complete("harvest") == []
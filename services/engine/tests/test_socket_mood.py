@@ -17,7 +17,9 @@ async def client():
 
 @pytest.fixture
 def mock_redis():
-    return fakeredis.FakeStrictRedis()
+    fake = fakeredis.FakeAsyncRedis(decode_responses=True)
+    with patch('routers.socket_router.get_redis', return_value=fake):
+        yield fake
 
 @pytest.fixture
 def mock_http_client():
@@ -1,13 +1,21 @@
 import pytest
 import httpx
-from unittest.mock import patch
-from fakeredis import FakeRedis
+from unittest.mock import patch, AsyncMock
+from fakeredis import FakeRedis, FakeAsyncRedis, FakeServer
 import json
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from main import app
+from routers.summary import get_redis, get_session
 from models import CheckIn
 
+@pytest.fixture
+def mock_redis():
+    mock = AsyncMock()
+    app.dependency_overrides[get_redis] = lambda: mock
+    yield mock
+    app.dependency_overrides.pop(get_redis, None)
+
 @pytest.fixture
 async def client():
     async with httpx.AsyncClient(app=app, base_url="http://test") as client:
@@ -15,24 +23,35 @@ async def client():
 
 @pytest.fixture
 def fake_redis():
-    return FakeRedis()
+    # Sync view for seeding and assertions, sharing data with the async client the app uses
+    server = FakeServer()
+    app.dependency_overrides[get_redis] = lambda: FakeAsyncRedis(server=server, decode_responses=True)
+    yield FakeRedis(server=server, decode_responses=True)
+    app.dependency_overrides.pop(get_redis, None)
 
 @pytest.fixture
-def db_session():
-    # Create a test database session
+def db_session(tmp_path):
+    # The app's async engine and this sync session share one SQLite file
     from sqlalchemy import create_engine
     from sqlalchemy.orm import sessionmaker
-    
-    engine = create_engine('sqlite:///:memory:')
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    
-    # Create tables
+    from sqlalchemy.ext.asyncio import async_sessionmaker
     from models import Base
+    from services.database import create_engine as create_async_engine
+
+    db_path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{db_path}")
     Base.metadata.create_all(engine)
-    
+
+    factory = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{db_path}"), expire_on_commit=False)
+    async def override_session():
+        async with factory() as session:
+            yield session
+    app.dependency_overrides[get_session] = override_session
+
+    session = sessionmaker(bind=engine)()
     yield session
     session.close()
+    app.dependency_overrides.pop(get_session, None)
 
 @pytest.mark.asyncio
 async def test_mood_distribution_empty(db_session, client):
@@ -105,53 +124,50 @@ async def test_top_moods(db_session, client):
 
 @pytest.mark.asyncio
 async def test_quick_stats(db_session, client, fake_redis):
-    with patch('routers.summary.redis_client', fake_redis):
-        # Add test data to database
-        check_ins = [
-            CheckIn(timestamp=datetime.now(), mood_id=1, reward=1.0),
-            CheckIn(timestamp=datetime.now(), mood_id=2, reward=0.5),
-            CheckIn(timestamp=datetime.now(), mood_id=3, reward=0.0)
-        ]
-        
-        for check_in in check_ins:
-            db_session.add(check_in)
-        db_session.commit()
-        
-        # Add test data to Redis
-        today = datetime.now().strftime("%Y%m%d")
-        plays = [
-            {"timestamp": int(datetime.now().timestamp() * 1000), "uri": "spotify:track:123"},
-            {"timestamp": int(datetime.now().timestamp() * 1000), "uri": "spotify:track:456"}
-        ]
-        
-        for play in plays:
-            fake_redis.rpush(f"plays:{today}", json.dumps(play))
-        
-        # Test quick stats
-        response = await client.get("/api/summary/quick-stats")
-        assert response.status_code == 200
-        results = response.json()
-        
-        assert results["totalCheckIns"] == 3
-        assert results["totalPlays"] == 2
-        assert results["avgFeedback"] == 0.75  # (1.0 + 0.5 + 0.0) / 2
+    # Add test data to database
+    check_ins = [
+        CheckIn(timestamp=datetime.now(), mood_id=1, reward=1.0),
+        CheckIn(timestamp=datetime.now(), mood_id=2, reward=0.5),
+        CheckIn(timestamp=datetime.now(), mood_id=3, reward=0.0)
+    ]
+
+    for check_in in check_ins:
+        db_session.add(check_in)
+    db_session.commit()
+
+    # Add test data to Redis
+    today = datetime.now().strftime("%Y%m%d")
+    plays = [
+        {"timestamp": int(datetime.now().timestamp() * 1000), "uri": "spotify:track:123"},
+        {"timestamp": int(datetime.now().timestamp() * 1000), "uri": "spotify:track:456"}
+    ]
+
+    for play in plays:
+        fake_redis.rpush(f"plays:{today}", json.dumps(play))
+
+    # Test quick stats
+    response = await client.get("/api/summary/quick-stats")
+    assert response.status_code == 200
+    results = response.json()
+
+    assert results["totalCheckIns"] == 3
+    assert results["totalPlays"] == 2
+    assert results["avgFeedback"] == 0.75  # (1.0 + 0.5 + 0.0) / 2
 
 @pytest.mark.asyncio
 async def test_quick_stats_empty(db_session, client, fake_redis):
-    with patch('routers.summary.redis_client', fake_redis):
-        response = await client.get("/api/summary/quick-stats")
-        assert response.status_code == 200
-        results = response.json()
-        
-        assert results["totalCheckIns"] == 0
-        assert results["totalPlays"] == 0
-        assert results["avgFeedback"] == 0.0
+    response = await client.get("/api/summary/quick-stats")
+    assert response.status_code == 200
+    results = response.json()
+
+    assert results["totalCheckIns"] == 0
+    assert results["totalPlays"] == 0
+    assert results["avgFeedback"] == 0.0
 
 @pytest.mark.asyncio
-async def test_error_handling(client):
-    with patch('routers.summary.redis_client') as mock_redis:
-        mock_redis.llen.side_effect = Exception("Redis error")
-        
-        response = await client.get("/api/summary/quick-stats")
-        assert response.status_code == 503
-        assert "Service temporarily unavailable" in response.json()["detail"] 
\ No newline at end of file
+async def test_error_handling(client, mock_redis):
+    mock_redis.llen.side_effect = Exception("Redis error")
+
+    response = await client.get("/api/summary/quick-stats")
+    assert response.status_code == 503
+    assert "Service temporarily unavailable" in response.json()["detail"] 
\ No newline at end of file
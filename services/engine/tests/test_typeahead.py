@@ -0,0 +1,102 @@
+import pytest
+import asyncio
+import threading
+from services.search_cache import SearchCache
+from services.search_executor import SearchExecutor
+from services.search_index import SearchIndex
+from services.typeahead import Typeahead
+
+def track(video_id, title, artist="Artist"):
+    return {"id": video_id, "title": title, "artists": [artist], "thumbnail": None, "uri": f"youtube:video:{video_id}"}
+
+class FakeUpstream:
+    def __init__(self, cache: SearchCache):
+        self.cache = cache
+        self.queries = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, query: str, limit: int):
+        self.queries.append(query)
+        self.release.wait(5)
+        results = [track(f"remote-{query}", f"Remote {query}")]
+        self.cache.set(query, limit, results)
+        return results
+
+@pytest.fixture
+def cache():
+    return SearchCache(None, ttl=60)
+
+@pytest.fixture
+def index():
+    return SearchIndex()
+
+@pytest.fixture
+def upstream(cache):
+    return FakeUpstream(cache)
+
+@pytest.fixture
+def typeahead(index, cache, upstream):
+    executor = SearchExecutor(upstream, cache, max_workers=4, timeout=1.0)
+    yield Typeahead(index, cache, executor, debounce=0.02, prefetch=0)
+    upstream.release.set()
+    executor.shutdown()
+
+class Emitted:
+    def __init__(self):
+        self.payloads = []
+
+    async def __call__(self, payload):
+        self.payloads.append(payload)
+
+@pytest.mark.asyncio
+async def test_answered_locally_without_upstream(typeahead, index, upstream):
+    index.add(track("a", "Harvest Moon"))
+    emitted = Emitted()
+
+    await typeahead.query("sid1", "harv", 1, emitted)
+    assert emitted.payloads == [{"query": "harv", "results": [track("a", "Harvest Moon")], "partial": False}]
+    assert upstream.queries == []
+
+@pytest.mark.asyncio
+async def test_partial_then_merged_results(typeahead, index):
+    index.add(track("a", "Harvest Moon"))
+    emitted = Emitted()
+
+    await typeahead.query("sid1", "harvest", 5, emitted)
+    assert [p["partial"] for p in emitted.payloads] == [True, False]
+    assert [t["id"] for t in emitted.payloads[0]["results"]] == ["a"]
+    assert [t["id"] for t in emitted.payloads[1]["results"]] == ["a", "remote-harvest"]
+
+@pytest.mark.asyncio
+async def test_superseded_query_is_cancelled(typeahead, upstream):
+    emitted = Emitted()
+    first = typeahead.query("sid1", "ha", 5, emitted)
+    second = typeahead.query("sid1", "harv", 5, emitted)
+
+    await asyncio.gather(first, second, return_exceptions=True)
+    assert first.cancelled()
+    # Only the latest keystroke went upstream
+    assert upstream.queries == ["harv"]
+    assert emitted.payloads[-1]["query"] == "harv"
+
+@pytest.mark.asyncio
+async def test_other_sids_are_independent(typeahead, upstream):
+    emitted = Emitted()
+    first = typeahead.query("sid1", "one", 5, emitted)
+    second = typeahead.query("sid2", "two", 5, emitted)
+    await asyncio.gather(first, second)
+    assert sorted(upstream.queries) == ["one", "two"]
+
+@pytest.mark.asyncio
+async def test_prefetches_completions(index, cache, upstream):
+    executor = SearchExecutor(upstream, cache, max_workers=4, timeout=1.0)
+    typeahead = Typeahead(index, cache, executor, debounce=0.01, prefetch=1)
+    index.add(track("a", "Harvest Moon"))
+    index.add(track("b", "Harvest Home"))
+
+    await typeahead.query("sid1", "harv", 5, Emitted())
+    await asyncio.sleep(0.1)
+    assert "harvest" in upstream.queries
+    assert cache.get_local("harvest", 5) is not None
+    executor.shutdown()